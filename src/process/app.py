@@ -3,35 +3,220 @@
 from pprint import pprint as print
 from   orm            import *
 import requests
-from   bs4            import BeautifulSoup
-from   sqlalchemy     import text, create_engine
+from   sqlalchemy     import text, create_engine, inspect, event
 from   sqlalchemy.orm import sessionmaker
+from   sqlalchemy.dialects import sqlite as sqliteDialect
 
 from   pathlib        import Path
 from   datetime       import datetime
 import pandas                          as pd
-from   dask           import dataframe as dd
 from   zipfile        import ZipFile
 import tempfile
 import json
+import hashlib
+import argparse
 import numpy                           as np
+import time
+import os
+import re
+import sqlite3
+from   bulkload       import bulkInsertFrame, PipelinedWriter, dropIndexes, createIndexes, checkForeignKeys
+import parsedcache
+import columnar
+import search
+from   parallel       import lineBlocks, orderedMap
+import instrument
+from   instrument     import stage, timedIter
+from   check          import OPL_BASE_URL, OPL_DATA_PAGE, DATA_PATH, dataDBfilepath, getLatestCommit, commitGUIDOf
+import io
+from   abc            import ABC, abstractmethod
 
-OPL_BASE_URL   : str  = 'https://openpowerlifting.gitlab.io/opl-csv'
-OPL_DATA_PAGE  : str  = f'{OPL_BASE_URL}/bulk-csv.html'
 OPL_DATA_ZIP   : str  = f'{OPL_BASE_URL}/files/openpowerlifting-latest.zip'
 
 THIS_FOLDER    : Path = Path(__file__).parent
-DATA_PATH      : Path = THIS_FOLDER.parent.parent
+# DATA_PATH & dataDBfilepath are check.py's
 dataFilePath   : Path = DATA_PATH.joinpath('latest.zip')
 csvDTypePath   : Path = THIS_FOLDER.joinpath('csv_dtype.json')
-dataDBfilepath : Path = DATA_PATH.joinpath('openpowerlifting.sqlite')
+# the --backend duckdb database
+duckDBfilepath : Path = DATA_PATH.joinpath('openpowerlifting.duckdb')
 engineURI      : str  = f"sqlite:///{str(dataDBfilepath)}"
+# each load is built here, then renamed over dataDBfilepath once it is complete
+buildDBfilepath: Path = dataDBfilepath.with_name(f'{dataDBfilepath.name}.building')
+buildEngineURI : str  = f"sqlite:///{str(buildDBfilepath)}"
+CSV_CHUNK_ROWS : int  = 250000
+DOWNLOAD_CHUNK_SIZE : int = 1024 * 1024
+
+# parsed csv cache, by commit
+CACHE_PATH             : Path = DATA_PATH.joinpath('cache')
+PARSED_CACHE_LIMIT_MB  : int  = 4096
+
+# columnar export of each load, by commit
+EXPORT_PATH            : Path = DATA_PATH.joinpath('export')
+
+# the chunked load sizes its chunks from a sample, allowing for the copies made along the way
+SAMPLE_CHUNK_ROWS        : int = 10000
+MIN_CHUNK_ROWS           : int = 10000
+CHUNK_WORKING_SET_FACTOR : int = 6
+
+# dimension -> the csv columns it is grouped by
+DIMENSION_COLUMNS : dict = {'Event'        : ['Event']
+                           ,'MeetCountry'  : ['MeetCountry']
+                           ,'Federation'   : ['Federation','ParentFederation']
+                           ,'Division'     : ['Division']
+                           ,'Equipment'    : ['Equipment']
+                           ,'SexWeight'    : ['Sex','WeightClass']
+                           ,'MeetLocation' : ['MeetCountry','MeetState','MeetTown']
+                           ,'Meet'         : ['Federation','ParentFederation','Date','MeetName','MeetCountry','MeetState','MeetTown']
+                           }
+
+# dimension -> (table, csv column -> table column, result column referencing it)
+DIMENSION_TABLES : dict = {'Event'        : (Event        , {'Event' : 'name'}                           , 'event_id')
+                          ,'MeetCountry'  : (MeetCountry  , {'MeetCountry' : 'name'}                     , None)
+                          ,'Federation'   : (Federation   , {'Federation' : 'name'}                      , 'federation_id')
+                          ,'Division'     : (Division     , {'Division' : 'name'}                        , 'division_id')
+                          ,'Equipment'    : (Equipment    , {'Equipment' : 'name'}                       , 'equipment_id')
+                          ,'SexWeight'    : (SexWeight    , {'Sex' : 'sex', 'WeightClass' : 'weight_class'} , 'weightclass_id')
+                          ,'MeetLocation' : (MeetLocation , {'MeetState' : 'state', 'MeetTown' : 'town'} , None)
+                          ,'Meet'         : (Meet         , {'Date' : 'date', 'MeetName' : 'name'}       , 'meet_id')
+                          }
+
+# dimension -> its columns referencing other dimensions (Federation's parent_id, being self referencing, is done separately)
+DIMENSION_PARENTS : dict = {'MeetLocation' : {'country_id'    : 'MeetCountry'}
+                           ,'Meet'         : {'federation_id' : 'Federation'
+                                             ,'location_id'   : 'MeetLocation'
+                                             }
+                           }
+
+# csv column -> result column
+RESULT_COLUMNS : dict = {"Name": "name"
+                        ,"Age": "age"
+                        ,"AgeClass": "age_class"
+                        ,"BirthYearClass": "birth_year_class"
+                        ,"Bodyweight": "body_weight"
+                        ,"Squat1": "squat_1"
+                        ,"Squat2": "squat_2"
+                        ,"Squat3": "squat_3"
+                        ,"Squat4": "squat_4"
+                        ,"Best3Squat": "squat_best_3"
+                        ,"Bench1": "bench_1"
+                        ,"Bench2": "bench_2"
+                        ,"Bench3": "bench_3"
+                        ,"Bench4": "bench_4"
+                        ,"Best3Bench": "bench_best_3"
+                        ,"Deadlift1": "deadlift_1"
+                        ,"Deadlift2": "deadlift_2"
+                        ,"Deadlift3": "deadlift_3"
+                        ,"Deadlift4": "deadlift_4"
+                        ,"Best3Deadlift": "deadlift_best_3"
+                        ,"Total": "total"
+                        ,"Place": "place"
+                        ,"Dots": "dots"
+                        ,"Wilks": "wilks"
+                        ,"Glossbrenner": "glossbrenner"
+                        ,"Goodlift": "goodlift"
+                        ,"Tested": "tested"
+                        ,"Country": "country"
+                        ,"State": "state"
+                        ,"Date": "date"
+                        }
+
+# the result columns which are dimension ids
+RESULT_ID_COLUMNS : list = [idName for table, colMappings, idName in DIMENSION_TABLES.values() if idName]
+
+# the lifts personal_best is kept for, and the result column of each
+PERSONAL_BEST_LIFTS : dict = {'squat'    : 'squat_best_3'
+                             ,'bench'    : 'bench_best_3'
+                             ,'deadlift' : 'deadlift_best_3'
+                             ,'total'    : 'total'
+                             ,'dots'     : 'dots'
+                             }
+# what category_rank ranks within
+RANK_CATEGORY       : list = ['weightclass_id', 'equipment_id', 'federation_id', 'event_id']
+# the rollups, in the order they can be emptied
+ROLLUP_TABLES       : list = [CategoryRank, PersonalBest, Lifter]
+
+# what a full load can be written to, see OutputBackend
+BACKENDS       : list = ['sqlite', 'duckdb']
+DUCKDB_TYPES   : dict = {Integer  : 'BIGINT'
+                        ,Float    : 'DOUBLE'
+                        ,String   : 'VARCHAR'
+                        ,Text     : 'VARCHAR'
+                        ,Date     : 'DATE'
+                        ,DateTime : 'TIMESTAMP'
+                        }
+
+# a meet, as far as the incremental load is concerned, and what its digest covers
+MEET_KEY       : list = ['meet_id']
+DIGEST_COLUMNS : list = list(RESULT_COLUMNS.keys()) + RESULT_ID_COLUMNS
+
+# sqlite pragmas applied to every connection, by profile
+#   default : rollback journal with full durability. The load never writes to the live file (see swapInSnapshot)
+#             so readers aren't contended, and WAL's -wal/-shm files follow the path rather than the file,
+#             which makes renaming a new snapshot over a WAL database unsafe
+#   load    : bulk loading, nothing is journalled or synced as a failed load is simply redone
+SQLITE_PRAGMAS : dict = {'default' : {'journal_mode' : 'DELETE'
+                                     ,'synchronous'  : 'FULL'
+                                     }
+                        ,'load'    : {'journal_mode' : 'OFF'
+                                     ,'synchronous'  : 'OFF'
+                                     ,'cache_size'   : -256 * 1024 # KiB, so 256MB
+                                     ,'temp_store'   : 'MEMORY'
+                                     ,'mmap_size'    : 1024 * 1024 * 1024
+                                     ,'foreign_keys' : 'OFF'
+                                     }
+                        }
+
+class LoadOptions ():
+    """
+        How loadTheLatestData goes about the load
+    """
+    def __init__ (self
+                 ,streamZip     : bool = True
+                 ,memoryLimitMB : int  = None
+                 ,writer        : str  = 'pipeline'
+                 ,useCache      : bool = True
+                 ,cacheLimitMB  : int  = PARSED_CACHE_LIMIT_MB
+                 ,workers       : int  = 1
+                 ,incremental   : bool = False
+                 ,checkIncremental : bool = False
+                 ,vacuum        : bool = False
+                 ,pageSize      : int  = None
+                 ,materialize   : bool = False
+                 ,rollups       : bool = True
+                 ,compact       : bool = False
+                 ,export        : bool = False
+                 ,backend       : str  = 'sqlite'
+                 ):
+        self.streamZip     = streamZip      # stream the csv out of the zip, rather than extract it for dask
+        self.memoryLimitMB = memoryLimitMB  # load in chunks sized for this, rather than all in one go
+        self.writer        = writer         # 'pipeline' (writer thread), 'bulk' (raw executemany) or 'orm' (bulk_insert_mappings)
+        self.useCache      = useCache       # read/fill the parsed csv cache
+        self.cacheLimitMB  = cacheLimitMB   # size the parsed csv cache is evicted down to
+        self.workers       = workers        # parse & transform in this many processes
+        self.incremental   = incremental    # only apply the meets which changed since the previous load
+        self.checkIncremental = checkIncremental # compare an incremental load with a full one before it goes live
+        self.vacuum        = vacuum         # VACUUM the new database before it goes live
+        self.pageSize      = pageSize       # rebuild the new database with this page size (implies vacuum)
+        self.materialize   = materialize    # also copy v_results into the results_flat table
+        self.rollups       = rollups        # compute the lifter, personal_best and category_rank rollups
+        self.compact       = compact        # categoricals & narrower floats in memory, see compactTypes
+        self.export        = export         # also write the load as parquet to EXPORT_PATH, see columnar
+        self.backend       = backend        # 'sqlite' (dataDBfilepath) or 'duckdb' (duckDBfilepath), see OutputBackend
 
 class DB ():
-    def __init__ (self, engineURI : str = engineURI):
+    def __init__ (self, engineURI : str = engineURI, profile : str = 'default'):
         self.engine   = create_engine(engineURI, future=True, echo = ECHO)
         self.Session  = sessionmaker()
         self.Session.configure(bind=self.engine)
+        if self.engine.dialect.name == 'sqlite':
+            pragmas = SQLITE_PRAGMAS[profile]
+
+            @event.listens_for(self.engine, "connect")
+            def setPragmas(dbapi_connection, connection_record):
+                cursor = dbapi_connection.cursor()
+                for pragma, value in pragmas.items():
+                    cursor.execute(f'PRAGMA {pragma} = {value}')
+                cursor.close()
     def connect (self):
         return self.engine.connect()
     def dispose (self):
@@ -40,48 +225,143 @@ class DB ():
         except:
             ...
 
-def getLatestCommit():
-    with requests.get(OPL_DATA_PAGE) as req:
-        req.raise_for_status()
-        soup = BeautifulSoup(req.content,"html.parser")
-
-    links = [a['href'] for a in soup.select('a[href*="/commits/"]')]
+def upgradeCommitTable(engine):
+    """
+        Adds any dataCommit columns missing from a database created by an older version
+    """
+    existing = {c['name'] for c in inspect(engine).get_columns(dataCommit.__tablename__)}
+    missing  = [c for c in dataCommit.__table__.columns if c.name not in existing]
+    if not missing:
+        return
+    with (engine.connect() as conn
+         ,conn.begin()
+         ):
+        for c in missing:
+            colType = c.type.compile(dialect = engine.dialect)
+            conn.execute (text(f'ALTER TABLE {dataCommit.__tablename__} ADD COLUMN {c.name} {colType}'))
 
-    if not links or len(links) > 1:
-        raise Exception (f"Unable to determine latest commit from \'{OPL_DATA_PAGE}\'")
+def fileChecksum(filename, blockSize : int = 1024 * 1024):
+    """
+        sha256 of the file contents
+    """
+    h = hashlib.sha256()
+    with open(filename, 'rb') as f:
+        for block in iter(lambda: f.read(blockSize), b''):
+            h.update(block)
+    return h.hexdigest()
 
-    return links[0]
+def contentRange(header : str):
+    """
+        (first byte, last byte, total or None) of a Content-Range header, None if it isn't one
+    """
+    match = re.fullmatch(r'bytes (\d+)-(\d+)/(\d+|\*)', (header or '').strip())
+    if not match:
+        return None
+    return (int(match[1]), int(match[2]), None if match[3] == '*' else int(match[3]))
 
-def download_file(url, filename):
+def download_file(url, filename, etag : str = None, lastModified : str = None, chunkSize : int = DOWNLOAD_CHUNK_SIZE):
     """
     Download the file and save to disk
+
+    etag/lastModified are those of the copy of filename we already have, the request is conditional on them
+    and nothing is transferred if it hasn't changed.
+    The download goes to a .part file, an interrupted one is resumed with a Range request
+    A .part the server won't resume (416, e.g. it was complete, or a Content-Range which doesn't follow on from it)
+    is discarded and the download starts again
+
+    Returns a dict of size, etag, lastModified, sha256 and whether anything was downloaded
     """
-    filename.unlink(missing_ok=True)
+    partFile       = filename.with_name(f'{filename.name}.part')
+    validatorsFile = filename.with_name(f'{filename.name}.part.json')
+
+    headers = {}
+    if filename.is_file():
+        if etag:
+            headers['If-None-Match'] = etag
+        if lastModified:
+            headers['If-Modified-Since'] = lastModified
+
+    resumeFrom = 0
+    if partFile.is_file() and validatorsFile.is_file():
+        partValidators = json.loads(validatorsFile.read_text())
+        ifRange = partValidators.get('etag') or partValidators.get('lastModified')
+        if ifRange:
+            resumeFrom = partFile.stat().st_size
+            headers['Range']    = f'bytes={resumeFrom}-'
+            headers['If-Range'] = ifRange
 
-    with requests.get(url, stream=True) as r:
+    with requests.get(url, stream=True, headers=headers) as r:
+        if resumeFrom and (r.status_code == 416 or (r.status_code == 206 and not (contentRange(r.headers.get('Content-Range')) or (None,))[0] == resumeFrom)):
+            print (f"{datetime.now()} : Can't resume from {resumeFrom} bytes ({r.status_code} {r.headers.get('Content-Range', '')}), downloading again")
+            partFile.unlink(missing_ok=True)
+            validatorsFile.unlink(missing_ok=True)
+            return download_file(url, filename, etag, lastModified, chunkSize)
+        if r.status_code == 304:
+            return {'downloaded'   : False
+                   ,'size'         : filename.stat().st_size
+                   ,'etag'         : r.headers.get('ETag', etag)
+                   ,'lastModified' : r.headers.get('Last-Modified', lastModified)
+                   ,'sha256'       : fileChecksum(filename)
+                   }
         r.raise_for_status()
-        size = 0
-        with open(filename, 'wb') as f:
-            for chunk in r.iter_content(chunk_size=8192):
-                # If you have chunk encoded response uncomment if
-                # and set chunk_size parameter to None.
-                #if chunk:
+
+        h = hashlib.sha256()
+        if resumeFrom and r.status_code == 206:
+            with open(partFile, 'rb') as f:
+                for block in iter(lambda: f.read(chunkSize), b''):
+                    h.update(block)
+            mode = 'ab'
+            size = resumeFrom
+            print (f"{datetime.now()} : Resuming download from {resumeFrom} bytes")
+        else:
+            # a fresh download, or the file changed since the partial one
+            mode = 'wb'
+            size = 0
+            validatorsFile.write_text(json.dumps({'etag' : r.headers.get('ETag'), 'lastModified' : r.headers.get('Last-Modified')}))
+
+        with open(partFile, mode) as f:
+            for chunk in r.iter_content(chunk_size=chunkSize):
                 size += len(chunk)
+                h.update(chunk)
                 f.write(chunk)
-    return size
 
-def getTheLatestData():
+        if r.status_code == 206:
+            expected = contentRange(r.headers.get('Content-Range'))[2]
+            if expected is not None and not expected == size:
+                # the pieces don't add up to the file, resuming again won't help
+                partFile.unlink(missing_ok=True)
+                validatorsFile.unlink(missing_ok=True)
+                raise Exception (f"Downloaded {size} bytes of {url}, expected {expected}")
+        else:
+            expected = r.headers.get('Content-Length')
+            if expected and expected.isdigit() and not int(expected) == size and not r.headers.get('Content-Encoding'):
+                raise Exception (f"Downloaded {size} bytes of {url}, expected {expected}")
+
+        got = {'downloaded'   : True
+              ,'size'         : size
+              ,'etag'         : r.headers.get('ETag')
+              ,'lastModified' : r.headers.get('Last-Modified')
+              ,'sha256'       : h.hexdigest()
+              }
+
+    os.replace(partFile, filename)
+    validatorsFile.unlink(missing_ok=True)
+    return got
+
+def getTheLatestData(chunkSize : int = DOWNLOAD_CHUNK_SIZE):
     """
         This works out if we've got the latest commit from the OpenPowerLifting data page
     """
 
-    latestURL = getLatestCommit()
-    commitGUID = latestURL.split('/')[-1]
+    with stage('commit check'):
+        latestURL = getLatestCommit()
+    commitGUID = commitGUIDOf(latestURL)
     now = datetime.now()
 
     try:
         db = DB ()
         CommitBase.metadata.create_all(db.engine)
+        upgradeCommitTable(db.engine)
 
         with db.Session() as session:
 
@@ -101,8 +381,28 @@ def getTheLatestData():
                 doDownload = not (thisCommit.fileSize > 0 and thisCommit.fileSize == dataFilePath.stat().st_size)
 
             if doDownload:
-                thisCommit.fileSize   = download_file (OPL_DATA_ZIP, dataFilePath)
-                thisCommit.downloaded = now
+                # the validators of whichever commit the zip on disk came from
+                previous = session.query(dataCommit).filter(dataCommit.fileHash.isnot(None)).order_by(dataCommit.downloaded.desc()).first()
+                if previous and dataFilePath.is_file() and previous.fileSize == dataFilePath.stat().st_size:
+                    etag, lastModified = previous.etag, previous.lastModified
+                else:
+                    etag, lastModified = None, None
+
+                with stage('download'):
+                    got = download_file (OPL_DATA_ZIP, dataFilePath, etag, lastModified, chunkSize)
+                thisCommit.fileSize     = got['size']
+                thisCommit.etag         = got['etag']
+                thisCommit.lastModified = got['lastModified']
+                thisCommit.fileHash     = got['sha256']
+                thisCommit.downloaded   = now if got['downloaded'] else previous.downloaded
+                if not got['downloaded']:
+                    print (f"{datetime.now()} : {OPL_DATA_ZIP} not modified, keeping {dataFilePath}")
+
+                if not thisCommit.checksum == thisCommit.fileHash:
+                    # a new file means whatever we loaded before no longer counts
+                    thisCommit.loaded   = None
+                    thisCommit.rowCount = None
+                    thisCommit.checksum = None
 
             session.commit()
 
@@ -114,38 +414,116 @@ def getTheLatestData():
 
     return thisGUID
 
-def convertInt(x):
+def isLoaded(commitGUID):
+    """
+        True if this commit has already been fully loaded from the zip we have on disk
+    """
     try:
-        return abs(int(x))
-    except ValueError:
-        return np.nan
-def convertFloat(x):
+        db = DB ()
+        with db.Session() as session:
+            thisCommit = session.query(dataCommit).filter_by(commitGUID=commitGUID).one_or_none()
+            if not thisCommit or not thisCommit.loaded or thisCommit.rowCount is None or not thisCommit.checksum:
+                return False
+            if not dataFilePath.is_file() or not thisCommit.checksum == fileChecksum(dataFilePath):
+                return False
+            try:
+                rowCount = session.execute(text(f'SELECT COUNT(*) FROM {Result.__tablename__}')).scalar()
+            except Exception:
+                return False
+            return rowCount == thisCommit.rowCount
+    finally:
+        if db:
+            db.dispose()
+
+def markLoaded(commitGUID, engineURI : str = engineURI):
+    """
+        Records that the load of this commit finished, along with the row count and the zip checksum
+    """
     try:
-        return abs(float(x))
-    except ValueError:
-        return float(np.nan)
+        db = DB (engineURI)
+        with db.Session() as session:
+            thisCommit = session.query(dataCommit).filter_by(commitGUID=commitGUID).one()
+            thisCommit.rowCount = session.execute(text(f'SELECT COUNT(*) FROM {Result.__tablename__}')).scalar()
+            thisCommit.checksum = fileChecksum(dataFilePath)
+            thisCommit.loaded   = datetime.now()
+            session.commit()
+    finally:
+        if db:
+            db.dispose()
 
-def loadTheLatestData(commitGUID):
+def coerceNumeric(df, floatCols : list = [], intCols : list = []):
     """
-        This loads the data from the local zip file
+        Vectorized numeric parsing of columns read as str : abs() of the value, NaN where it isn't a valid number
+    """
+    for c in floatCols:
+        df[c] = pd.to_numeric(df[c], errors = 'coerce').astype(np.float64).abs()
+    for c in intCols:
+        # int() rejects anything with a decimal point or exponent, so mask those out before parsing
+        isInt = df[c].astype(str).str.fullmatch(r'\s*[+-]?\d+\s*')
+        df[c] = pd.to_numeric(df[c].where(isInt), errors = 'coerce').astype(np.float64).abs()
+    return df
+
+def narrowFloats(df, cols : list):
+    """
+        float32 for the columns where every value survives the round trip to float32 and back, the rest stay float64
+    """
+    for c in cols:
+        if df[c].dtype == np.float64:
+            narrowed = df[c].astype(np.float32)
+            if ((narrowed.astype(np.float64) == df[c]) | df[c].isna()).all():
+                df[c] = narrowed
+    return df
+
+def compactTypes(df, dtypes : dict, numericCols : list):
+    """
+        The compact typing of a frame : the csv_dtype.json category columns as categoricals, and narrowFloats
+        Values are unchanged, only how they are held
+    """
+    for c, dtype in dtypes.items():
+        if dtype == 'category' and not isinstance(df[c].dtype, pd.CategoricalDtype):
+            df[c] = df[c].astype('category')
+    return narrowFloats(df, numericCols)
+
+def plainTypes(df):
+    """
+        The frame with any categoricals as plain object columns, where a NaN has to match a NaN (groupby, MultiIndex)
+        The values are shared with the categories, so it is a column of references rather than of new strings
     """
+    categoricals = [c for c in df.columns if isinstance(df[c].dtype, pd.CategoricalDtype)]
+    if not categoricals:
+        return df
+    return df.astype({c : object for c in categoricals})
+
+def fillMissing(column, value):
+    if isinstance(column.dtype, pd.CategoricalDtype) and not value in column.cat.categories:
+        column = column.cat.add_categories(value)
+    return column.fillna(value)
 
+def csvReadArgs(compact : bool = False):
+    """
+        Works out the read_csv arguments from csv_dtype.json
+        The category columns are read as categoricals when compact, otherwise as str
+        Returns (dtypes, parse_dates, floatCols, intCols)
+    """
     dtypes = json.loads(csvDTypePath.read_text())
 
     parse_dates = []
-    converters  = {}
+    floatCols   = []
+    intCols     = []
 
     for dt in dtypes.keys():
         oldVal = dtypes[dt]
         newVal = oldVal
         if oldVal == 'str':
             newVal = str
+        elif oldVal == 'category':
+            newVal = 'category' if compact else str
         elif oldVal == 'np.float64':
-            newVal = None
-            converters[dt] = convertFloat
+            newVal = str
+            floatCols.append(dt)
         elif oldVal == 'np.int32':
-            newVal = None
-            converters[dt] = convertInt
+            newVal = str
+            intCols.append(dt)
         elif oldVal == 'date':
             newVal = str
             parse_dates.append(dt)
@@ -156,246 +534,1296 @@ def loadTheLatestData(commitGUID):
 
     dtypes = {key: val for key, val in dtypes.items() if val}
 
-    # Recreate the data objects
-    try:
-        db = DB ()
-        for b in [Base,LoadBase]:
-            b.metadata.drop_all(db.engine)
-            b.metadata.create_all(db.engine)
-    finally:
-        db.dispose()
+    return (dtypes, parse_dates, floatCols, intCols)
 
-    print (f"{datetime.now()} : Reading zip")
-    with ZipFile(dataFilePath, mode="r") as archive:
-        csvFiles = [f for f in archive.namelist() if f[-4:].lower() == '.csv']
-        if not csvFiles or not len(csvFiles) == 1:
-            raise Exception (f"Invalid number of csv files in {str(dataFilePath)}")
-        tmpDir = tempfile.mkdtemp(suffix=None, prefix=None, dir=None)
-        tmpFile = archive.extract(csvFiles[0], path=tmpDir)
+def csvMemberName(archive):
+    """
+        The name of the (single) csv file within the zip
+    """
+    csvFiles = [f for f in archive.namelist() if f[-4:].lower() == '.csv']
+    if not csvFiles or not len(csvFiles) == 1:
+        raise Exception (f"Invalid number of csv files in {str(archive.filename)}")
+    return csvFiles[0]
+
+def readZipChunks(chunkRows : int = CSV_CHUNK_ROWS, zipPath : Path = dataFilePath, compact : bool = False):
+    """
+        Decompresses the csv out of the zip as it is parsed, yielding typed pd.DataFrame chunks
+        Nothing is written to disk
+    """
+    dtypes, parse_dates, floatCols, intCols = csvReadArgs(compact)
+    with (ZipFile(zipPath, mode="r") as archive
+         ,archive.open(csvMemberName(archive), mode="r") as stream
+         ):
+        reader = pd.read_csv (stream
+                             ,chunksize   = chunkRows
+                             ,dtype       = dtypes
+                             ,parse_dates = parse_dates
+                             )
+        # decompression happens as the csv is read, so is part of the parse here
+        for chunk in timedIter('parse', reader):
+            with stage('type coercion') as thisStage:
+                chunk = coerceNumeric(chunk, floatCols = floatCols, intCols = intCols)
+                if compact:
+                    chunk = narrowFloats(chunk, floatCols + intCols)
+                thisStage.rows += len(chunk)
+            yield chunk
+
+def readZipExtracted(zipPath : Path = dataFilePath, compact : bool = False):
+    """
+        Fallback : extracts the csv to a temporary directory and reads it with dask
+        The temporary directory is always removed, even if the read fails
+        dask reads the plain typing, a compact frame is compacted once computed
+    """
+    # dask is only needed here, so it isn't imported unless this fallback is used
+    from dask import dataframe as dd
+    dtypes, parse_dates, floatCols, intCols = csvReadArgs()
+    with (ZipFile(zipPath, mode="r") as archive
+         ,tempfile.TemporaryDirectory(prefix = 'opl_') as tmpDir
+         ):
+        with stage('unzip'):
+            tmpFile = archive.extract(csvMemberName(archive), path=tmpDir)
         df = dd.read_csv (tmpFile
                          ,blocksize   = "512M"
                          ,dtype       = dtypes
                          ,parse_dates = parse_dates
-                         ,converters  = converters
                          )
+        df = df.map_partitions (coerceNumeric, floatCols = floatCols, intCols = intCols)
+        # Convert back to a pandas df, this has to happen before the temp file goes away
+        print (f"{datetime.now()} : Pre-Convert  to pd.DataFrame ")
+        # dask is lazy, so this is the parse and the type coercion
+        with stage('parse') as thisStage:
+            df = df.compute()
+            thisStage.rows += len(df)
+        print (f"{datetime.now()} : Post-Convert to pd.DataFrame ")
+    if compact:
+        with stage('type coercion'):
+            df = compactTypes(df, csvReadArgs(compact)[0], floatCols + intCols)
+    return df
 
-    # Convert back to a pandas df
-    print (f"{datetime.now()} : Pre-Convert  to pd.DataFrame ")
-    df = df.compute()
-    print (f"{datetime.now()} : Post-Convert to pd.DataFrame ")
-
-    colsKg = {k : k[0:-2] for k in list(df) if k[-2:].lower() == 'kg'}
-    if colsKg:
-        df = df.rename (columns = colsKg)
-
-    unspecifieds     = ['MeetCountry','Event','MeetState','MeetTown','MeetName','Division','Equipment','Federation']
-    df[unspecifieds] = df[unspecifieds].fillna('Unspecified')
-    df['Sex']        = df['Sex'].fillna('?')
-
-    def groupByDF(cols):
-        if isinstance(cols,str):
-            cols = [cols]
-        # return df.groupby(cols).size().reset_index(name='cnt')
-        return df.groupby(cols).size().reset_index(name = 'resultCnt')
-
-    def createData (ObjectNameDestination
-                   ,dataObject
-                   ,session
-                   ,colMappings : dict = {}
-                   ,commit      : bool = False
-                   ):
-
-        echo = len(dataObject) > 10000
-
-        if colMappings and len(colMappings) > 0:
-            dataObject = dataObject.rename (columns = colMappings)
-
-        if echo:
-            print (f"{datetime.now()} : Pre dict    : {ObjectNameDestination} : {len(dataObject)}")
-        asDict = dataObject.to_dict(orient="records")
-        if echo:
-            print (f"{datetime.now()} : Post dict   : {ObjectNameDestination} : {len(dataObject)}")
-
-        if echo:
-            print (f"{datetime.now()} : Pre Insert  : {ObjectNameDestination} : {len(dataObject)}")
-        session.bulk_insert_mappings(ObjectNameDestination, asDict)
-        if echo:
-            print (f"{datetime.now()} : Post Insert : {ObjectNameDestination} : {len(dataObject)}")
-        if commit:
-            session.commit()
-        return dataObject
-
-    def createGroupedByData(ObjectNameDestination, cols ,session, colMappings : dict = {}, commit : bool = False):
-        return createData (ObjectNameDestination = ObjectNameDestination
-                          ,dataObject            = groupByDF (cols)
-                          ,session               = session
-                          ,commit                = commit
-                          ,colMappings           = colMappings
+def parsedCacheKey(commitGUID, zipPath : Path = dataFilePath):
+    """
+        The commit, the zip it was parsed from and the typing it was parsed with
+        The zip's hash as well, as a commit re-downloaded as a different file (see getTheLatestData) is a new load
+    """
+    return f'{commitGUID}-{fileChecksum(zipPath)[:12]}-{hashlib.sha256(csvDTypePath.read_bytes()).hexdigest()[:12]}'
+
+def readChunks(commitGUID, options : LoadOptions, chunkRows : int = CSV_CHUNK_ROWS):
+    """
+        Typed pd.DataFrame chunks of this commit's csv
+        From the parsed cache if it has it, otherwise from the zip, filling the cache as it goes
+    """
+    if not options.useCache or not parsedcache.available():
+        yield from readZipChunks(chunkRows, compact = options.compact)
+        return
+
+    path = parsedcache.cachePath(CACHE_PATH, parsedCacheKey(commitGUID))
+    if path.is_file():
+        print (f"{datetime.now()} : Reading parsed cache {path}")
+        chunks = timedIter('cache read', parsedcache.readCached(path, chunkRows))
+        if options.compact:
+            # the cache holds the plain typing, whichever typing filled it
+            dtypes, parse_dates, floatCols, intCols = csvReadArgs(options.compact)
+            chunks = (compactTypes(chunk, dtypes, floatCols + intCols) for chunk in chunks)
+        yield from chunks
+        return
+
+    yield from cacheThrough(readZipChunks(chunkRows, compact = options.compact), path, options)
+
+def cacheThrough(chunks, path : Path, options : LoadOptions):
+    """
+        Passes the freshly parsed chunks on, filling the parsed cache entry path with them,
+        then evicts the least recently used entries beyond the cache limit
+    """
+    yield from timedIter('cache write', parsedcache.writeThrough(chunks, path, parsedcache.arrowSchema(*csvReadArgs())))
+    for removed in parsedcache.evict(CACHE_PATH, options.cacheLimitMB * 1024 * 1024, keep = path):
+        print (f"{datetime.now()} : Evicted {removed} from the parsed cache")
+
+def readFrame(commitGUID, options : LoadOptions):
+    """
+        The whole of readChunks as one pd.DataFrame
+        Chunks are categorized separately, so their categoricals are given the same categories first, otherwise concat falls back to object
+    """
+    chunks = list(readChunks(commitGUID, options))
+    for c in [c for c in chunks[0].columns if isinstance(chunks[0][c].dtype, pd.CategoricalDtype)]:
+        categories = pd.api.types.union_categoricals([chunk[c] for chunk in chunks]).categories
+        for chunk in chunks:
+            chunk[c] = chunk[c].cat.set_categories(categories)
+    df = pd.concat (chunks, ignore_index = True)
+    del chunks
+    return df
+
+def readExtracted(commitGUID, options : LoadOptions):
+    """
+        The --extract read of the whole csv : from the parsed cache if it has this commit (as readFrame),
+        otherwise with readZipExtracted, filling the cache
+    """
+    if not options.useCache or not parsedcache.available():
+        return readZipExtracted(compact = options.compact)
+    path = parsedcache.cachePath(CACHE_PATH, parsedCacheKey(commitGUID))
+    if path.is_file():
+        return readFrame(commitGUID, options)
+    [df] = list(cacheThrough([readZipExtracted(compact = options.compact)], path, options))
+    return df
+
+def prepareFrame(df):
+    """
+        Tidies up a freshly read frame (or chunk) : drops the Kg suffixes and fills in the missing dimension values
+    """
+    with stage('prepare') as thisStage:
+        colsKg = {k : k[0:-2] for k in list(df) if k[-2:].lower() == 'kg'}
+        if colsKg:
+            df = df.rename (columns = colsKg)
+
+        unspecifieds     = ['MeetCountry','Event','MeetState','MeetTown','MeetName','Division','Equipment','Federation']
+        for c in unspecifieds:
+            df[c] = fillMissing(df[c], 'Unspecified')
+        df['Sex']        = fillMissing(df['Sex'], '?')
+        thisStage.rows  += len(df)
+    return df
+
+def groupByDF(df, cols):
+    if isinstance(cols,str):
+        cols = [cols]
+    # return df.groupby(cols).size().reset_index(name='cnt')
+    # dropna = False, otherwise rows with a missing value (e.g. no ParentFederation) have no dimension to point at
+    # and on plainTypes, as a categorical groupby drops them regardless
+    return plainTypes(df[cols]).groupby(cols, dropna = False).size().reset_index(name = 'resultCnt')
+
+def dimensionCounts(df):
+    """
+        The grouped-by counts of each dimension within this frame
+    """
+    with stage('dimension build') as thisStage:
+        thisStage.rows += len(df)
+        return {dim : groupByDF(df, cols) for dim, cols in DIMENSION_COLUMNS.items()}
+
+def combineCounts(countsList):
+    """
+        Adds up the dimensionCounts of several chunks
+    """
+    combined = {}
+    for counts in countsList:
+        for dim, thisCount in counts.items():
+            if dim in combined:
+                thisCount = pd.concat ([combined[dim], thisCount], ignore_index = True)
+            combined[dim] = thisCount.groupby(DIMENSION_COLUMNS[dim], as_index = False, dropna = False)['resultCnt'].sum()
+    return combined
+
+def createData (ObjectNameDestination
+               ,dataObject
+               ,session
+               ,colMappings : dict = {}
+               ,commit      : bool = False
+               ):
+
+    echo = len(dataObject) > 10000
+
+    if colMappings and len(colMappings) > 0:
+        dataObject = dataObject.rename (columns = colMappings)
+
+    if echo:
+        print (f"{datetime.now()} : Pre dict    : {ObjectNameDestination} : {len(dataObject)}")
+    asDict = dataObject.to_dict(orient="records")
+    if echo:
+        print (f"{datetime.now()} : Post dict   : {ObjectNameDestination} : {len(dataObject)}")
+
+    if echo:
+        print (f"{datetime.now()} : Pre Insert  : {ObjectNameDestination} : {len(dataObject)}")
+    session.bulk_insert_mappings(ObjectNameDestination, asDict)
+    if echo:
+        print (f"{datetime.now()} : Post Insert : {ObjectNameDestination} : {len(dataObject)}")
+    if commit:
+        session.commit()
+    return dataObject
+
+def recreateSchema(db):
+    """
+        Drops and recreates the data objects
+        Returns the indexes, which are left off until the data has been loaded
+    """
+    # the tables and the views over them
+    with stage('schema'):
+        Base.metadata.drop_all(db.engine)
+        Base.metadata.create_all(db.engine)
+        return dropIndexes(Base.metadata, db.engine)
+
+def buildDimensions(counts):
+    """
+        Assigns the dimension ids in process from the (combined) dimensionCounts
+        Each dimension's frame keeps its csv columns so resolveKeys can look the ids up
+    """
+    with stage('dimension build'):
+        return assignDimensionIds(counts)
+
+def assignDimensionIds(counts):
+    dims = {}
+    for dim, thisCount in counts.items():
+        thisCount = thisCount.sort_values(DIMENSION_COLUMNS[dim], na_position = 'last', ignore_index = True)
+        dims[dim] = thisCount
+
+    # every parent federation needs a row of its own (with no parent) for parent_id to point at
+    feds    = dims['Federation']
+    parents = feds.loc[feds['ParentFederation'].isna(), 'Federation']
+    missing = feds.loc[feds['ParentFederation'].notna() & ~feds['ParentFederation'].isin(parents), 'ParentFederation'].unique()
+    if len(missing) > 0:
+        feds = pd.concat ([feds, pd.DataFrame({'Federation' : missing, 'resultCnt' : 0})], ignore_index = True)
+        feds = feds.sort_values(DIMENSION_COLUMNS['Federation'], na_position = 'last', ignore_index = True)
+    dims['Federation'] = feds
+
+    for dim, thisDim in dims.items():
+        thisDim.insert(0, 'id', np.arange(1, len(thisDim) + 1))
+
+    feds = dims['Federation']
+    parentIds = feds.loc[feds['ParentFederation'].isna()].set_index('Federation')['id']
+    feds['parent_id'] = feds['ParentFederation'].map(parentIds)
+
+    linkParents(dims, dims)
+    return dims
+
+def linkParents(dims, frames):
+    """
+        Sets the DIMENSION_PARENTS id columns of frames (some or all of the dims) from the ids in dims
+    """
+    for dim, parents in DIMENSION_PARENTS.items():
+        for idName, parent in parents.items():
+            frames[dim][idName] = lookupIds(dims[parent], frames[dim], DIMENSION_COLUMNS[parent])
+
+def createDimensions(db, dims):
+    """
+        Inserts the dimension tables, ids and all
+    """
+    with stage('dimension insert') as thisStage:
+        for dim, (table, colMappings, idName) in DIMENSION_TABLES.items():
+            thisStage.rows += bulkInsertFrame (engine      = db.engine
+                                              ,table       = table.__table__
+                                              ,df          = dims[dim]
+                                              ,colMappings = colMappings
+                                              )
+
+def lookupIds(dimFrame, df, cols : list):
+    """
+        The dimension ids for the values of cols in df, missing values included
+        Each column is factorized over both with missing values as a code of their own, as get_indexer on the values
+        themselves matches a value the dimension hasn't got to the dimension's NaN rather than reporting it missing
+    """
+    values = plainTypes(df[cols])
+    dimCodes, rowCodes = ([], [])
+    for c in cols:
+        codes, uniques = pd.factorize(pd.concat([dimFrame[c], values[c]], ignore_index = True), use_na_sentinel = False)
+        dimCodes.append(codes[:len(dimFrame)])
+        rowCodes.append(codes[len(dimFrame):])
+    positions = pd.MultiIndex.from_arrays(dimCodes).get_indexer(pd.MultiIndex.from_arrays(rowCodes))
+    if (positions < 0).any():
+        raise Exception (f"{(positions < 0).sum()} rows have {cols} values not in the dimension")
+    return dimFrame['id'].to_numpy()[positions]
+
+def resolveKeys(df, dims):
+    """
+        Adds the dimension ids to the frame, keeping every row
+        The dimension value columns are left in place, the writers only pick up the result columns
+    """
+    with stage('key resolution') as thisStage:
+        for dim, (table, colMappings, idName) in DIMENSION_TABLES.items():
+            if idName:
+                df[idName] = lookupIds(dims[dim], df, DIMENSION_COLUMNS[dim])
+        thisStage.rows += len(df)
+    return df
+
+def meetDigests(df):
+    """
+        Per meet, an order independent digest of its (key resolved) result rows, the wrapping sum of the row hashes,
+        and its row count. Sums of chunks can be added together, see combineDigests
+    """
+    with stage('meet digests') as thisStage:
+        digests = df[MEET_KEY].copy()
+        # hashed as float64 whatever the typing, so a compact load's digests match a plain one's
+        values  = df[DIGEST_COLUMNS]
+        values  = values.astype({c : np.float64 for c in values.columns if values[c].dtype == np.float32})
+        digests['digest'] = pd.util.hash_pandas_object(values, index = False).to_numpy()
+        thisStage.rows += len(df)
+        return digests.groupby(MEET_KEY, dropna = False).agg(digest = ('digest', 'sum'), resultCnt = ('digest', 'size')).reset_index()
+
+def combineDigests(digestsList : list):
+    if not digestsList:
+        return pd.DataFrame(columns = MEET_KEY + ['digest', 'resultCnt'])
+    digests = pd.concat (digestsList, ignore_index = True)
+    return digests.groupby(MEET_KEY, dropna = False).agg(digest = ('digest', 'sum'), resultCnt = ('resultCnt', 'sum')).reset_index()
+
+def writeMeetDigests(db, digests):
+    """
+        Replaces the meet digests, the uint64 digests are stored as (signed) sqlite integers
+    """
+    with stage('meet digests'):
+        digests = digests.assign(digest = digests['digest'].astype(np.uint64).view(np.int64))
+        with db.connect() as conn:
+            conn.execute (text(f'DELETE FROM {MeetDigest.__tablename__}'))
+            conn.commit()
+        bulkInsertFrame (engine = db.engine
+                        ,table  = MeetDigest.__table__
+                        ,df     = digests
+                        )
+
+def readMeetDigests(db):
+    with db.connect() as conn:
+        digests = pd.read_sql_query (sql = text(f'SELECT meet_id, digest, resultCnt FROM {MeetDigest.__tablename__}')
+                                    ,con = conn
+                                    )
+    digests['digest'] = digests['digest'].astype(np.int64).view(np.uint64)
+    return digests
+
+class ResultWriter ():
+    """
+        Where the key resolved results go, with the chosen writer :
+            pipeline : batches prepared here, written by a dedicated writer thread
+            bulk     : raw executemany batches
+            orm      : ORM bulk_insert_mappings
+    """
+    def __init__ (self, db, writer : str = 'pipeline'):
+        self.db       = db
+        self.writer   = writer
+        self.rows     = 0
+        self.started  = time.perf_counter()
+        self.pipeline = PipelinedWriter(db.engine) if writer == 'pipeline' else None
+        self.digests  = []
+
+    def write (self, df):
+        with stage('fact insert') as thisStage:
+            self.insert(df)
+            thisStage.rows += len(df)
+        self.rows += len(df)
+        self.digests.append(meetDigests(df))
+
+    def insert (self, df):
+        if self.pipeline:
+            self.pipeline.writeFrame(Result.__table__, df, RESULT_COLUMNS)
+        elif self.writer == 'bulk':
+            bulkInsertFrame (engine      = self.db.engine
+                            ,table       = Result.__table__
+                            ,df          = df
+                            ,colMappings = RESULT_COLUMNS
+                            )
+        else:
+            with self.db.Session() as session:
+                createData (ObjectNameDestination = Result
+                           ,dataObject            = df
+                           ,session               = session
+                           ,colMappings           = RESULT_COLUMNS
+                           ,commit                = True
+                           )
+
+    def meetDigests (self):
+        """
+            The digests of every meet written
+        """
+        return combineDigests(self.digests)
+
+    def close (self):
+        if self.pipeline:
+            # the writer thread catching up
+            with stage('fact insert'):
+                stats = self.pipeline.close()
+            print (f"{datetime.now()} : pipeline : producer blocked {stats['producerBlocked']:.2f}s, writer blocked {stats['writerBlocked']:.2f}s, writer busy {stats['writerBusy']:.2f}s")
+        elapsed = time.perf_counter() - self.started
+        print (f"{datetime.now()} : {self.writer} insert : {self.rows} results in {elapsed:.2f}s ({self.rows / max(elapsed, 1e-9):,.0f} rows/sec)")
+
+class OutputBackend (ABC):
+    """
+        Where a full load goes : create the schema, bulk load the dimensions, bulk load the facts, create the views
+        Everything before that (parse, dimension build, key resolution) is the same whichever the backend
+    """
+    name : str = None
+
+    @abstractmethod
+    def createSchema (self):
+        ...
+
+    @abstractmethod
+    def loadDimensions (self, dims : dict):
+        ...
+
+    @abstractmethod
+    def factWriter (self, writer : str = 'pipeline'):
+        """
+            What the key resolved results are written to, a frame at a time : write(df), close() and meetDigests()
+        """
+
+    def loadMeetDigests (self, digests):
+        """
+            Only a backend which can load incrementally keeps them
+        """
+
+    def createIndexes (self):
+        """
+            Once the data is in
+        """
+
+    @abstractmethod
+    def createViews (self):
+        ...
+
+    def close (self):
+        ...
+
+class SQLiteBackend (OutputBackend):
+    """
+        The default, through DB, with the indexes deferred until the data is in
+    """
+    name : str = 'sqlite'
+
+    def __init__ (self, db):
+        self.db              = db
+        self.deferredIndexes = []
+
+    def createSchema (self):
+        self.deferredIndexes = recreateSchema(self.db)
+
+    def loadDimensions (self, dims : dict):
+        createDimensions(self.db, dims)
+
+    def factWriter (self, writer : str = 'pipeline'):
+        return ResultWriter(self.db, writer)
+
+    def loadMeetDigests (self, digests):
+        writeMeetDigests(self.db, digests)
+
+    def createIndexes (self):
+        createIndexes(self.deferredIndexes, self.db.engine)
+
+    def createViews (self):
+        # part of Base.metadata, so createSchema has made them
+        ...
+
+def importDuckDB():
+    """
+        duckdb is only needed by the duckdb backend, so it isn't imported unless that is used
+    """
+    try:
+        import duckdb
+    except ImportError:
+        raise Exception ("The duckdb backend needs the duckdb package (the duckdb extra)")
+    return duckdb
+
+class DuckDBBackend (OutputBackend):
+    """
+        An embedded columnar database, the frames are scanned straight into the tables rather than inserted row by row
+        The tables have no keys or indexes, which would only slow the load down
+    """
+    name : str = 'duckdb'
+
+    def __init__ (self, filepath : Path):
+        self.conn = importDuckDB().connect(str(filepath))
+
+    def createSchema (self):
+        with stage('schema'):
+            for table in Base.metadata.sorted_tables:
+                # sqlite numbers a frame's rows for it (INTEGER PRIMARY KEY), here it is a sequence
+                keys     = list(table.primary_key.columns)
+                numbered = keys[0] if len(keys) == 1 and isinstance(keys[0].type, Integer) else None
+                if numbered is not None:
+                    self.conn.execute (f'CREATE SEQUENCE "{table.name}_{numbered.name}"')
+                columns = [f'"{c.name}" {DUCKDB_TYPES[type(c.type)]}'
+                           + (f""" DEFAULT nextval('{table.name}_{c.name}')""" if c is numbered else '')
+                           + ('' if c.nullable else ' NOT NULL')
+                           for c in table.columns]
+                self.conn.execute (f'CREATE TABLE "{table.name}" ({", ".join(columns)})')
+
+    def loadFrame (self, table, df, colMappings : dict = None):
+        """
+            Columns (after colMappings) which aren't in the table are ignored, as bulkInsertFrame does
+            Returns the number of rows loaded
+        """
+        sourceOf = {v : k for k, v in (colMappings or {}).items()}
+        columns  = [c for c in table.columns if sourceOf.get(c.name, c.name) in df.columns]
+        # datetime64 columns are scanned as TIMESTAMP_NS, which not every duckdb version casts straight to DATE
+        selected = [f'CAST(CAST("{sourceOf.get(c.name, c.name)}" AS TIMESTAMP) AS DATE)' if isinstance(c.type, Date) else f'"{sourceOf.get(c.name, c.name)}"' for c in columns]
+        self.conn.register ('_frame', df[[sourceOf.get(c.name, c.name) for c in columns]])
+        try:
+            self.conn.execute (f"""INSERT INTO "{table.name}" ({", ".join([f'"{c.name}"' for c in columns])})
+                                   SELECT {", ".join(selected)} FROM _frame""")
+        finally:
+            self.conn.unregister ('_frame')
+        return len(df)
+
+    def loadDimensions (self, dims : dict):
+        with stage('dimension insert') as thisStage:
+            for dim, (table, colMappings, idName) in DIMENSION_TABLES.items():
+                thisStage.rows += self.loadFrame(table.__table__, dims[dim], colMappings)
+
+    def factWriter (self, writer : str = 'pipeline'):
+        return DuckDBWriter(self)
+
+    def createViews (self):
+        with stage('schema'):
+            for name, selectable in VIEWS.items():
+                sql = selectable.compile(dialect = sqliteDialect.dialect(), compile_kwargs = {'literal_binds' : True})
+                self.conn.execute (f'CREATE VIEW "{name}" AS {sql}')
+
+    def recordCommit (self, commitGUID):
+        """
+            What duckDBLoaded checks
+            Returns the number of results
+        """
+        self.conn.execute (f'CREATE TABLE "{dataCommit.__tablename__}" ("commitGUID" VARCHAR, loaded TIMESTAMP, "rowCount" BIGINT)')
+        self.conn.execute (f'INSERT INTO "{dataCommit.__tablename__}" SELECT ?, ?, COUNT(*) FROM "{Result.__tablename__}"'
+                          ,[commitGUID, datetime.now()]
                           )
+        return self.conn.execute (f'SELECT "rowCount" FROM "{dataCommit.__tablename__}"').fetchone()[0]
+
+    def close (self):
+        self.conn.close()
+
+class DuckDBWriter ():
+    """
+        DuckDBBackend's results, each frame in one INSERT ... SELECT
+    """
+    def __init__ (self, backend : DuckDBBackend):
+        self.backend = backend
+        self.rows    = 0
+        self.started = time.perf_counter()
+
+    def write (self, df):
+        with stage('fact insert') as thisStage:
+            thisStage.rows += self.backend.loadFrame(Result.__table__, df, RESULT_COLUMNS)
+        self.rows += len(df)
+
+    def meetDigests (self):
+        return None
+
+    def close (self):
+        elapsed = time.perf_counter() - self.started
+        print (f"{datetime.now()} : duckdb insert : {self.rows} results in {elapsed:.2f}s ({self.rows / max(elapsed, 1e-9):,.0f} rows/sec)")
+
+def chunkRowsForMemory(memoryLimitMB : int, compact : bool = False):
+    """
+        Works out how many csv rows we can handle at a time and stay under memoryLimitMB
+        Based on the in-memory size of a sample chunk, allowing for the copies made while resolving the keys
+    """
+    chunks = readZipChunks(chunkRows = SAMPLE_CHUNK_ROWS, compact = compact)
+    try:
+        sample = prepareFrame(next(chunks))
+    finally:
+        chunks.close()
+    bytesPerRow = sample.memory_usage(deep = True).sum() / max(len(sample),1)
+    return max(MIN_CHUNK_ROWS, int(memoryLimitMB * 1024 * 1024 / (bytesPerRow * CHUNK_WORKING_SET_FACTOR)))
 
+def loadInMemory(backend : OutputBackend, commitGUID, options : LoadOptions):
+    """
+        Reads the whole csv into a single pd.DataFrame and loads it in one go
+    """
+    print (f"{datetime.now()} : Reading zip")
+    if options.streamZip:
+        df = readFrame(commitGUID, options)
+        print (f"{datetime.now()} : Read {len(df)} rows")
+    else:
+        df = readExtracted(commitGUID, options)
 
+    df = prepareFrame(df)
+    dims = buildDimensions(dimensionCounts(df))
+    backend.loadDimensions(dims)
+    df = resolveKeys(df, dims)
+    results = backend.factWriter(options.writer)
+    try:
+        results.write(df)
+    finally:
+        results.close()
+    backend.loadMeetDigests(results.meetDigests())
+
+def loadChunked(backend : OutputBackend, commitGUID, options : LoadOptions):
+    """
+        Bounded memory load : a pre-pass over the zip builds the dimensions,
+        then the results are read, resolved and inserted a chunk at a time
+    """
+    chunkRows = chunkRowsForMemory(options.memoryLimitMB, options.compact)
+    print (f"{datetime.now()} : Chunked load : {chunkRows} rows per chunk for {options.memoryLimitMB}MB")
+
+    print (f"{datetime.now()} : Dimension pre-pass")
+    dims = buildDimensions(combineCounts(dimensionCounts(prepareFrame(chunk)) for chunk in readChunks(commitGUID, options, chunkRows)))
+    backend.loadDimensions(dims)
+
+    results = backend.factWriter(options.writer)
+    try:
+        for chunk in readChunks(commitGUID, options, chunkRows):
+            results.write(resolveKeys(prepareFrame(chunk), dims))
+            print (f"{datetime.now()} : Inserted {results.rows} results")
+    finally:
+        results.close()
+    backend.loadMeetDigests(results.meetDigests())
+
+def zipLineBlocks(zipPath : Path = dataFilePath):
+    """
+        The csv out of the zip as (header, block) pairs of whole lines, for the worker processes to parse
+    """
+    with (ZipFile(zipPath, mode="r") as archive
+         ,archive.open(csvMemberName(archive), mode="r") as stream
+         ):
+        yield from lineBlocks(stream)
+
+def parseBlock(header, block, compact : bool = False):
+    """
+        Parses one zipLineBlocks block into a typed, prepared pd.DataFrame
+    """
+    dtypes, parse_dates, floatCols, intCols = csvReadArgs(compact)
+    df = pd.read_csv (io.BytesIO(header + block)
+                     ,dtype       = dtypes
+                     ,parse_dates = parse_dates
+                     )
+    df = coerceNumeric(df, floatCols = floatCols, intCols = intCols)
+    if compact:
+        df = narrowFloats(df, floatCols + intCols)
+    return prepareFrame(df)
+
+def blockCounts(header, block, compact : bool = False):
+    return dimensionCounts(parseBlock(header, block, compact))
+
+workerDims = None
+def setWorkerDims(dims):
+    global workerDims
+    workerDims = dims
+
+def blockResults(header, block, compact : bool = False):
+    """
+        Parses and key resolves one block in a worker, handing back only what the result insert needs
+    """
+    df = resolveKeys(parseBlock(header, block, compact), workerDims)
+    return df[DIGEST_COLUMNS]
+
+def loadParallel(backend : OutputBackend, commitGUID, options : LoadOptions):
+    """
+        Parses and transforms blocks of the csv in a process pool, with this process the only writer
+        Dimension ids come from the sorted combined counts, so don't depend on the number of workers,
+        and the results are inserted in csv order
+        The workers parse the zip's blocks themselves, so the parsed cache is neither read nor filled
+    """
+    print (f"{datetime.now()} : Parallel load : {options.workers} workers, without the parsed cache")
+
+    print (f"{datetime.now()} : Dimension pre-pass")
+    blocks = timedIter('parallel transform', orderedMap(blockCounts, ((header, block, options.compact) for header, block in zipLineBlocks()), options.workers), rows = lambda counts: counts['Event']['resultCnt'].sum())
+    dims   = buildDimensions(combineCounts(blocks))
+    backend.loadDimensions(dims)
+
+    results = backend.factWriter(options.writer)
+    try:
+        for chunk in timedIter('parallel transform', orderedMap(blockResults, ((header, block, options.compact) for header, block in zipLineBlocks()), options.workers, initializer = setWorkerDims, initargs = (dims,))):
+            results.write(chunk)
+            print (f"{datetime.now()} : Inserted {results.rows} results")
+    finally:
+        results.close()
+    backend.loadMeetDigests(results.meetDigests())
+
+def removeDatabase(filepath : Path):
+    # sqlite's journals, and duckdb's .wal
+    for suffix in ['', '-journal', '-wal', '-shm', '.wal']:
+        filepath.with_name(f'{filepath.name}{suffix}').unlink(missing_ok = True)
+
+def copyCommitHistory(engineURI : str = buildEngineURI):
+    """
+        Copies the dataCommit rows from the live database into the new snapshot
+    """
     try:
         db = DB ()
-        with db.Session() as session:
-            createGroupedByData(Event,'Event',session, {"Event" : "name"})
-            createGroupedByData(MeetCountry,'MeetCountry',session, {"MeetCountry" : "name"})
-            createGroupedByData(FederationLoad,['Federation','ParentFederation'],session, {"Federation" : "name","ParentFederation" : "parent_name"})
-            createGroupedByData(Division,'Division',session, {"Division" : "name"})
-            createGroupedByData(Equipment,'Equipment',session, {"Equipment" : "name"})
-            createGroupedByData(SexWeight,['Sex','WeightClass'],session, {"Sex" : "sex", "WeightClass" : "weight_class"}, True)
-
-        dml = []
-        dml.append (f'UPDATE {FederationLoad.__tablename__} SET parent_id = (SELECT p.id FROM  {ParentFederationLoad.__tablename__} AS p WHERE p.name = parent_name) WHERE parent_name IS NOT NULL')
-        for _not in ['','NOT ']: # need to put the parents in first because of the FK
-            dml.append (f"INSERT INTO {Federation.__tablename__}  (id, name, parent_id, resultCnt) SELECT l.id, l.name, l.parent_id, l.resultCnt FROM  {FederationLoad.__tablename__} l WHERE l.parent_id IS {_not}NULL")
-
-        with (db.engine.connect() as conn
-             ,conn.begin()
-             ):
-            for u in dml:
-                # print (u)
-                conn.execute (text(u))
+        CommitBase.metadata.create_all(db.engine)
+        upgradeCommitTable(db.engine)
     finally:
-        if db:
+        db.dispose()
+
+    cols = ', '.join([c.name for c in dataCommit.__table__.columns])
+    try:
+        db = DB (engineURI)
+        CommitBase.metadata.create_all(db.engine)
+        with db.connect() as conn:
+            conn.execute (text('ATTACH DATABASE :filepath AS live'), {'filepath' : str(dataDBfilepath)})
+            conn.execute (text(f'INSERT INTO {dataCommit.__tablename__} ({cols}) SELECT {cols} FROM live.{dataCommit.__tablename__}'))
+            conn.commit()
+            conn.execute (text('DETACH DATABASE live'))
+    finally:
+        db.dispose()
+
+def buildRollups(db):
+    """
+        Recomputes the lifter level rollups from result : lifter, each lifter's personal_best per lift & equipment,
+        and category_rank, each lifter's best total & dots per RANK_CATEGORY with their rank within it
+        Ranks are RANK(), so ties share a position; a lifter with no total (or dots) in a category has no rank for it
+    """
+    result    = Result.__tablename__
+    category  = ', '.join(RANK_CATEGORY)
+    partition = ', '.join([f'b.{c}' for c in RANK_CATEGORY])
+    lifts     = '\n UNION ALL '.join([f"SELECT name, equipment_id, '{lift}' AS lift, {col} AS value, id AS result_id, date FROM {result} WHERE {col} IS NOT NULL"
+                                      for lift, col in PERSONAL_BEST_LIFTS.items()
+                                     ])
+    with db.connect() as conn:
+        for table in ROLLUP_TABLES:
+            conn.execute (text(f'DELETE FROM {table.__tablename__}'))
+        conn.execute (text(f"""INSERT INTO {Lifter.__tablename__} (name, first_date, last_date, resultCnt)
+                               SELECT name, MIN(date), MAX(date), COUNT(*)
+                                 FROM {result}
+                                GROUP BY name
+                                ORDER BY name"""))
+        conn.execute (text(f"""INSERT INTO {PersonalBest.__tablename__} (lifter_id, equipment_id, lift, value, date, result_id)
+                               SELECT l.id, b.equipment_id, b.lift, b.value, b.date, b.result_id
+                                 FROM (SELECT *, ROW_NUMBER() OVER (PARTITION BY name, equipment_id, lift ORDER BY value DESC, date, result_id) AS n
+                                         FROM ({lifts})
+                                      ) b
+                                 JOIN {Lifter.__tablename__} l ON l.name = b.name
+                                WHERE b.n = 1"""))
+        conn.execute (text(f"""INSERT INTO {CategoryRank.__tablename__} ({category}, lifter_id, best_total, best_dots, rank_total, rank_dots)
+                               SELECT {partition}, b.lifter_id, b.best_total, b.best_dots
+                                     ,CASE WHEN b.best_total IS NOT NULL THEN RANK() OVER (PARTITION BY {partition} ORDER BY b.best_total DESC) END
+                                     ,CASE WHEN b.best_dots  IS NOT NULL THEN RANK() OVER (PARTITION BY {partition} ORDER BY b.best_dots DESC) END
+                                 FROM (SELECT {', '.join([f'r.{c}' for c in RANK_CATEGORY])}, l.id AS lifter_id, MAX(r.total) AS best_total, MAX(r.dots) AS best_dots
+                                         FROM {result} r
+                                         JOIN {Lifter.__tablename__} l ON l.name = r.name
+                                        GROUP BY {', '.join([f'r.{c}' for c in RANK_CATEGORY])}, l.id
+                                      ) b"""))
+        conn.commit()
+        return conn.execute (text(f'SELECT COUNT(*) FROM {Lifter.__tablename__}')).scalar()
+
+def buildSearch(db):
+    """
+        The lifter & meet search tables, see search.py
+    """
+    conn = db.engine.raw_connection()
+    try:
+        lifters = search.createSearchTables(conn)
+        conn.commit()
+    finally:
+        conn.close()
+    return lifters
+
+def materializeResults(db, materialize : bool):
+    """
+        (Re)builds results_flat from v_results, its indexes after the rows are in
+        Without materialize any results_flat, e.g. in the copy an incremental load starts from, is dropped rather than left stale
+    """
+    FlatBase.metadata.drop_all(db.engine)
+    if not materialize:
+        return
+    print (f"{datetime.now()} : Materializing {ResultView.__tablename__}")
+    FlatBase.metadata.create_all(db.engine)
+    indexes = dropIndexes(FlatBase.metadata, db.engine)
+    into    = ', '.join([f'"{c}"' for c in FLAT_COLUMNS.values()])
+    cols    = ', '.join([f'"{c}"' for c in FLAT_COLUMNS.keys()])
+    with db.connect() as conn:
+        rows = conn.execute (text(f'INSERT INTO {ResultFlat.__tablename__} ({into}) SELECT {cols} FROM {ResultView.__tablename__}')).rowcount
+        conn.commit()
+    createIndexes(indexes, db.engine)
+    return rows
+
+def optimizeSnapshot(options : LoadOptions, engineURI : str = buildEngineURI):
+    """
+        Gathers the planner statistics for the new indexes and, if asked, rebuilds the file (with a new page size)
+    """
+    try:
+        db = DB (engineURI)
+        with db.connect() as conn:
+            conn.exec_driver_sql('ANALYZE')
+            conn.commit()
+            pageSize = conn.exec_driver_sql('PRAGMA page_size').scalar()
+            if options.vacuum or (options.pageSize and not options.pageSize == pageSize):
+                if options.pageSize:
+                    conn.exec_driver_sql(f'PRAGMA page_size = {int(options.pageSize)}')
+                print (f"{datetime.now()} : VACUUM, page size {pageSize} -> {options.pageSize or pageSize}")
+                conn.exec_driver_sql('VACUUM')
+    finally:
+        db.dispose()
+
+def verifySnapshot(commitGUID, engineURI : str = buildEngineURI):
+    """
+        Sets the snapshot up for readers and checks it is sound before it goes live
+    """
+    try:
+        db = DB (engineURI)
+        with db.connect() as conn:
+            conn.execute (text('PRAGMA optimize'))
+            check = conn.execute (text('PRAGMA quick_check')).scalar()
+            if not check == 'ok':
+                raise Exception (f"New database failed quick_check : {check}")
+            rowCount = conn.execute (text(f'SELECT COUNT(*) FROM {Result.__tablename__}')).scalar()
+            loaded   = conn.execute (text(f'SELECT rowCount FROM {dataCommit.__tablename__} WHERE commitGUID = :guid AND loaded IS NOT NULL'), {'guid' : commitGUID}).scalar()
+            if not rowCount or not rowCount == loaded:
+                raise Exception (f"New database has {rowCount} results, expected {loaded}")
+    finally:
+        db.dispose()
+
+def swapInSnapshot(filepath : Path = buildDBfilepath):
+    """
+        Atomically renames the new snapshot over the live database
+        Readers with the old file open carry on reading it, new connections get the new one
+    """
+    if dataDBfilepath.is_file():
+        # flush out anything left in a WAL from before, so no stale -wal gets applied to the new file
+        try:
+            db = DB ()
+            with db.connect() as conn:
+                conn.execute (text('PRAGMA wal_checkpoint(TRUNCATE)'))
+        finally:
             db.dispose()
+    os.replace(filepath, dataDBfilepath)
+
+def readDimensions(db):
+    """
+        The dimensions of an existing database, in the shape buildDimensions gives them
+    """
+    dims = {}
+    with db.connect() as conn:
+        for dim, (table, colMappings, idName) in DIMENSION_TABLES.items():
+            this = pd.read_sql_query (sql = text(f'SELECT * FROM "{table.__tablename__}" ORDER BY id')
+                                     ,con = conn
+                                     )
+            dims[dim] = this.rename (columns = {v : k for k, v in colMappings.items()})
+    dims['Meet']['Date'] = pd.to_datetime(dims['Meet']['Date'])
+
+    feds = dims['Federation']
+    feds['ParentFederation'] = feds['parent_id'].map(feds.set_index('id')['Federation'])
+    # the csv columns of the dimensions each one references, in DIMENSION_PARENTS order so those are there by then
+    for dim, parents in DIMENSION_PARENTS.items():
+        for idName, parent in parents.items():
+            parentCols = [c for c in DIMENSION_COLUMNS[parent] if not c in dims[dim].columns]
+            dims[dim]  = dims[dim].merge(dims[parent][['id'] + parentCols].rename(columns = {'id' : idName}), on = idName, how = 'left')
+    return dims
+
+def extendDimensions(dims, counts):
+    """
+        Adds the values in counts which the existing dims haven't got, with ids after the existing ones,
+        and sets every resultCnt from counts. Existing ids never change, so the existing results stay valid
+        Returns (dims, the new rows of each dimension)
+    """
+    added = {}
+    for dim, thisCount in counts.items():
+        cols      = DIMENSION_COLUMNS[dim]
+        existing  = dims[dim]
+        # a merge rather than lookupIds, the values the dimension hasn't got are what's wanted here
+        matched   = thisCount.merge(existing[cols + ['id']], on = cols, how = 'left')
+        existing['resultCnt'] = existing['id'].map(matched.dropna(subset = ['id']).set_index('id')['resultCnt']).fillna(0).astype(int)
+        added[dim] = thisCount.loc[matched['id'].isna().to_numpy()]
 
+    # as in buildDimensions, every parent federation needs a row of its own
+    feds    = pd.concat ([dims['Federation'], added['Federation']], ignore_index = True)
+    parents = feds.loc[feds['ParentFederation'].isna(), 'Federation']
+    missing = feds.loc[feds['ParentFederation'].notna() & ~feds['ParentFederation'].isin(parents), 'ParentFederation'].unique()
+    if len(missing) > 0:
+        added['Federation'] = pd.concat ([added['Federation'], pd.DataFrame({'Federation' : missing, 'resultCnt' : 0})], ignore_index = True)
+
+    for dim, new in added.items():
+        new = new.sort_values(DIMENSION_COLUMNS[dim], na_position = 'last', ignore_index = True)
+        new.insert(0, 'id', np.arange(1, len(new) + 1) + int(dims[dim]['id'].max() if len(dims[dim]) else 0))
+        added[dim] = new
+
+    feds      = pd.concat ([dims['Federation'], added['Federation']], ignore_index = True)
+    parentIds = feds.loc[feds['ParentFederation'].isna()].set_index('Federation')['id']
+    added['Federation']['parent_id'] = added['Federation']['ParentFederation'].map(parentIds)
+
+    linkParents({dim : pd.concat ([dims[dim], added[dim]], ignore_index = True) for dim in dims}, added)
+
+    return ({dim : pd.concat ([dims[dim], added[dim]], ignore_index = True) for dim in dims}, added)
+
+def writeDimensionChanges(db, dims, added):
+    """
+        Inserts the new dimension rows and updates the resultCnt of the rest
+    """
+    createDimensions(db, added)
+    with stage('dimension insert'):
+        conn = db.engine.raw_connection()
+        try:
+            cursor = conn.cursor()
+            for dim, (table, colMappings, idName) in DIMENSION_TABLES.items():
+                cursor.executemany (f'UPDATE "{table.__tablename__}" SET resultCnt = ? WHERE id = ?'
+                                   ,[(int(cnt), int(id)) for id, cnt in dims[dim][['id', 'resultCnt']].itertuples(index = False, name = None)]
+                                   )
+            cursor.close()
+            conn.commit()
+        finally:
+            conn.close()
+
+def deleteMeets(db, meets):
+    """
+        Deletes the results of these meets (MEET_KEY frame)
+    """
+    conn = db.engine.raw_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute ('CREATE TEMP TABLE _stale_meet (meet_id INTEGER PRIMARY KEY)')
+        cursor.executemany ('INSERT INTO _stale_meet VALUES (?)', [(int(m),) for m in meets['meet_id']])
+        cursor.execute (f'DELETE FROM {Result.__tablename__} WHERE meet_id IN (SELECT meet_id FROM _stale_meet)')
+        deleted = cursor.rowcount
+        cursor.execute ('DROP TABLE _stale_meet')
+        cursor.close()
+        conn.commit()
+    finally:
+        conn.close()
+    return deleted
+
+def loadIncremental(db, commitGUID, options : LoadOptions):
+    """
+        Applies this commit to a copy of the previous load : only the results of meets which were added, removed
+        or changed (by their meetDigests) are deleted / inserted, and the dimensions are extended & recounted
+        With a memoryLimitMB it is done in chunks, as loadChunked is : a pass over the csv for the dimensions, one
+        for the meet digests and one for the results of the meets which changed
+    """
+    print (f"{datetime.now()} : Incremental load")
+    if options.memoryLimitMB:
+        chunkRows = chunkRowsForMemory(options.memoryLimitMB, options.compact)
+        print (f"{datetime.now()} : Chunked incremental load : {chunkRows} rows per chunk for {options.memoryLimitMB}MB")
+        frames = lambda : (prepareFrame(chunk) for chunk in readChunks(commitGUID, options, chunkRows))
+    else:
+        df     = prepareFrame(readFrame(commitGUID, options))
+        frames = lambda : [df]
+
+    counts = combineCounts(dimensionCounts(df) for df in frames())
+    with stage('dimension build'):
+        dims, added = extendDimensions(readDimensions(db), counts)
+    writeDimensionChanges(db, dims, added)
+    if options.memoryLimitMB:
+        resolved = lambda : (resolveKeys(df, dims) for df in frames())
+    else:
+        df       = resolveKeys(df, dims)
+        resolved = lambda : [df]
+
+    digests = combineDigests([meetDigests(df) for df in resolved()])
+    with stage('diff'):
+        both    = digests.merge(readMeetDigests(db), on = MEET_KEY, how = 'outer', suffixes = ['', '_old'], indicator = True)
+        changed = both.loc[(both['_merge'] != 'both') | (both['digest'] != both['digest_old']) | (both['resultCnt'] != both['resultCnt_old'])]
+        stale   = changed.loc[changed['_merge'] != 'left_only']
+        fresh   = changed.loc[changed['_merge'] != 'right_only']
+    print (f"{datetime.now()} : {len(digests)} meets : {(changed['_merge'] == 'left_only').sum()} new, {(changed['_merge'] == 'right_only').sum()} gone, {(changed['_merge'] == 'both').sum()} changed")
+
+    with stage('delete') as thisStage:
+        deleted = deleteMeets(db, stale)
+        thisStage.rows += deleted
+    results = ResultWriter(db, options.writer)
+    try:
+        for df in resolved():
+            results.write(df.loc[df[MEET_KEY].merge(fresh[MEET_KEY].assign(fresh = True), on = MEET_KEY, how = 'left')['fresh'].notna().to_numpy()])
+    finally:
+        results.close()
+    writeMeetDigests(db, digests)
+    print (f"{datetime.now()} : Incremental load : {deleted} results deleted, {results.rows} inserted")
+
+    csvRows = int(digests['resultCnt'].sum())
+    with db.connect() as conn:
+        rowCount = conn.execute (text(f'SELECT COUNT(*) FROM {Result.__tablename__}')).scalar()
+    if not rowCount == csvRows:
+        raise Exception (f"Incremental load left {rowCount} results, the csv has {csvRows}")
+
+def canLoadIncrementally():
+    """
+        Only if the live database has a finished load, with meet digests, in the current schema
+    """
+    if not dataDBfilepath.is_file():
+        return False
     try:
         db = DB ()
-        with (db.engine.connect() as conn
-             ,conn.begin()
-             ):
-
-            def readAndPop(obj, joinColsLeft : list):
-                try:
-                    this = pd.read_sql_table(table_name = obj.__tablename__
-                                            ,con        = conn
-                                            )
-                except AttributeError as ae:
-                    print (str(ae))
-                    sql = f'SELECT * FROM {obj.__tablename__}'
-                    print (sql)
-                    this = pd.read_sql_query (sql = sql
-                                             ,con = conn
-                                             )
-                try:
-                    this.pop ('resultCnt')
-                except KeyError:
-                    ...
-                thisDrop = [c for c in this.columns.values.tolist() if not c == "id"]
-                if joinColsLeft:
-                    thisDrop.extend(joinColsLeft)
-                return (this, thisDrop)
-
-
-            # Update the federation ids
-            joinColsLeft = ['Federation', 'ParentFederation']
-            feds,deleteCols = readAndPop (FederationLoad,joinColsLeft)
-            df = df.merge(feds, left_on = joinColsLeft, right_on = ['name', 'parent_name'])
-            df = df.rename (columns = {'id': 'federation_id'})
-            df = df.drop(deleteCols, axis = 1)
-
-            # Divisions
-            joinColsLeft = ['Division']
-            divisions,deleteCols = readAndPop (Division,joinColsLeft)
-            df = df.merge(divisions, left_on = joinColsLeft, right_on = ['name'])
-            df = df.rename (columns = {'id': 'division_id'})
-            df = df.drop(deleteCols, axis = 1)
-
-            # Equipment
-            joinColsLeft = ['Equipment']
-            equipment,deleteCols = readAndPop (Equipment,joinColsLeft)
-            df = df.merge(equipment, left_on = joinColsLeft, right_on = ['name'])
-            df = df.rename (columns = {'id': 'equipment_id'})
-            df = df.drop(deleteCols, axis = 1)
-
-            # Events
-            joinColsLeft = ['Event']
-            events,deleteCols = readAndPop (Event,joinColsLeft)
-            df = df.merge(events, left_on = joinColsLeft, right_on = ['name'])
-            df = df.rename (columns = {'id': 'event_id'})
-            df = df.drop(deleteCols, axis = 1)
-
-            # Sex weights
-            joinColsLeft = ['Sex','WeightClass']
-            weightClass,deleteCols = readAndPop (SexWeight,joinColsLeft)
-            df = df.merge(weightClass, left_on = joinColsLeft, right_on = ['sex','weight_class'])
-            df = df.rename (columns = {'id': 'weightclass_id'})
-            df = df.drop(deleteCols, axis = 1)
-
-            meetLocations = groupByDF(['MeetCountry','MeetState','MeetTown'])
-            joinColsLeft = ['MeetCountry']
-            countries,deleteCols = readAndPop (MeetCountry,joinColsLeft)
-            meetLocations = meetLocations.merge(countries, left_on = joinColsLeft, right_on = ['name'],suffixes = [None,"country_"])
-            meetLocations = meetLocations.drop(deleteCols, axis = 1)
-            renamer =  {k : k[4:].lower() for k in list(meetLocations) if k[:4] == 'Meet'}
-            renamer["id"] = "country_id"
-            meetLocations = meetLocations.rename (columns = renamer)
-            with db.Session() as session:
-                createData (ObjectNameDestination = MeetLocation
-                           ,dataObject            = meetLocations
-                           ,session               = session
-                           ,colMappings           = None
-                           ,commit                = True
-                           )
+        tables = set(inspect(db.engine).get_table_names())
+        if not all([t.name in tables for t in Base.metadata.sorted_tables]) or dataCommit.__tablename__ not in tables:
+            return False
+        with db.Session() as session:
+            if not session.query(dataCommit).filter(dataCommit.loaded.isnot(None)).count():
+                return False
+            return session.execute(text(f'SELECT COUNT(*) FROM {MeetDigest.__tablename__}')).scalar() > 0
+    finally:
+        db.dispose()
 
-            joinColsLeft = ['MeetCountry','MeetState','MeetTown']
-            meetLocations,deleteCols = readAndPop (MeetLocationsView,joinColsLeft)
-            df = df.merge(meetLocations, left_on = joinColsLeft, right_on = ['country','state','town'])
-            df = df.rename (columns = {'id': 'location_id'})
-            df = df.drop(deleteCols, axis = 1)
+def copyLiveDatabase(filepath : Path = buildDBfilepath):
+    """
+        A consistent copy of the live database, for the incremental load to work on
+    """
+    source = sqlite3.connect(str(dataDBfilepath))
+    target = sqlite3.connect(str(filepath))
+    try:
+        source.backup(target)
+    finally:
+        target.close()
+        source.close()
 
-            with db.Session() as session:
-                createData (ObjectNameDestination = Result
-                           ,dataObject            = df
-                           ,session               = session
-                           ,colMappings           = {"Name": "name"
-                                                    ,"Age": "age"
-                                                    ,"AgeClass": "age_class"
-                                                    ,"BirthYearClass": "birth_year_class"
-                                                    ,"Bodyweight": "body_weight "
-                                                    ,"Squat1": "squat_1"
-                                                    ,"Squat2": "squat_2"
-                                                    ,"Squat3": "squat_3"
-                                                    ,"Squat4": "squat_4"
-                                                    ,"Best3Squat": "squat_best_3"
-                                                    ,"Bench1": "bench_1"
-                                                    ,"Bench2": "bench_2"
-                                                    ,"Bench3": "bench_3"
-                                                    ,"Bench4": "bench_4"
-                                                    ,"Best3Bench": "bench_best_3"
-                                                    ,"Deadlift1": "deadlift_1"
-                                                    ,"Deadlift2": "deadlift_2"
-                                                    ,"Deadlift3": "deadlift_3"
-                                                    ,"Deadlift4": "deadlift_4"
-                                                    ,"Best3Deadlift": "deadlift_best_3"
-                                                    ,"Total": "total"
-                                                    ,"Place": "place"
-                                                    ,"Dots": "dots"
-                                                    ,"Wilks": "wilks"
-                                                    ,"Glossbrenner": "glossbrenner"
-                                                    ,"Goodlift": "goodlift"
-                                                    ,"Tested": "tested"
-                                                    ,"Country": "country"
-                                                    ,"State": "state"
-                                                    ,"Date": "date"
-                                                    ,"MeetName": "meet_name"
-                                                    }
-                           ,commit                = True
-                           )
+def loadInto(backend : OutputBackend, commitGUID, options : LoadOptions):
+    """
+        The backend's schema, dimensions, results (in memory, chunked or parallel, per the options) and views
+    """
+    backend.createSchema()
+    if options.workers > 1:
+        loadParallel(backend, commitGUID, options)
+    elif options.memoryLimitMB:
+        loadChunked(backend, commitGUID, options)
+    else:
+        loadInMemory(backend, commitGUID, options)
+    backend.createViews()
 
-        LoadBase.metadata.drop_all(db.engine)
+def buildDuckDB(commitGUID, options : LoadOptions, filepath : Path = duckDBfilepath):
+    """
+        A full load into a duckdb database, built alongside filepath and renamed over it once complete
+        The sqlite only parts (incremental loads, rollups, search, results_flat, the export) aren't done
+        Returns the number of results
+    """
+    building = filepath.with_name(f'{filepath.name}.building')
+    removeDatabase(building)
+    backend = DuckDBBackend(building)
+    try:
+        loadInto(backend, commitGUID, options)
+        rows = backend.recordCommit(commitGUID)
+        backend.close()
+    except:
+        backend.close()
+        removeDatabase(building)
+        raise
+    with stage('swap'):
+        os.replace(building, filepath)
+    return rows
+
+def duckDBLoaded(commitGUID, filepath : Path = duckDBfilepath):
+    """
+        True if this commit is the one in the duckdb database
+    """
+    if not filepath.is_file():
+        return False
+    conn = importDuckDB().connect(str(filepath), read_only = True)
+    try:
+        row = conn.execute (f'SELECT "rowCount", (SELECT COUNT(*) FROM "{Result.__tablename__}") FROM "{dataCommit.__tablename__}" WHERE "commitGUID" = ?', [commitGUID]).fetchone()
+    except Exception:
+        return False
+    finally:
+        conn.close()
+    return bool(row and row[0] == row[1])
+
+def buildSnapshot(engineURI, commitGUID, options : LoadOptions):
+    """
+        A full load, from scratch, into engineURI
+    """
+    try:
+        db = DB (engineURI, profile = 'load')
+        backend = SQLiteBackend(db)
+        loadInto(backend, commitGUID, options)
+
+        if options.rollups:
+            # before the indexes, so they aren't maintained row by row
+            print (f"{datetime.now()} : Building the lifter rollups")
+            with stage('rollups') as thisStage:
+                thisStage.rows += buildRollups(db)
+
+        print (f"{datetime.now()} : Creating indexes")
+        with stage('indexes'):
+            backend.createIndexes()
+        with stage('foreign key check'):
+            checkForeignKeys(db.engine)
+        with stage('search') as thisStage:
+            thisStage.rows += buildSearch(db)
+        with stage('materialize') as thisStage:
+            thisStage.rows += materializeResults(db, options.materialize) or 0
 
     finally:
         if db:
             db.dispose()
 
+def buildIncremental(commitGUID, options : LoadOptions):
+    """
+        The previous load, copied from the live database, brought up to this commit
+    """
+    with stage('copy'):
+        copyLiveDatabase()
+    try:
+        db = DB (buildEngineURI, profile = 'load')
+        loadIncremental(db, commitGUID, options)
+        with stage('rollups') as thisStage:
+            # recomputed in full, they depend on every lifter's whole history
+            indexes = dropIndexes(Base.metadata, db.engine, [t.__table__ for t in ROLLUP_TABLES])
+            if options.rollups:
+                thisStage.rows += buildRollups(db)
+            else:
+                with db.connect() as conn:
+                    for table in ROLLUP_TABLES:
+                        conn.execute (text(f'DELETE FROM {table.__tablename__}'))
+                    conn.commit()
+            createIndexes(indexes, db.engine)
+        with stage('foreign key check'):
+            checkForeignKeys(db.engine)
+        with stage('search') as thisStage:
+            thisStage.rows += buildSearch(db)
+        with stage('materialize') as thisStage:
+            thisStage.rows += materializeResults(db, options.materialize) or 0
+    finally:
+        if db:
+            db.dispose()
+
+def snapshotDifferences(filepathA : Path, filepathB : Path):
+    """
+        How two loads differ, in terms of what they hold rather than the ids they hold it under :
+        v_results as a multiset of rows, and each dimension's values with a non-zero resultCnt
+        Returns a list of the differences, empty if they match
+    """
+    differences = []
+    contents    = []
+    for filepath in [filepathA, filepathB]:
+        with sqlite3.connect(str(filepath)) as conn:
+            thisContents = {'v_results' : pd.read_sql_query(f'SELECT * FROM {ResultView.__tablename__}', conn)}
+            for dim, (table, colMappings, idName) in DIMENSION_TABLES.items():
+                cols = [c.name for c in table.__table__.columns if not (c.name == 'id' or c.name.endswith('_id'))]
+                thisContents[dim] = pd.read_sql_query(f'SELECT {", ".join(cols)} FROM "{table.__tablename__}" WHERE resultCnt > 0', conn)
+        contents.append(thisContents)
+
+    a, b = contents
+    for name in a:
+        if not len(a[name]) == len(b[name]):
+            differences.append(f"{name} : {len(a[name])} rows against {len(b[name])}")
+        elif not int(pd.util.hash_pandas_object(a[name], index = False).sum()) == int(pd.util.hash_pandas_object(b[name], index = False).sum()):
+            differences.append(f"{name} : contents differ")
+    return differences
+
+def checkAgainstFullLoad(commitGUID, options : LoadOptions):
+    """
+        Builds a full load alongside the incremental one and raises if they differ
+    """
+    with tempfile.TemporaryDirectory(prefix = 'opl_check_', dir = dataDBfilepath.parent) as tmpDir:
+        fullPath = Path(tmpDir).joinpath('full.sqlite')
+        buildSnapshot(f"sqlite:///{fullPath}", commitGUID, options)
+        differences = snapshotDifferences(buildDBfilepath, fullPath)
+    if differences:
+        raise Exception (f"Incremental load doesn't match a full load : {differences}")
+    print (f"{datetime.now()} : Incremental load matches a full load")
+
+def loadTheLatestData(commitGUID, options : LoadOptions = None):
+    """
+        This loads the data from the local zip file
+        With a memoryLimitMB the load is done in chunks, otherwise the whole file is loaded in one go
+        Incrementally, only the meets which changed since the previous load are applied to a copy of it
+        The load is built in a new file alongside the live database, which is swapped in once it is complete
+    """
+    options = options or LoadOptions()
+
+    if options.backend == 'duckdb':
+        if options.incremental or options.materialize or options.export:
+            raise Exception ("--incremental, --materialize and --export are only for the sqlite backend")
+        instrument.current.info['mode'] = 'duckdb'
+        rows = buildDuckDB(commitGUID, options)
+        print (f"{datetime.now()} : {duckDBfilepath} swapped in, {rows} results")
+        saveLoadReport(commitGUID)
+        return
+
+    removeDatabase(buildDBfilepath)
+    try:
+        if options.incremental and canLoadIncrementally():
+            instrument.current.info['mode'] = 'incremental'
+            buildIncremental(commitGUID, options)
+            if options.checkIncremental:
+                with (stage('incremental check')
+                     ,instrument.aside()
+                     ):
+                    checkAgainstFullLoad(commitGUID, options)
+        else:
+            instrument.current.info['mode'] = 'parallel' if options.workers > 1 else 'chunked' if options.memoryLimitMB else 'in memory'
+            buildSnapshot(buildEngineURI, commitGUID, options)
+            with stage('commit history'):
+                copyCommitHistory()
+        markLoaded(commitGUID, buildEngineURI)
+        with stage('optimize'):
+            optimizeSnapshot(options)
+        with stage('verify'):
+            verifySnapshot(commitGUID)
+    except:
+        removeDatabase(buildDBfilepath)
+        raise
+
+    with stage('swap'):
+        swapInSnapshot()
+    print (f"{datetime.now()} : {dataDBfilepath} swapped in")
+    if options.export:
+        # of the live database, a failed export leaves the load in place
+        with stage('export') as thisStage:
+            thisStage.rows += exportColumnar(commitGUID)
+    saveLoadReport(commitGUID)
+
+def exportColumnar(commitGUID, dbPath : Path = dataDBfilepath, exportDir : Path = EXPORT_PATH):
+    """
+        Writes the result table and the dimensions as parquet, see columnar.exportDatabase
+        Returns the number of results exported
+    """
+    if not columnar.available():
+        print (f"{datetime.now()} : pyarrow isn't installed, skipping the columnar export")
+        return 0
+    manifest = columnar.exportDatabase (dbPath          = dbPath
+                                       ,exportDir       = exportDir
+                                       ,commitGUID      = commitGUID
+                                       ,factTable       = Result.__tablename__
+                                       ,dimensionTables = [table.__tablename__ for table, colMappings, idName in DIMENSION_TABLES.values()]
+                                       )
+    print (f"{datetime.now()} : Exported {commitGUID} to {exportDir.joinpath(commitGUID)} ({sum([t['bytes'] for t in manifest['tables'].values()]) / 2**20:,.1f}MB)")
+    return manifest['tables'][Result.__tablename__]['rows']
+
+def saveLoadReport(commitGUID, report : instrument.LoadReport = None):
+    """
+        Stores the json load report against this commit's dataCommit row
+        Returns the report as a dict
+    """
+    report = report or instrument.current
+    report.info['commitGUID'] = commitGUID
+    asDict = report.asDict()
+    try:
+        db = DB ()
+        with db.Session() as session:
+            thisCommit = session.query(dataCommit).filter_by(commitGUID=commitGUID).one()
+            asDict['rows'] = thisCommit.rowCount
+            thisCommit.loadReport = json.dumps(asDict, indent = 2)
+            session.commit()
+    finally:
+        db.dispose()
+    return asDict
+
+
+def parseArgs(args = None):
+    parser = argparse.ArgumentParser(description = "Loads the latest openpowerlifting.org csv data into a sqlite DB")
+    parser.add_argument('--force', action = 'store_true', help = 'rebuild the database even if this commit is already loaded')
+    parser.add_argument('--download-chunk-size', type = int, default = DOWNLOAD_CHUNK_SIZE, metavar = 'BYTES', help = 'size of the chunks the zip is downloaded in')
+    parser.add_argument('--memory-limit', type = int, default = None, metavar = 'MB', help = 'load in chunks, sized to keep the working set under this many MB')
+    parser.add_argument('--writer', choices = ['pipeline','bulk','orm'], default = 'pipeline', help = 'how the result rows are inserted : raw executemany batches on a writer thread (default), raw executemany batches or ORM bulk_insert_mappings')
+    parser.add_argument('--workers', type = int, default = 1, metavar = 'N', help = 'parse and transform the csv in N processes (which neither read nor fill the parsed csv cache)')
+    parser.add_argument('--incremental', action = 'store_true', help = 'only apply the meets which changed since the previous load (falls back to a full load if there isn\'t one), in chunks with --memory-limit, in this process whatever --workers')
+    parser.add_argument('--check-incremental', action = 'store_true', help = 'with --incremental, also do a full load and check they match before swapping in')
+    parser.add_argument('--no-cache', action = 'store_true', help = 'neither read nor fill the parsed csv cache')
+    parser.add_argument('--cache-limit', type = int, default = PARSED_CACHE_LIMIT_MB, metavar = 'MB', help = 'evict the least recently used parsed csv cache entries beyond this many MB')
+    parser.add_argument('--vacuum', action = 'store_true', help = 'VACUUM the new database before it goes live')
+    parser.add_argument('--page-size', type = int, default = None, choices = [2 ** i for i in range(9, 17)], metavar = 'BYTES', help = 'rebuild the new database with this sqlite page size (512 to 65536), implies --vacuum')
+    parser.add_argument('--materialize', action = 'store_true', help = 'also copy v_results into the results_flat table (csv column names, no joins to read it)')
+    parser.add_argument('--no-rollups', action = 'store_true', help = 'leave the lifter, personal_best and category_rank rollup tables empty')
+    parser.add_argument('--report', type = Path, default = None, metavar = 'PATH', help = 'also write the json load report to this file (it is always stored in dataCommit.loadReport)')
+    parser.add_argument('--profile-stage', default = None, metavar = 'STAGE', help = 'profile this stage of the load (e.g. parse, "fact insert"), the results go in the load report')
+    parser.add_argument('--profiler', choices = instrument.PROFILERS, default = 'cprofile', help = 'how --profile-stage is profiled; cprofile also writes profile-<stage>.prof for pstats/snakeviz')
+    parser.add_argument('--compact', action = 'store_true', help = 'hold the csv with categoricals for the low cardinality text columns and float32 where no precision is lost, to use less memory')
+    parser.add_argument('--export', action = 'store_true', help = f'also write the results & dimensions as parquet, partitioned by year, to {EXPORT_PATH}/<commit> (needs pyarrow)')
+    parser.add_argument('--backend', choices = BACKENDS, default = 'sqlite', help = f'load into {dataDBfilepath.name} (default) or, needing duckdb, {duckDBfilepath.name} (without the sqlite only rollups, search, incremental loads, ...)')
+    parser.add_argument('--extract', action = 'store_true', help = 'extract the csv to a temporary file and read it with dask, rather than streaming it out of the zip')
+    args = parser.parse_args(args)
+    if args.incremental and args.workers > 1:
+        print (f"{datetime.now()} : --workers only applies if --incremental falls back to a full load, the incremental load itself is done in this process")
+    return args
 
-def main():
+def main(args = None):
     """
         Main entry point of program
     """
-    thisGUID = getTheLatestData()
-    loadTheLatestData(thisGUID)
+    args = parseArgs(args)
+    instrument.begin (profileStage = args.profile_stage
+                     ,profiler     = args.profiler
+                     ,profilePath  = DATA_PATH.joinpath(f"profile-{args.profile_stage.replace(' ', '_')}.prof") if args.profile_stage else None
+                     )
+    thisGUID = getTheLatestData(chunkSize = args.download_chunk_size)
+    if not args.force and (duckDBLoaded(thisGUID) if args.backend == 'duckdb' else isLoaded(thisGUID)):
+        print (f"{datetime.now()} : {thisGUID} already loaded, nothing to do (use --force to rebuild)")
+        return
+    loadTheLatestData(thisGUID, LoadOptions(streamZip     = not args.extract
+                                           ,memoryLimitMB = args.memory_limit
+                                           ,writer        = args.writer
+                                           ,useCache      = not args.no_cache
+                                           ,cacheLimitMB  = args.cache_limit
+                                           ,workers       = args.workers
+                                           ,incremental   = args.incremental
+                                           ,checkIncremental = args.check_incremental
+                                           ,vacuum        = args.vacuum
+                                           ,pageSize      = args.page_size
+                                           ,materialize   = args.materialize
+                                           ,rollups       = not args.no_rollups
+                                           ,compact       = args.compact
+                                           ,export        = args.export
+                                           ,backend       = args.backend
+                                           ))
+    if args.report:
+        args.report.write_text(instrument.current.asJSON())
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,455 @@
+#!/usr/bin/env python3
+
+from pprint import pprint as print
+import app
+import instrument
+import argparse
+import json
+import numpy                           as np
+import os
+import re
+import readapi
+import subprocess
+import sys
+import synthetic
+import tempfile
+import threading
+import time
+import urllib.parse
+import urllib.request
+from   datetime       import datetime
+from   pathlib        import Path
+from   sqlalchemy     import text
+
+def timedLoad(loader, options : app.LoadOptions):
+    """
+        Runs one of the app.load* stages into a throwaway database
+        Returns (seconds, result rows)
+    """
+    with tempfile.TemporaryDirectory(prefix = 'opl_bench_') as tmpDir:
+        db = app.DB (f"sqlite:///{Path(tmpDir).joinpath('bench.sqlite')}", profile = 'load')
+        try:
+            backend = app.SQLiteBackend(db)
+            backend.createSchema()
+            started = time.perf_counter()
+            loader(backend, None, options)
+            elapsed = time.perf_counter() - started
+            with db.connect() as conn:
+                rows = conn.execute (text(f'SELECT COUNT(*) FROM {app.Result.__tablename__}')).scalar()
+        finally:
+            db.dispose()
+    return (elapsed, rows)
+
+def benchWorkers(workerCounts : list):
+    """
+        Parallel load scaling over the local zip, for each number of workers
+    """
+    results = []
+    for workers in workerCounts:
+        elapsed, rows = timedLoad(app.loadParallel, app.LoadOptions(workers = workers))
+        results.append({'workers'  : workers
+                       ,'seconds'  : round(elapsed, 3)
+                       ,'rows'     : rows
+                       ,'rowsSec'  : round(rows / elapsed)
+                       ,'speedup'  : round(results[0]['seconds'] / elapsed, 2) if results else 1.0
+                       })
+        print (f"{datetime.now()} : {results[-1]}")
+    return results
+
+BENCH_ROWS      : list = [100000, 1000000, 5000000]
+SYNTHETIC_GUID  : str  = 'synthetic'
+
+def loadChild(reportPath : Path, options : app.LoadOptions):
+    """
+        Runs in the child process, with OPL_DATA_PATH pointing app at a synthetic zip :
+        a full loadTheLatestData, as if the zip had just been downloaded, then its load report to reportPath
+    """
+    app.removeDatabase(app.dataDBfilepath)
+    try:
+        db = app.DB ()
+        app.CommitBase.metadata.create_all(db.engine)
+        with db.Session() as session:
+            thisCommit = app.dataCommit(SYNTHETIC_GUID, str(app.dataFilePath), datetime.now())
+            thisCommit.downloaded = datetime.now()
+            thisCommit.fileSize   = app.dataFilePath.stat().st_size
+            session.add(thisCommit)
+            session.commit()
+    finally:
+        db.dispose()
+    instrument.begin()
+    app.loadTheLatestData(SYNTHETIC_GUID, options)
+    reportPath.write_text(instrument.current.asJSON())
+
+def benchSynthetic(rowCounts : list, dataDir : Path, loadArgs : list, seed : int = 0):
+    """
+        End to end loads of synthetic zips of each number of rows, each in a process of its own so the peak RSS is its own
+        The zips are kept in dataDir (rows-<n>/latest.zip) and only generated if missing
+    """
+    results = []
+    for rows in rowCounts:
+        dataPath = dataDir.joinpath(f'rows-{rows}')
+        zipPath  = dataPath.joinpath('latest.zip')
+        if not zipPath.is_file():
+            synthetic.generate(rows, zipPath, seed)
+        reportPath = dataPath.joinpath('report.json')
+        started = time.perf_counter()
+        subprocess.run ([sys.executable, __file__, '--child', str(reportPath)] + loadArgs
+                       ,env   = {**os.environ, 'OPL_DATA_PATH' : str(dataPath)}
+                       ,check = True
+                       )
+        elapsed = time.perf_counter() - started
+        report  = json.loads(reportPath.read_text())
+        app.removeDatabase(dataPath.joinpath(app.dataDBfilepath.name))
+        results.append({'rows'     : rows
+                       ,'seconds'  : round(elapsed, 3)
+                       ,'rowsSec'  : round(rows / elapsed)
+                       ,'loadSeconds' : report['seconds']
+                       ,'peakRSS'  : report['peakRSS']
+                       ,'stages'   : {name : {k : thisStage[k] for k in ['seconds', 'rowsSec', 'peakRSS']} for name, thisStage in report['stages'].items()}
+                       })
+        print (f"{datetime.now()} : {rows} rows : {elapsed:.2f}s, {rows / elapsed:,.0f} rows/sec, peak RSS {(report['peakRSS'] or 0) / 2**20:,.0f}MB")
+        for name, thisStage in report['stages'].items():
+            print (f"{name:>20} : {thisStage['seconds']:9.3f}s {thisStage['rowsSec'] or '':>12} rows/sec {(thisStage['peakRSS'] or 0) / 2**20:8,.0f}MB")
+    return results
+
+# the common access patterns, and the parameters for them picked out of the database being queried
+QUERY_PARAMETERS : str  = f"""SELECT (SELECT name FROM {app.Result.__tablename__} GROUP BY name ORDER BY COUNT(*) DESC LIMIT 1)              AS name
+                                   ,(SELECT federation_id FROM {app.Result.__tablename__} GROUP BY federation_id ORDER BY COUNT(*) DESC LIMIT 1) AS federation_id
+                                   ,(SELECT name FROM {app.Federation.__tablename__} ORDER BY resultCnt DESC LIMIT 1)                        AS federation
+                                   ,(SELECT weightclass_id FROM {app.Result.__tablename__} GROUP BY weightclass_id, equipment_id, event_id ORDER BY COUNT(*) DESC LIMIT 1) AS weightclass_id
+                                   ,(SELECT equipment_id FROM {app.Result.__tablename__} GROUP BY weightclass_id, equipment_id, event_id ORDER BY COUNT(*) DESC LIMIT 1)   AS equipment_id
+                                   ,(SELECT event_id FROM {app.Result.__tablename__} GROUP BY weightclass_id, equipment_id, event_id ORDER BY COUNT(*) DESC LIMIT 1)       AS event_id
+                                   ,(SELECT id FROM {app.Meet.__tablename__} ORDER BY resultCnt DESC LIMIT 1)                                AS meet_id
+                                   ,(SELECT MAX(date) FROM {app.Result.__tablename__})                                                      AS date_to
+                                   ,(SELECT date(MAX(date), '-1 year') FROM {app.Result.__tablename__})                                     AS date_from
+                          """
+QUERIES          : dict = {'lifter history'      : f"SELECT * FROM {app.Result.__tablename__} WHERE name = :name ORDER BY date"
+                          ,'date range'          : f"SELECT COUNT(*), AVG(total) FROM {app.Result.__tablename__} WHERE date BETWEEN :date_from AND :date_to"
+                          ,'federation'          : f"SELECT COUNT(*) FROM {app.Result.__tablename__} WHERE federation_id = :federation_id AND date >= :date_from"
+                          ,'category top 10'     : f"SELECT name, dots FROM {app.Result.__tablename__} WHERE weightclass_id = :weightclass_id AND equipment_id = :equipment_id AND event_id = :event_id ORDER BY dots DESC LIMIT 10"
+                          ,'meet results'        : f"SELECT * FROM {app.Result.__tablename__} WHERE meet_id = :meet_id"
+                          ,'v_results lifter'    : f"SELECT * FROM {app.ResultView.__tablename__} WHERE Name = :name"
+                          ,'v_results federation': f"SELECT COUNT(*) FROM {app.ResultView.__tablename__} WHERE Federation = :federation"
+                          ,'ranked top 10'       : f"SELECT lifter_id, best_dots FROM {app.CategoryRank.__tablename__} WHERE weightclass_id = :weightclass_id AND equipment_id = :equipment_id AND federation_id = :federation_id AND event_id = :event_id AND rank_dots <= 10 ORDER BY rank_dots"
+                          ,'personal bests'      : f"SELECT p.* FROM {app.PersonalBest.__tablename__} p JOIN {app.Lifter.__tablename__} l ON l.id = p.lifter_id WHERE l.name = :name"
+                          ,'results_flat lifter' : f"SELECT * FROM {app.ResultFlat.__tablename__} WHERE Name = :name"
+                          ,'results_flat federation': f"SELECT COUNT(*) FROM {app.ResultFlat.__tablename__} WHERE Federation = :federation"
+                          }
+QUERY_REPEATS    : int  = 20
+
+def benchQueries(dbPath : Path, repeats : int = QUERY_REPEATS):
+    """
+        Times each of the QUERIES against the database, with its query plan, so it shows which indexes are used
+    """
+    results = []
+    with app.sqlite3.connect(f'file:{dbPath}?mode=ro', uri = True) as conn:
+        cursor = conn.execute(QUERY_PARAMETERS)
+        params = dict(zip([d[0] for d in cursor.description], cursor.fetchone()))
+        tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type IN ('table', 'view')")}
+        for name, sql in QUERIES.items():
+            if f'FROM {app.ResultFlat.__tablename__} ' in sql and not app.ResultFlat.__tablename__ in tables:
+                # only there with --materialize
+                continue
+            plan = [row[-1] for row in conn.execute(f'EXPLAIN QUERY PLAN {sql}', params)]
+            started = time.perf_counter()
+            for i in range(repeats):
+                rows = len(conn.execute(sql, params).fetchall())
+            elapsed = (time.perf_counter() - started) / repeats
+            results.append({'query' : name, 'ms' : round(elapsed * 1000, 3), 'rows' : rows, 'plan' : plan})
+            print (f"{datetime.now()} : {name} : {elapsed * 1000:.3f}ms, {rows} rows")
+            for step in plan:
+                print (f"        {step}")
+    return results
+
+def benchTypes():
+    """
+        Memory per column of the prepared frame of the local zip, with the plain and the compact typing,
+        and whether the compact frame holds the same values
+    """
+    frames = {}
+    for compact in [False, True]:
+        started = time.perf_counter()
+        frames[compact] = app.prepareFrame(app.readFrame(None, app.LoadOptions(useCache = False, compact = compact)))
+        print (f"{datetime.now()} : {'compact' if compact else 'plain'} : read in {time.perf_counter() - started:.2f}s")
+    plain, compact = (frames[False], frames[True])
+    plainBytes     = plain.memory_usage(deep = True, index = False)
+    compactBytes   = compact.memory_usage(deep = True, index = False)
+    results = []
+    for c in plain.columns:
+        results.append({'column' : c, 'plain' : int(plainBytes[c]), 'compact' : int(compactBytes[c]), 'dtype' : str(compact[c].dtype)})
+        print (f"{c:>16} : {plainBytes[c] / 2**20:9,.1f}MB -> {compactBytes[c] / 2**20:9,.1f}MB {str(compact[c].dtype):>10}")
+    print (f"{'total':>16} : {plainBytes.sum() / 2**20:9,.1f}MB -> {compactBytes.sum() / 2**20:9,.1f}MB")
+
+    widened = app.plainTypes(compact)
+    widened = widened.astype({c : np.float64 for c in widened.columns if widened[c].dtype == np.float32})
+    same    = widened.equals(plain)
+    print (f"{datetime.now()} : same values : {same}")
+    return {'columns' : results, 'sameValues' : same}
+
+# full table aggregations, in sqlite and over the columnar export : (sql, columns, what the scan is filtered on)
+COLUMNAR_QUERIES : dict = {'dots by year & federation'   : (f"SELECT strftime('%Y', date) AS year, federation_id, COUNT(dots), AVG(dots) FROM {app.Result.__tablename__} GROUP BY 1, 2"
+                                                           ,['federation_id', 'dots'], [])
+                          ,'v_results dots by year & federation' : (f"SELECT substr(Date, 1, 4) AS year, Federation, COUNT(Dots), AVG(Dots) FROM {app.ResultView.__tablename__} GROUP BY 1, 2"
+                                                           ,['federation_id', 'dots'], [])
+                          ,'dots by federation, one year' : (f"SELECT federation_id, COUNT(dots), AVG(dots) FROM {app.Result.__tablename__} WHERE date BETWEEN :year || '-01-01' AND :year || '-12-31' GROUP BY 1"
+                                                           ,['federation_id', 'dots'], ['year'])
+                          ,'one federation, one year'     : (f"SELECT COUNT(dots), AVG(dots) FROM {app.Result.__tablename__} WHERE federation_id = :federation_id AND date BETWEEN :year || '-01-01' AND :year || '-12-31'"
+                                                           ,['federation_id', 'dots'], ['year', 'federation_id'])
+                          }
+
+def scannedBytes(dataset, columns : list, filter = None):
+    """
+        The compressed bytes of columns in the row groups a scan with filter has to read, after partition & statistics pruning
+    """
+    total = 0
+    for fragment in dataset.get_fragments(filter = filter):
+        names = fragment.metadata.schema.names
+        for rowGroup in fragment.split_by_row_group(filter, schema = dataset.schema):
+            for info in rowGroup.row_groups:
+                meta   = fragment.metadata.row_group(info.id)
+                total += sum([meta.column(names.index(c)).total_compressed_size for c in columns if c in names])
+    return total
+
+def benchColumnar(exportDir : Path, dbPath : Path = app.dataDBfilepath, repeats : int = 5):
+    """
+        Times COLUMNAR_QUERIES in sqlite and over the columnar export (pyarrow), with the share of the export each scan reads
+    """
+    import pyarrow.dataset as ds
+    factPath   = exportDir.joinpath(app.Result.__tablename__)
+    dataset    = ds.dataset(factPath, format = 'parquet', partitioning = 'hive')
+    totalBytes = app.columnar.directoryBytes(factPath)
+    results    = []
+    with app.sqlite3.connect(f'file:{dbPath}?mode=ro', uri = True) as conn:
+        params = dict(zip(['year', 'federation_id'], conn.execute (f"""SELECT strftime('%Y', MAX(date))
+                                                                              ,(SELECT federation_id FROM {app.Result.__tablename__} GROUP BY 1 ORDER BY COUNT(*) DESC LIMIT 1)
+                                                                          FROM {app.Result.__tablename__}""").fetchone()))
+        for name, (sql, columns, filterOn) in COLUMNAR_QUERIES.items():
+            filter = None
+            for c in filterOn:
+                thisFilter = ds.field(c) == int(params[c])
+                filter     = thisFilter if filter is None else filter & thisFilter
+            started = time.perf_counter()
+            for i in range(repeats):
+                rows = len(conn.execute(sql, params).fetchall())
+            sqliteSeconds = (time.perf_counter() - started) / repeats
+            started = time.perf_counter()
+            for i in range(repeats):
+                table = dataset.to_table(columns = columns + ['year'], filter = filter)
+                table.group_by(['year', 'federation_id']).aggregate([('dots', 'count'), ('dots', 'mean')])
+            arrowSeconds = (time.perf_counter() - started) / repeats
+            scanned = scannedBytes(dataset, columns, filter)
+            results.append({'query' : name, 'rows' : rows, 'sqliteMs' : round(sqliteSeconds * 1000, 1), 'parquetMs' : round(arrowSeconds * 1000, 1), 'scannedBytes' : scanned, 'totalBytes' : totalBytes})
+            print (f"{datetime.now()} : {name} : sqlite {sqliteSeconds * 1000:,.1f}ms, parquet {arrowSeconds * 1000:,.1f}ms reading {scanned / 2**20:,.2f}MB of {totalBytes / 2**20:,.1f}MB ({100 * scanned / totalBytes:.1f}%)")
+    return results
+
+# the queries both backends can run as they are, over the tables every load has (no rollups, search or results_flat)
+BACKEND_QUERIES  : dict = {'lifter history'      : QUERIES['lifter history']
+                          ,'federation'          : QUERIES['federation']
+                          ,'meet results'        : QUERIES['meet results']
+                          ,'v_results lifter'    : QUERIES['v_results lifter']
+                          ,'v_results federation': QUERIES['v_results federation']
+                          ,'dots by year & federation'   : f"SELECT substr(CAST(date AS VARCHAR), 1, 4) AS year, federation_id, COUNT(dots), AVG(dots) FROM {app.Result.__tablename__} GROUP BY 1, 2"
+                          ,'v_results dots by year & federation' : f"SELECT substr(CAST(Date AS VARCHAR), 1, 4) AS year, Federation, COUNT(Dots), AVG(Dots) FROM {app.ResultView.__tablename__} GROUP BY 1, 2"
+                          }
+
+def buildBackend(name : str, path : Path, options : app.LoadOptions):
+    """
+        A full load of the local zip into a new database of the backend at path, as app.py would do it
+        (the sqlite one with its indexes, without the sqlite only rollups & search)
+        Returns (seconds, result rows)
+    """
+    started = time.perf_counter()
+    if name == 'duckdb':
+        backend = app.DuckDBBackend(path)
+        try:
+            app.loadInto(backend, None, options)
+            rows = backend.conn.execute (f'SELECT COUNT(*) FROM {app.Result.__tablename__}').fetchone()[0]
+        finally:
+            backend.close()
+        return (time.perf_counter() - started, rows)
+    db = app.DB (f"sqlite:///{path}", profile = 'load')
+    try:
+        backend = app.SQLiteBackend(db)
+        app.loadInto(backend, None, options)
+        backend.createIndexes()
+        with db.connect() as conn:
+            rows = conn.execute (text(f'SELECT COUNT(*) FROM {app.Result.__tablename__}')).scalar()
+    finally:
+        db.dispose()
+    return (time.perf_counter() - started, rows)
+
+def backendQueries(name : str, path : Path, params : dict, repeats : int):
+    """
+        BACKEND_QUERIES against one backend's database, ms per query
+    """
+    if name == 'duckdb':
+        conn  = app.importDuckDB().connect(str(path), read_only = True)
+        # duckdb's named parameters are $name
+        run   = lambda sql : conn.execute(re.sub(r':(\w+)', r'$\1', sql), {k : params[k] for k in re.findall(r':(\w+)', sql)}).fetchall()
+    else:
+        conn  = app.sqlite3.connect(f'file:{path}?mode=ro', uri = True)
+        run   = lambda sql : conn.execute(sql, params).fetchall()
+    timings = {}
+    try:
+        for query, sql in BACKEND_QUERIES.items():
+            run(sql)
+            started = time.perf_counter()
+            for i in range(repeats):
+                rows = len(run(sql))
+            timings[query] = {'ms' : round((time.perf_counter() - started) / repeats * 1000, 3), 'rows' : rows}
+    finally:
+        conn.close()
+    return timings
+
+def benchBackends(options : app.LoadOptions, repeats : int = 5):
+    """
+        Loads the local zip into each of app.BACKENDS, then times BACKEND_QUERIES against each, with the same parameters
+    """
+    results = {}
+    with tempfile.TemporaryDirectory(prefix = 'opl_backends_') as tmpDir:
+        paths = {name : Path(tmpDir).joinpath(f'bench.{name}') for name in app.BACKENDS}
+        for name, path in paths.items():
+            elapsed, rows = buildBackend(name, path, options)
+            results[name] = {'loadSeconds' : round(elapsed, 3), 'rows' : rows, 'bytes' : path.stat().st_size}
+            print (f"{datetime.now()} : {name} : loaded {rows} results in {elapsed:.2f}s, {path.stat().st_size / 2**20:,.1f}MB")
+        with app.sqlite3.connect(f"file:{paths['sqlite']}?mode=ro", uri = True) as conn:
+            cursor = conn.execute(QUERY_PARAMETERS)
+            params = dict(zip([d[0] for d in cursor.description], cursor.fetchone()))
+        for name, path in paths.items():
+            results[name]['queries'] = backendQueries(name, path, params, repeats)
+    for query in BACKEND_QUERIES:
+        print (f"{query:>36} : " + ", ".join([f"{name} {results[name]['queries'][query]['ms']:,.1f}ms ({results[name]['queries'][query]['rows']} rows)" for name in results]))
+    return results
+
+# the read service workload : the share of each lookup, the number of lifters & categories drawn from (the most
+# frequent first, with a 1 / rank skew, as the popular lifters are asked for the most)
+READ_MIX         : dict = {'lifter' : 0.7, 'rankings' : 0.2, 'bests' : 0.1}
+READ_LIFTERS     : int  = 1000
+READ_CATEGORIES  : int  = 200
+READ_REQUESTS    : int  = 5000
+
+def readWorkload(dbPath : Path, requests : int = READ_REQUESTS, seed : int = 0):
+    """
+        requests (query, parameters) for the read service, drawn from the database
+    """
+    with app.sqlite3.connect(f'file:{dbPath}?mode=ro', uri = True) as conn:
+        names      = [row[0] for row in conn.execute (f'SELECT name FROM {app.Lifter.__tablename__} ORDER BY resultCnt DESC, name LIMIT ?', (READ_LIFTERS,))]
+        categories = [dict(zip(['sex', 'weightClass', 'equipment', 'event', 'federation'], row))
+                      for row in conn.execute (f"""SELECT w.sex, w.weight_class, e.name, v.name, f.name
+                                                     FROM {app.CategoryRank.__tablename__} r
+                                                     JOIN {app.SexWeight.__tablename__} w ON w.id = r.weightclass_id
+                                                     JOIN {app.Equipment.__tablename__} e ON e.id = r.equipment_id
+                                                     JOIN {app.Event.__tablename__} v ON v.id = r.event_id
+                                                     JOIN {app.Federation.__tablename__} f ON f.id = r.federation_id
+                                                    GROUP BY r.weightclass_id, r.equipment_id, r.event_id, r.federation_id
+                                                    ORDER BY COUNT(*) DESC
+                                                    LIMIT ?""", (READ_CATEGORIES,))]
+    rng = np.random.default_rng(seed)
+    def skewed(values, n):
+        weights = 1 / np.arange(1, len(values) + 1)
+        return [values[i] for i in rng.choice(len(values), size = n, p = weights / weights.sum())]
+    queries  = rng.choice(list(READ_MIX), size = requests, p = list(READ_MIX.values()))
+    lifters  = iter(skewed(names, requests))
+    ranked   = iter(skewed(categories, requests))
+    workload = []
+    for query in queries:
+        if query == 'rankings':
+            workload.append((query, {k : v for k, v in next(ranked).items() if v is not None}))
+        else:
+            workload.append((query, {'name' : next(lifters)}))
+    return workload
+
+def benchReadAPI(dbPath : Path, requests : int = READ_REQUESTS, clients : int = 4, seed : int = 0):
+    """
+        The readWorkload through the read service's http endpoint by clients threads, without and with its cache,
+        with the service's hit rate & latency percentiles and those the clients saw
+    """
+    workload = readWorkload(dbPath, requests, seed)
+    results  = {}
+    for cacheRows in [0, readapi.CACHE_ROWS]:
+        service = readapi.ReadService(dbPath, clients, cacheRows)
+        server  = readapi.serve(service, port = 0)
+        threading.Thread(target = server.serve_forever, daemon = True).start()
+        baseURL = f'http://127.0.0.1:{server.server_address[1]}'
+        seen    = [[] for c in range(clients)]
+        def client(c):
+            for query, params in workload[c::clients]:
+                started = time.perf_counter()
+                with urllib.request.urlopen(f'{baseURL}/{query}?{urllib.parse.urlencode(params)}') as response:
+                    response.read()
+                seen[c].append((time.perf_counter() - started) * 1000)
+        started = time.perf_counter()
+        threads = [threading.Thread(target = client, args = (c,)) for c in range(clients)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+        server.shutdown()
+        server.server_close()
+        service.close()
+        stats   = service.stats()
+        stats['clientMs']    = {p : round(ms, 3) for p, ms in readapi.percentiles([ms for samples in seen for ms in samples]).items()}
+        stats['requestsSec'] = round(requests / elapsed)
+        results['cached' if cacheRows else 'uncached'] = stats
+        print (f"{datetime.now()} : {'cache of ' + str(cacheRows) + ' rows' if cacheRows else 'no cache'} : {requests / elapsed:,.0f} requests/sec, hit rate {stats['cache']['hitRate'] or 0:.1%}")
+        for query, latency in stats['latencyMs'].items():
+            print (f"{query:>12} : {latency['count']:6} " + " ".join([f"{p} {ms:8.3f}ms" for p, ms in latency.items() if p != 'count']))
+        print (f"{'client':>12} : {requests:6} " + " ".join([f"{p} {ms:8.3f}ms" for p, ms in stats['clientMs'].items()]))
+    return results
+
+def parseArgs(args = None):
+    parser = argparse.ArgumentParser(description = "Load benchmarks, against the local zip")
+    parser.add_argument('--workers', type = int, nargs = '+', default = [1, 2, 4, 8, 16], metavar = 'N', help = 'worker counts for the parallel load scaling benchmark')
+    parser.add_argument('--json', type = Path, default = None, help = 'also write the results to this file')
+    parser.add_argument('--rows', type = int, nargs = '*', default = None, metavar = 'N', help = f'instead, end to end loads of synthetic zips of N rows (default {" ".join(map(str, BENCH_ROWS))})')
+    parser.add_argument('--data-dir', type = Path, default = None, help = 'where the synthetic zips are generated and kept (default a temporary directory)')
+    parser.add_argument('--seed', type = int, default = 0, help = 'synthetic data seed')
+    parser.add_argument('--queries', type = Path, nargs = '?', const = app.dataDBfilepath, default = None, metavar = 'DB', help = f'instead, time the common queries, with their query plans, against DB (default {app.dataDBfilepath.name})')
+    parser.add_argument('--dtypes', action = 'store_true', help = 'instead, memory per column of the local zip read with the plain and the --compact typing')
+    parser.add_argument('--columnar', type = Path, default = None, metavar = 'EXPORT', help = f'instead, time full table aggregations in the database against its --export, e.g. {app.EXPORT_PATH}/<commit>')
+    parser.add_argument('--backends', action = 'store_true', help = f'instead, load the local zip into each of {", ".join(app.BACKENDS)} and time the same queries against each')
+    parser.add_argument('--read-api', type = Path, nargs = '?', const = app.dataDBfilepath, default = None, metavar = 'DB', help = f'instead, replay a skewed lifter / ranking workload through readapi.py against DB (default {app.dataDBfilepath.name}), without and with its cache')
+    parser.add_argument('--child', type = Path, default = None, help = argparse.SUPPRESS)
+    args, loadArgs = parser.parse_known_args(args)
+    # anything else is passed on to the synthetic loads as app.py arguments, e.g. --memory-limit 512
+    args.loadArgs = loadArgs
+    return args
+
+def childOptions(loadArgs : list):
+    appArgs = app.parseArgs(loadArgs)
+    return app.LoadOptions (streamZip     = not appArgs.extract
+                           ,memoryLimitMB = appArgs.memory_limit
+                           ,writer        = appArgs.writer
+                           ,useCache      = False
+                           ,workers       = appArgs.workers
+                           ,compact       = appArgs.compact
+                           ,export        = appArgs.export
+                           ,backend       = appArgs.backend
+                           )
+
+def main(args = None):
+    args = parseArgs(args)
+    if args.child:
+        loadChild(args.child, childOptions(args.loadArgs))
+        return
+    if args.queries:
+        results = {'queries' : benchQueries(args.queries)}
+    elif args.columnar:
+        results = {'columnar' : benchColumnar(args.columnar)}
+    elif args.dtypes:
+        results = {'dtypes' : benchTypes()}
+    elif args.read_api:
+        results = {'readAPI' : benchReadAPI(args.read_api, seed = args.seed)}
+    elif args.backends:
+        results = {'backends' : benchBackends(childOptions(args.loadArgs))}
+    elif args.rows is not None:
+        with tempfile.TemporaryDirectory(prefix = 'opl_synthetic_') as tmpDir:
+            results = {'synthetic' : benchSynthetic(args.rows or BENCH_ROWS, args.data_dir or Path(tmpDir), args.loadArgs, args.seed)}
+    else:
+        results = {'workers' : benchWorkers(args.workers)}
+    if args.json:
+        args.json.write_text(json.dumps(results, indent = 2))
+
+if __name__ == "__main__":
+    main()
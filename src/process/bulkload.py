@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+
+import pandas                          as pd
+from   sqlalchemy     import Date, DateTime
+import queue
+import threading
+import time
+
+BULK_BATCH_ROWS        : int = 50000
+PIPELINE_QUEUE_BATCHES : int = 4
+
+# how SQLAlchemy's sqlite dialect stores dates, so rows written either way look the same
+DATE_FORMATS    : dict = {Date     : '%Y-%m-%d'
+                         ,DateTime : '%Y-%m-%d %H:%M:%S.%f'
+                         }
+
+def batchTuples(batch, dateFormats : dict):
+    """
+        The rows of the batch as plain python tuples, NaN/NaT become None
+    """
+    batch = batch.copy()
+    for c, fmt in dateFormats.items():
+        batch[c] = pd.to_datetime(batch[c]).dt.strftime(fmt)
+    batch = batch.astype(object)
+    batch = batch.where(pd.notna(batch), None)
+    return batch.itertuples(index = False, name = None)
+
+def insertStatement(table, columns : list, paramstyle : str):
+    placeholder = '?' if paramstyle == 'qmark' else '%s'
+    return f'INSERT INTO {table.name} ({", ".join(columns)}) VALUES ({", ".join([placeholder] * len(columns))})'
+
+def frameBatches (table
+                 ,df
+                 ,paramstyle  : str
+                 ,colMappings : dict = None
+                 ,batchRows   : int  = BULK_BATCH_ROWS
+                 ):
+    """
+        The frame as (sql, rows) insert batches of batchRows plain tuples
+        Columns (after colMappings) which aren't in the table are ignored, as bulk_insert_mappings does
+    """
+    sourceOf    = {v : k for k, v in (colMappings or {}).items()}
+    columns     = [c.name for c in table.columns if sourceOf.get(c.name, c.name) in df.columns]
+    sources     = [sourceOf.get(c, c) for c in columns]
+    dateFormats = {s : DATE_FORMATS[type(table.c[c].type)] for c, s in zip(columns, sources) if type(table.c[c].type) in DATE_FORMATS}
+    sql         = insertStatement(table, columns, paramstyle)
+
+    for start in range(0, len(df), batchRows):
+        batch = df.iloc[start:start + batchRows][sources]
+        yield (sql, list(batchTuples(batch, dateFormats)))
+
+def bulkInsertFrame (engine
+                    ,table
+                    ,df
+                    ,colMappings : dict = None
+                    ,batchRows   : int  = BULK_BATCH_ROWS
+                    ):
+    """
+        Inserts the frame into table with executemany on the raw DBAPI connection, batchRows tuples at a time
+        Returns the number of rows inserted
+    """
+    conn = engine.raw_connection()
+    try:
+        cursor = conn.cursor()
+        for sql, rows in frameBatches(table, df, engine.dialect.paramstyle, colMappings, batchRows):
+            cursor.executemany(sql, rows)
+        cursor.close()
+        conn.commit()
+    except:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+    return len(df)
+
+class PipelinedWriter ():
+    """
+        A writer thread, holding the only connection, fed prepared insert batches through a bounded queue
+        The caller prepares the next batch while the previous one is being written; a full queue holds the caller
+        back, so memory stays flat. Everything goes in as one transaction, committed by close()
+    """
+    def __init__ (self, engine, queueBatches : int = PIPELINE_QUEUE_BATCHES):
+        self.engine          = engine
+        self.queue           = queue.Queue(maxsize = queueBatches)
+        self.rows            = 0
+        self.producerBlocked = 0.0 # caller waiting on a full queue
+        self.writerBlocked   = 0.0 # writer waiting on an empty queue
+        self.writerBusy      = 0.0 # writer in executemany
+        self.error           = None
+        self.thread          = threading.Thread(target = self.run, name = 'sqlite-writer', daemon = True)
+        self.thread.start()
+
+    def run (self):
+        conn        = None
+        sawSentinel = False
+        try:
+            conn   = self.engine.raw_connection()
+            cursor = conn.cursor()
+            while True:
+                started = time.perf_counter()
+                item = self.queue.get()
+                self.writerBlocked += time.perf_counter() - started
+                if item is None:
+                    sawSentinel = True
+                    break
+                sql, rows = item
+                started = time.perf_counter()
+                cursor.executemany(sql, rows)
+                self.writerBusy += time.perf_counter() - started
+                self.rows += len(rows)
+            cursor.close()
+            conn.commit()
+        except BaseException as e:
+            self.error = e
+            if conn:
+                try:
+                    conn.rollback()
+                except:
+                    # e is the error worth reporting
+                    ...
+            # keep taking batches so the caller doesn't block on a full queue, until close()
+            # (unless it already has, a failed commit comes after the last of them)
+            while not sawSentinel:
+                sawSentinel = self.queue.get() is None
+        finally:
+            if conn:
+                conn.close()
+
+    def put (self, sql : str, rows : list):
+        if self.error:
+            raise self.error
+        started = time.perf_counter()
+        self.queue.put((sql, rows))
+        self.producerBlocked += time.perf_counter() - started
+
+    def writeFrame (self, table, df, colMappings : dict = None, batchRows : int = BULK_BATCH_ROWS):
+        for sql, rows in frameBatches(table, df, self.engine.dialect.paramstyle, colMappings, batchRows):
+            self.put(sql, rows)
+
+    def close (self):
+        """
+            Waits for the writer to finish and commit
+            Returns the rows written and the time each side spent blocked
+        """
+        self.queue.put(None)
+        self.thread.join()
+        if self.error:
+            raise self.error
+        return {'rows'            : self.rows
+               ,'producerBlocked' : self.producerBlocked
+               ,'writerBlocked'   : self.writerBlocked
+               ,'writerBusy'      : self.writerBusy
+               }
+
+def dropIndexes(metadata, engine, tables : list = None):
+    """
+        Drops the indexes of the metadata's tables (or just these tables), so the load doesn't maintain them row by row
+        Returns them, ready for createIndexes once the data is in
+    """
+    indexes = [i for t in metadata.sorted_tables if tables is None or t in tables for i in t.indexes]
+    for i in indexes:
+        i.drop(bind = engine)
+    return indexes
+
+def createIndexes(indexes : list, engine):
+    for i in indexes:
+        i.create(bind = engine)
+
+def checkForeignKeys(engine):
+    """
+        The load runs with foreign_keys off, so check them all in one go at the end instead
+    """
+    with engine.connect() as conn:
+        violations = conn.exec_driver_sql('PRAGMA foreign_key_check').fetchall()
+    if violations:
+        raise Exception (f"{len(violations)} foreign key violations, the first being {tuple(violations[0])}")
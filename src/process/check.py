@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+
+# Is there a commit we haven't loaded? For the cron job that asks every few minutes : only requests & bs4 to read
+# the data page and sqlite3 to read dataCommit, app.py (pandas, dask, sqlalchemy, the orm's views) is only imported
+# when there is something to load
+
+from pprint import pprint as print
+import argparse
+import os
+import sqlite3
+import sys
+import requests
+from   bs4            import BeautifulSoup
+from   contextlib     import closing
+from   datetime       import datetime
+from   pathlib        import Path
+
+OPL_BASE_URL   : str  = 'https://openpowerlifting.gitlab.io/opl-csv'
+OPL_DATA_PAGE  : str  = f'{OPL_BASE_URL}/bulk-csv.html'
+
+THIS_FOLDER    : Path = Path(__file__).parent
+# where the zip, the database and the parsed cache live, OPL_DATA_PATH points a run (e.g. a benchmark) elsewhere
+# app.py, search.py & readapi.py take them from here, this being the cheapest of them to import
+DATA_PATH      : Path = Path(os.environ.get('OPL_DATA_PATH', THIS_FOLDER.parent.parent))
+dataDBfilepath : Path = DATA_PATH.joinpath('openpowerlifting.sqlite')
+
+# exit codes, so cron can do "python check.py || python app.py"
+UP_TO_DATE     : int  = 0
+NEW_COMMIT     : int  = 1
+
+def getLatestCommit():
+    with requests.get(OPL_DATA_PAGE) as req:
+        req.raise_for_status()
+        soup = BeautifulSoup(req.content,"html.parser")
+
+    links = [a['href'] for a in soup.select('a[href*="/commits/"]')]
+
+    if not links or len(links) > 1:
+        raise Exception (f"Unable to determine latest commit from \'{OPL_DATA_PAGE}\'")
+
+    return links[0]
+
+def commitGUIDOf(commitURL : str):
+    return commitURL.split('/')[-1]
+
+def loadedCommit(commitGUID, dbPath : Path = dataDBfilepath):
+    """
+        True if dataCommit says this commit finished loading
+        Doesn't re-checksum the zip or recount the results, as app.isLoaded does before it skips a load
+    """
+    if not dbPath.is_file():
+        return False
+    try:
+        with closing(sqlite3.connect(f'file:{dbPath}?mode=ro', uri = True)) as conn:
+            row = conn.execute ('SELECT loaded, rowCount FROM dataCommit WHERE commitGUID = ?', (commitGUID,)).fetchone()
+    except sqlite3.Error:
+        return False
+    return bool(row and row[0] and row[1] is not None)
+
+def parseArgs(args = None):
+    parser = argparse.ArgumentParser(description = "Checks whether the latest openpowerlifting.org commit is loaded, exit status 1 if it isn't")
+    parser.add_argument('--load', action = 'store_true', help = 'if it isn\'t, load it (any other arguments are passed on to app.py)')
+    parser.add_argument('--db', type = Path, default = dataDBfilepath, help = 'the database to check')
+    args, loadArgs = parser.parse_known_args(args)
+    args.loadArgs = loadArgs
+    return args
+
+def main(args = None):
+    args       = parseArgs(args)
+    commitGUID = commitGUIDOf(getLatestCommit())
+    if loadedCommit(commitGUID, args.db):
+        print (f"{datetime.now()} : {commitGUID} is loaded")
+        return UP_TO_DATE
+    print (f"{datetime.now()} : {commitGUID} is not loaded")
+    if args.load:
+        # only now pay for pandas & co
+        import app
+        app.main(args.loadArgs)
+        return UP_TO_DATE
+    return NEW_COMMIT
+
+if __name__ == "__main__":
+    sys.exit(main())
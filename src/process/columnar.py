@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+
+# Columnar (parquet) export of a loaded database, for full table aggregations sqlite's row store is slow at :
+# the fact table as a dataset partitioned by year, sorted by federation within each year so that a federation's
+# row groups can be skipped on their statistics, and each dimension as a file of its own
+# Needs pyarrow, without it there is no export
+
+import json
+import shutil
+import sqlite3
+from   datetime       import datetime
+from   pathlib        import Path
+
+try:
+    import pyarrow                     as pa
+    import pyarrow.dataset             as ds
+    import pyarrow.parquet             as pq
+except ImportError:
+    pa = None
+
+# hive style directories (year=2019/...); federation_id as well would be thousands of files of a few hundred rows
+EXPORT_PARTITIONING : list = ['year']
+EXPORT_SORT         : list = ['federation_id', 'date']
+EXPORT_COMPRESSION  : str  = 'zstd'
+EXPORT_BATCH_ROWS   : int  = 100000
+EXPORT_GROUP_ROWS   : int  = 16384
+MANIFEST_NAME       : str  = 'manifest.json'
+
+def available():
+    return pa is not None
+
+def arrowType(declared : str):
+    """
+        The arrow type of a sqlite declared column type
+    """
+    declared = (declared or '').upper()
+    if 'INT' in declared:
+        return pa.int64()
+    if 'FLOAT' in declared or 'REAL' in declared or 'DOUBLE' in declared:
+        return pa.float64()
+    if declared == 'DATE':
+        return pa.date32()
+    if 'DATETIME' in declared or 'TIMESTAMP' in declared:
+        return pa.timestamp('us')
+    return pa.string()
+
+def tableSchema(conn, table : str, commitGUID : str):
+    """
+        The arrow schema of a table, from its declared column types, tagged with the commit
+    """
+    columns = conn.execute (f'PRAGMA table_info("{table}")').fetchall()
+    return pa.schema([pa.field(name, arrowType(declared)) for cid, name, declared, notnull, default, pk in columns]
+                    ,metadata = {'commitGUID' : commitGUID, 'table' : table}
+                    )
+
+def toArrow(value, type):
+    """
+        A column of sqlite values as an arrow array, dates & timestamps being stored as text
+    """
+    if pa.types.is_date(type) or pa.types.is_timestamp(type):
+        return pa.array(value, pa.string()).cast(type)
+    return pa.array(value, type)
+
+def tableBatches(conn, sql : str, schema, batchRows : int = EXPORT_BATCH_ROWS):
+    """
+        The rows of the query as arrow record batches of the schema
+    """
+    cursor = conn.execute (sql)
+    while True:
+        rows = cursor.fetchmany(batchRows)
+        if not rows:
+            return
+        yield pa.RecordBatch.from_arrays([toArrow(list(values), field.type) for values, field in zip(zip(*rows), schema)], schema = schema)
+
+def exportTable(conn, table : str, path : Path, commitGUID : str):
+    """
+        One (dimension) table as a single parquet file
+        Returns the number of rows
+    """
+    schema = tableSchema(conn, table, commitGUID)
+    rows   = 0
+    with pq.ParquetWriter(path, schema, compression = EXPORT_COMPRESSION) as writer:
+        for batch in tableBatches(conn, f'SELECT * FROM "{table}" ORDER BY id', schema):
+            writer.write_batch(batch)
+            rows += batch.num_rows
+    return rows
+
+def exportFacts(conn, table : str, path : Path, commitGUID : str):
+    """
+        The fact table as a dataset partitioned by EXPORT_PARTITIONING, sorted by EXPORT_SORT within each partition
+        Returns the number of rows
+    """
+    schema = tableSchema(conn, table, commitGUID).append(pa.field('year', pa.int32()))
+    sql    = f"""SELECT *, CAST(strftime('%Y', date) AS INTEGER) AS year
+                   FROM "{table}"
+                  ORDER BY {", ".join(EXPORT_PARTITIONING + EXPORT_SORT)}"""
+    rows   = 0
+    def counted(batches):
+        nonlocal rows
+        for batch in batches:
+            rows += batch.num_rows
+            yield batch
+    ds.write_dataset (counted(tableBatches(conn, sql, schema))
+                     ,path
+                     ,schema                 = schema
+                     ,format                 = 'parquet'
+                     ,partitioning           = ds.partitioning(pa.schema([schema.field(c) for c in EXPORT_PARTITIONING]), flavor = 'hive')
+                     ,file_options           = ds.ParquetFileFormat().make_write_options(compression = EXPORT_COMPRESSION)
+                     ,basename_template      = 'part-{i}.parquet'
+                     ,min_rows_per_group     = EXPORT_GROUP_ROWS
+                     ,max_rows_per_group     = EXPORT_GROUP_ROWS
+                     ,existing_data_behavior = 'error'
+                     )
+    return rows
+
+def directoryBytes(path : Path):
+    return sum([p.stat().st_size for p in path.rglob('*') if p.is_file()])
+
+def exportDatabase(dbPath : Path, exportDir : Path, commitGUID : str, factTable : str, dimensionTables : list):
+    """
+        Writes exportDir/<commitGUID>/ : the fact table's dataset, a parquet file per dimension and a manifest,
+        building it alongside and renaming it into place once complete, then removes the exports of other commits
+        Returns the manifest
+    """
+    target   = exportDir.joinpath(commitGUID)
+    building = exportDir.joinpath(f'{commitGUID}.building')
+    shutil.rmtree(building, ignore_errors = True)
+    building.mkdir(parents = True)
+    manifest = {'commitGUID'   : commitGUID
+               ,'exported'     : datetime.now().isoformat(timespec = 'seconds')
+               ,'compression'  : EXPORT_COMPRESSION
+               ,'partitioning' : EXPORT_PARTITIONING
+               ,'sortedBy'     : EXPORT_SORT
+               ,'tables'       : {}
+               }
+    try:
+        # write_dataset pulls the batches from a thread of its own
+        with sqlite3.connect(f'file:{dbPath}?mode=ro', uri = True, check_same_thread = False) as conn:
+            rows = exportFacts(conn, factTable, building.joinpath(factTable), commitGUID)
+            manifest['tables'][factTable] = {'path' : factTable, 'rows' : rows, 'bytes' : directoryBytes(building.joinpath(factTable))}
+            for table in dimensionTables:
+                path = building.joinpath(f'{table}.parquet')
+                rows = exportTable(conn, table, path, commitGUID)
+                manifest['tables'][table] = {'path' : path.name, 'rows' : rows, 'bytes' : path.stat().st_size}
+        building.joinpath(MANIFEST_NAME).write_text(json.dumps(manifest, indent = 2))
+        shutil.rmtree(target, ignore_errors = True)
+        building.rename(target)
+    except:
+        shutil.rmtree(building, ignore_errors = True)
+        raise
+
+    for other in exportDir.iterdir():
+        if other.is_dir() and not other == target and other.joinpath(MANIFEST_NAME).is_file():
+            shutil.rmtree(other)
+    return manifest
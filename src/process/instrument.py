@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+
+# Per stage timings & resource use of a load, reported as json
+# Stages nest; each stage's seconds and bytes exclude the stages nested within it, so the stages add up to the load
+# Peak RSS is per stage where the kernel lets us reset the high water mark (Linux), otherwise it is the process peak so far
+# Only this process is measured, the worker processes of a parallel load show up as the time spent waiting on them
+
+import cProfile
+import io
+import json
+import pstats
+import time
+import tracemalloc
+from   contextlib     import contextmanager
+from   pathlib        import Path
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+PROC_SELF      : Path = Path('/proc/self')
+PROFILERS      : list = ['cprofile', 'tracemalloc']
+PROFILE_TOP    : int  = 25
+
+def ioCounters():
+    """
+        (bytes read, bytes written) by this process so far, at the read()/write() level, None where we can't tell
+    """
+    try:
+        counters = dict([l.split(': ') for l in PROC_SELF.joinpath('io').read_text().splitlines()])
+        return (int(counters['rchar']), int(counters['wchar']))
+    except:
+        return (None, None)
+
+def peakRSS():
+    """
+        The high water mark of this process's resident set, in bytes
+    """
+    try:
+        for l in PROC_SELF.joinpath('status').read_text().splitlines():
+            if l.startswith('VmHWM:'):
+                return int(l.split()[1]) * 1024
+    except:
+        ...
+    if resource:
+        # kB on Linux, bytes on macOS, either way only ever a process peak
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    return None
+
+def resetPeakRSS():
+    try:
+        PROC_SELF.joinpath('clear_refs').write_text('5')
+        return True
+    except:
+        return False
+
+class Stage ():
+    """
+        The totals of every time a stage was entered
+    """
+    def __init__ (self, name : str):
+        self.name         = name
+        self.calls        = 0
+        self.seconds      = 0.0
+        self.rows         = 0
+        self.peakRSS      = None
+        self.bytesRead    = None
+        self.bytesWritten = None
+
+    def asDict (self):
+        return {'calls'        : self.calls
+               ,'seconds'      : round(self.seconds, 4)
+               ,'rows'         : self.rows
+               ,'rowsSec'      : round(self.rows / self.seconds) if self.rows and self.seconds else None
+               ,'peakRSS'      : self.peakRSS
+               ,'bytesRead'    : self.bytesRead
+               ,'bytesWritten' : self.bytesWritten
+               }
+
+def addCounter(total, value):
+    if value is None:
+        return total
+    return (total or 0) + value
+
+class LoadReport ():
+    """
+        Collects the stages of one load
+        profileStage is profiled with profiler (cprofile or tracemalloc) whenever it runs
+    """
+    def __init__ (self, profileStage : str = None, profiler : str = 'cprofile', profilePath : Path = None):
+        self.started      = time.perf_counter()
+        self.startedAt    = time.time()
+        self.stages       = {}
+        self.open         = []
+        self.info         = {}
+        self.profileStage = profileStage
+        self.profiler     = profiler
+        self.profilePath  = profilePath
+        self.profile      = None
+        self.profileStats = None
+        self.tracedPeak   = 0
+        self.resettable   = resetPeakRSS()
+
+    @contextmanager
+    def stage (self, name : str):
+        """
+            Times the block as the stage name, yielding the Stage so the caller can add the rows it handled
+        """
+        thisStage = self.stages.setdefault(name, Stage(name))
+        if self.open:
+            # whatever the parent peaked at so far, before the reset below forgets it
+            self.open[-1]['peakRSS'] = max(self.open[-1]['peakRSS'] or 0, peakRSS() or 0)
+        if self.resettable:
+            resetPeakRSS()
+        frame = {'stage'        : thisStage
+                ,'started'      : time.perf_counter()
+                ,'io'           : ioCounters()
+                ,'peakRSS'      : None
+                ,'childSeconds' : 0.0
+                ,'childIO'      : (0, 0)
+                }
+        self.open.append(frame)
+        profiling = name == self.profileStage
+        if profiling:
+            self.startProfile()
+        try:
+            yield thisStage
+        finally:
+            if profiling:
+                self.stopProfile()
+            self.open.pop()
+            elapsed = time.perf_counter() - frame['started']
+            read, written = ioCounters()
+            if read is not None and frame['io'][0] is not None:
+                read, written = (read - frame['io'][0], written - frame['io'][1])
+            else:
+                read, written = (None, None)
+            peak = max(frame['peakRSS'] or 0, peakRSS() or 0) or None
+
+            thisStage.calls        += 1
+            thisStage.seconds      += elapsed - frame['childSeconds']
+            thisStage.peakRSS       = max(thisStage.peakRSS or 0, peak or 0) or None
+            if read is not None:
+                thisStage.bytesRead    = addCounter(thisStage.bytesRead, read - frame['childIO'][0])
+                thisStage.bytesWritten = addCounter(thisStage.bytesWritten, written - frame['childIO'][1])
+
+            if self.open:
+                parent = self.open[-1]
+                parent['childSeconds'] += elapsed
+                parent['peakRSS']       = max(parent['peakRSS'] or 0, peak or 0) or None
+                if read is not None:
+                    parent['childIO'] = (parent['childIO'][0] + read, parent['childIO'][1] + written)
+
+    def timedIter (self, name : str, iterable, rows = len):
+        """
+            Passes iterable on, timing each step of it as the stage name and counting the rows(item) of what it yields
+        """
+        iterator = iter(iterable)
+        while True:
+            with self.stage(name) as thisStage:
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+                thisStage.rows += int(rows(item))
+            yield item
+
+    def startProfile (self):
+        if self.profiler == 'tracemalloc':
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            tracemalloc.reset_peak()
+        else:
+            self.profile = self.profile or cProfile.Profile()
+            self.profile.enable()
+
+    def stopProfile (self):
+        if self.profiler == 'tracemalloc':
+            current, peak    = tracemalloc.get_traced_memory()
+            if peak >= self.tracedPeak:
+                self.tracedPeak   = peak
+                # what the stage allocated and still held when it finished, the time it peaked highest
+                self.profileStats = [str(s) for s in tracemalloc.take_snapshot().statistics('lineno')[:PROFILE_TOP]]
+            tracemalloc.stop()
+        else:
+            self.profile.disable()
+
+    def profileReport (self):
+        """
+            The profile of profileStage, if it ran; a cProfile profile is also dumped to profilePath
+        """
+        if not self.profileStage or not self.profileStage in self.stages:
+            return None
+        if self.profiler == 'tracemalloc':
+            return {'stage' : self.profileStage, 'profiler' : self.profiler, 'tracedPeak' : self.tracedPeak, 'top' : self.profileStats}
+        if self.profilePath:
+            self.profile.dump_stats(self.profilePath)
+        out = io.StringIO()
+        pstats.Stats(self.profile, stream = out).sort_stats('cumulative').print_stats(PROFILE_TOP)
+        return {'stage' : self.profileStage, 'profiler' : self.profiler, 'file' : str(self.profilePath) if self.profilePath else None, 'top' : out.getvalue().splitlines()}
+
+    def asDict (self):
+        return {'started'  : time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(self.startedAt))
+               ,'seconds'  : round(time.perf_counter() - self.started, 4)
+               ,'peakRSS'  : max([s.peakRSS or 0 for s in self.stages.values()] + [0]) or None
+               ,**self.info
+               ,'stages'   : {name : s.asDict() for name, s in self.stages.items()}
+               ,'profile'  : self.profileReport()
+               }
+
+    def asJSON (self):
+        return json.dumps(self.asDict(), indent = 2)
+
+# the report of the load in progress, the load's stages record themselves in it
+current = LoadReport()
+
+def begin(profileStage : str = None, profiler : str = 'cprofile', profilePath : Path = None):
+    """
+        Starts a new report, returning it
+    """
+    global current
+    current = LoadReport(profileStage, profiler, profilePath)
+    return current
+
+def stage(name : str):
+    return current.stage(name)
+
+@contextmanager
+def aside():
+    """
+        Keeps the stages run within the block out of the current report, they only count towards whichever stage is open
+    """
+    global current
+    report = current
+    if report.open:
+        report.open[-1]['peakRSS'] = max(report.open[-1]['peakRSS'] or 0, peakRSS() or 0)
+    current = LoadReport()
+    try:
+        yield current
+    finally:
+        current = report
+
+def timedIter(name : str, iterable, rows = len):
+    return current.timedIter(name, iterable, rows)
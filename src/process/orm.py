@@ -1,10 +1,11 @@
 
 #!/usr/bin/env python3
 
+import json
+from pathlib import Path
 from sqlalchemy_utils import create_view
-from sqlalchemy import Column, Float, Integer, String, DateTime, Date, ForeignKey, Identity, select
+from sqlalchemy import Column, Float, Integer, String, Text, DateTime, Date, ForeignKey, Identity, Index, Table, select
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.schema import UniqueConstraint
 
 ECHO : bool = False
 
@@ -18,6 +19,13 @@ class dataCommit(CommitBase):
     lastSeen = Column(DateTime, nullable=False)
     downloaded = Column(DateTime, nullable=True)
     fileSize = Column(Integer, nullable=True)
+    loaded = Column(DateTime, nullable=True)
+    rowCount = Column(Integer, nullable=True)
+    checksum = Column(String(64), nullable=True)
+    etag = Column(String(200), nullable=True)
+    lastModified = Column(String(40), nullable=True)
+    fileHash = Column(String(64), nullable=True)
+    loadReport = Column(Text, nullable=True)
 
     def __init__ (self, commitGUID, fullURL, now):
         self.commitGUID = commitGUID
@@ -26,13 +34,21 @@ class dataCommit(CommitBase):
         self.lastSeen = now
         self.downloaded = None
         self.fileSize = None
+        self.loaded = None
+        self.rowCount = None
+        self.checksum = None
+        self.etag = None
+        self.lastModified = None
+        self.fileHash = None
+        self.loadReport = None
 
 Base        = declarative_base()
 class Event(Base):
     __tablename__ = "event"
     id = Column(Integer, Identity(start=1, cycle=True), primary_key=True,nullable=False)
-    name = Column(String(5), unique=True,nullable=False)
+    name = Column(String(5), nullable=False)
     resultCnt = Column(Integer, nullable=False)
+    __table_args__ = (Index(f'{__tablename__}_uk', name, unique=True),{})
 
     # def __init__ (self, name, resultCnt):
     #     self.name = name
@@ -41,8 +57,9 @@ class Event(Base):
 class Division(Base):
     __tablename__ = "Division"
     id = Column(Integer, Identity(start=1, cycle=True), primary_key=True,nullable=False)
-    name = Column(String(5), unique=True,nullable=False)
+    name = Column(String(5), nullable=False)
     resultCnt = Column(Integer, nullable=False)
+    __table_args__ = (Index(f'{__tablename__}_uk', name, unique=True),{})
 
     # def __init__ (self, name, resultCnt):
     #     self.name = name
@@ -51,8 +68,9 @@ class Division(Base):
 class Equipment(Base):
     __tablename__ = "Equipment"
     id = Column(Integer, Identity(start=1, cycle=True), primary_key=True,nullable=False)
-    name = Column(String(5), unique=True,nullable=False)
+    name = Column(String(5), nullable=False)
     resultCnt = Column(Integer, nullable=False)
+    __table_args__ = (Index(f'{__tablename__}_uk', name, unique=True),{})
 
     # def __init__ (self, name, resultCnt):
     #     self.name = name
@@ -62,47 +80,30 @@ class SexWeight(Base):
     __tablename__ = "WeightClass"
     id = Column(Integer, Identity(start=1, cycle=True), primary_key=True,nullable=False)
     sex = Column(String(3), nullable=False)
-    weight_class = Column(String(30), nullable=False)
+    weight_class = Column(String(30), nullable=True)
     resultCnt = Column(Integer, nullable=False)
-    __table_args__ = (UniqueConstraint(sex,weight_class, name=f'{__tablename__}_uk'),{})
+    __table_args__ = (Index(f'{__tablename__}_uk', sex, weight_class, unique=True),{})
     # def __init__ (self, sex, weight_class, resultCnt):
     #     self.sex = sex
     #     self.weight_class = weight_class
     #     self.resultCnt = resultCnt
 
-LoadBase        = declarative_base()
-class FederationLoad(LoadBase):
-    __tablename__ = "_federationLoad"
-    id = Column(Integer, Identity(start=1, cycle=True), primary_key=True,nullable=False)
-    name = Column(String(30), nullable=False)
-    parent_name = Column(String(30), nullable=True)
-    parent_id = Column(Integer, nullable = True)
-    resultCnt = Column(Integer, nullable=False)
-    __table_args__ = (UniqueConstraint(name,parent_name, name='_federation_load_uk'),{})
-
-    # def __init__ (self, name, parent_name, resultCnt):
-    #     self.name = name
-    #     self.parent_name = parent_name
-    #     if self.parent_name and self.parent_name == self.name:
-    #         self.parent_name = None
-    #     self.resultCnt = resultCnt
-
-
 class Federation(Base):
     __tablename__ = "federation"
     id = Column(Integer, primary_key=True,nullable=False)
     name = Column(String(30), nullable=False)
     parent_id = Column(Integer, ForeignKey(column = "federation.id", name = "federation_parent_fk"), nullable = True)
     resultCnt = Column(Integer, nullable=False)
-    __table_args__ = (UniqueConstraint(name,parent_id, name='_federation_uk'),{})
+    __table_args__ = (Index('_federation_uk', name, parent_id, unique=True),{})
 
 
 
 class MeetCountry(Base):
     __tablename__ = "meet_country"
     id = Column(Integer, Identity(start=1, cycle=True), primary_key=True,nullable=False)
-    name = Column(String(132), unique=True,nullable=False)
+    name = Column(String(132), nullable=False)
     resultCnt = Column(Integer, nullable=False)
+    __table_args__ = (Index(f'{__tablename__}_uk', name, unique=True),{})
 
     # def __init__ (self, name, resultCnt):
     #     self.name = name
@@ -115,13 +116,22 @@ class MeetLocation(Base):
     state = Column(String(132),nullable=False)
     town = Column(String(132), nullable=False)
     resultCnt = Column(Integer, nullable=False)
-    __table_args__ = (UniqueConstraint(country_id,state,town, name='meet_location_uk'),{})
+    __table_args__ = (Index('meet_location_uk', country_id, state, town, unique=True),{})
     # def __init__ (self, country_id, state, town, resultCnt):
     #     self.country_id = country_id
     #     self.state = state
     #     self.town = town
     #     self.resultCnt = resultCnt
 
+class Meet(Base):
+    __tablename__ = "meet"
+    id = Column(Integer, Identity(start=1, cycle=True), primary_key=True,nullable=False)
+    federation_id = Column(Integer,ForeignKey(column = f"{Federation.__tablename__}.id", name = f"{__tablename__}_{Federation.__tablename__}_fk"), nullable=False)
+    date = Column(Date)
+    name = Column(String(500), nullable=False)
+    location_id = Column(Integer,ForeignKey(column = f"{MeetLocation.__tablename__}.id", name = f"{__tablename__}_{MeetLocation.__tablename__}_fk"), nullable=False)
+    resultCnt = Column(Integer, nullable=False)
+    __table_args__ = (Index(f'{__tablename__}_uk', federation_id, date, name, location_id, unique=True),{})
 
 class Result(Base):
     __tablename__ = "result"
@@ -155,14 +165,70 @@ class Result(Base):
     tested = Column(String(5))
     country = Column(String(30))
     state = Column(String(30))
+    # the meet's date and federation, kept here too for the date range and federation indexes
     date = Column(Date)
-    meet_name = Column(String(500))
     federation_id = Column(Integer,ForeignKey(column = f"{Federation.__tablename__}.id", name =f"{Federation.__tablename__}_fk"), nullable=False)
     division_id = Column(Integer,ForeignKey(column = f"{Division.__tablename__}.id", name = f"{Division.__tablename__}_fk"), nullable=False)
     equipment_id = Column(Integer,ForeignKey(column = f"{Equipment.__tablename__}.id", name = f"{Equipment.__tablename__}_fk"), nullable=False)
     event_id = Column(Integer,ForeignKey(column = f"{Event.__tablename__}.id", name = f"{Event.__tablename__}_fk"), nullable=False)
     weightclass_id = Column(Integer,ForeignKey(column = f"{SexWeight.__tablename__}.id", name = f"{SexWeight.__tablename__}_fk"), nullable=False)
-    location_id = Column(Integer,ForeignKey(column = f"{MeetLocation.__tablename__}.id", name = f"{MeetLocation.__tablename__}_fk"), nullable=False)
+    meet_id = Column(Integer,ForeignKey(column = f"{Meet.__tablename__}.id", name = f"{Meet.__tablename__}_fk"), nullable=False)
+    # the common access patterns; built once the data is in, like every other index
+    __table_args__ = (Index(f'{__tablename__}_name_ix', name, date)                                                    # a lifter's history
+                     ,Index(f'{__tablename__}_date_ix', date, total)                                                   # date ranges
+                     ,Index(f'{__tablename__}_federation_ix', federation_id, date)
+                     ,Index(f'{__tablename__}_category_ix', weightclass_id, equipment_id, event_id, dots, name)        # top N of a category
+                     ,Index(f'{__tablename__}_division_ix', division_id)
+                     ,Index(f'{__tablename__}_meet_ix', meet_id)
+                     ,{})
+
+class MeetDigest(Base):
+    __tablename__ = "meet_digest"
+    id = Column(Integer, Identity(start=1, cycle=True), primary_key=True,nullable=False)
+    meet_id = Column(Integer, nullable=False)
+    digest = Column(Integer, nullable=False)
+    resultCnt = Column(Integer, nullable=False)
+
+# lifter level rollups, computed from result at the end of each load
+class Lifter(Base):
+    __tablename__ = "lifter"
+    id = Column(Integer, Identity(start=1, cycle=True), primary_key=True,nullable=False)
+    name = Column(String(60), nullable=False)
+    first_date = Column(Date)
+    last_date = Column(Date)
+    resultCnt = Column(Integer, nullable=False)
+    __table_args__ = (Index(f'{__tablename__}_uk', name, unique=True),{})
+
+class PersonalBest(Base):
+    __tablename__ = "personal_best"
+    id = Column(Integer, Identity(start=1, cycle=True), primary_key=True,nullable=False)
+    lifter_id = Column(Integer,ForeignKey(column = f"{Lifter.__tablename__}.id", name = f"{__tablename__}_{Lifter.__tablename__}_fk"), nullable=False)
+    equipment_id = Column(Integer,ForeignKey(column = f"{Equipment.__tablename__}.id", name = f"{__tablename__}_{Equipment.__tablename__}_fk"), nullable=False)
+    lift = Column(String(10), nullable=False)
+    value = Column(Float, nullable=False)
+    date = Column(Date)
+    result_id = Column(Integer,ForeignKey(column = f"{Result.__tablename__}.id", name = f"{__tablename__}_{Result.__tablename__}_fk"), nullable=False)
+    __table_args__ = (Index(f'{__tablename__}_uk', lifter_id, equipment_id, lift, unique=True)
+                     ,Index(f'{__tablename__}_lift_ix', lift, equipment_id, value)
+                     ,{})
+
+class CategoryRank(Base):
+    __tablename__ = "category_rank"
+    id = Column(Integer, Identity(start=1, cycle=True), primary_key=True,nullable=False)
+    weightclass_id = Column(Integer,ForeignKey(column = f"{SexWeight.__tablename__}.id", name = f"{__tablename__}_{SexWeight.__tablename__}_fk"), nullable=False)
+    equipment_id = Column(Integer,ForeignKey(column = f"{Equipment.__tablename__}.id", name = f"{__tablename__}_{Equipment.__tablename__}_fk"), nullable=False)
+    federation_id = Column(Integer,ForeignKey(column = f"{Federation.__tablename__}.id", name = f"{__tablename__}_{Federation.__tablename__}_fk"), nullable=False)
+    event_id = Column(Integer,ForeignKey(column = f"{Event.__tablename__}.id", name = f"{__tablename__}_{Event.__tablename__}_fk"), nullable=False)
+    lifter_id = Column(Integer,ForeignKey(column = f"{Lifter.__tablename__}.id", name = f"{__tablename__}_{Lifter.__tablename__}_fk"), nullable=False)
+    best_total = Column(Float)
+    best_dots = Column(Float)
+    rank_total = Column(Integer)
+    rank_dots = Column(Integer)
+    __table_args__ = (Index(f'{__tablename__}_uk', weightclass_id, equipment_id, federation_id, event_id, lifter_id, unique=True)
+                     ,Index(f'{__tablename__}_total_ix', weightclass_id, equipment_id, federation_id, event_id, rank_total)
+                     ,Index(f'{__tablename__}_dots_ix', weightclass_id, equipment_id, federation_id, event_id, rank_dots)
+                     ,Index(f'{__tablename__}_lifter_ix', lifter_id)
+                     ,{})
 
 parent_federation_view = select([
     Federation.id,
@@ -173,15 +239,6 @@ class ParentFederation(Base):
     __table__ = view
     __tablename__ = __table__.name
 
-parent_federation_load_view = select([
-    FederationLoad.id,
-    FederationLoad.name
-]).select_from(FederationLoad).where (FederationLoad.parent_name.is_(None))
-viewLoad = create_view(name = '_parent_federationLoad', selectable = parent_federation_load_view, metadata = Base.metadata, cascade_on_drop = False)
-class ParentFederationLoad(LoadBase):
-    __table__ = viewLoad
-    __tablename__ = __table__.name
-
 
 federation_view = select([
     Federation.id,
@@ -243,21 +300,52 @@ resultsView = select([
         Result.state.label("State"),
         FederationView.name.label("Federation"),
         FederationView.parent_name.label("ParentFederation"),
-        Result.date.label("Date"),
+        Meet.date.label("Date"),
         MeetLocationsView.country.label("MeetCountry"),
         MeetLocationsView.state.label("MeetState"),
         MeetLocationsView.town.label("MeetTown"),
-        Result.meet_name.label("MeetName")
+        Meet.name.label("MeetName")
 ]).select_from(Result)  \
     .join(Equipment)  \
     .join(SexWeight)  \
     .join(Division)  \
     .join(Event)  \
-    .join(FederationView, FederationView.id == Result.federation_id) \
-    .join(MeetLocationsView, Result.location_id == MeetLocationsView.id)  \
+    .join(Meet, Result.meet_id == Meet.id)  \
+    .join(FederationView, FederationView.id == Meet.federation_id) \
+    .join(MeetLocationsView, Meet.location_id == MeetLocationsView.id)  \
 
 viewResults = create_view(name = 'v_results', selectable = resultsView, metadata = Base.metadata, cascade_on_drop = False)
 # provides an ORM interface to the view
 class ResultView(Base):
     __table__ = viewResults
     __tablename__ = __table__.name
+
+# the views' selects, in the order they can be created, for backends which aren't created through Base.metadata
+VIEWS : dict = {view.name         : parent_federation_view
+               ,fedView.name      : federation_view
+               ,viewMeetLocn.name : meet_location_view
+               ,viewResults.name  : resultsView
+               }
+
+# the csv's column names (csv_dtype.json's keys)
+CSV_COLUMNS : list = list(json.loads(Path(__file__).parent.joinpath('csv_dtype.json').read_text()))
+# v_results' column -> the csv's name for it, which has the Kg suffix the view drops
+FLAT_COLUMNS : dict = {c.name : f'{c.name}Kg' if f'{c.name}Kg' in CSV_COLUMNS else c.name for c in viewResults.columns}
+if not set(FLAT_COLUMNS.values()) == set(CSV_COLUMNS):
+    raise Exception (f"v_results doesn't have the csv's columns : {sorted(set(FLAT_COLUMNS.values()) ^ set(CSV_COLUMNS))}")
+
+FlatBase        = declarative_base()
+# v_results materialized as a table, with the csv column names, for readers who want the flat shape without the joins
+resultsFlat = Table('results_flat'
+                   ,FlatBase.metadata
+                   ,Column('id', Integer, primary_key=True, nullable=False)
+                   ,*[Column(FLAT_COLUMNS[c.name], c.type) for c in viewResults.columns]
+                   )
+Index('results_flat_name_ix', resultsFlat.c.Name, resultsFlat.c.Date)
+Index('results_flat_date_ix', resultsFlat.c.Date)
+Index('results_flat_federation_ix', resultsFlat.c.Federation, resultsFlat.c.Date)
+Index('results_flat_category_ix', resultsFlat.c.WeightClassKg, resultsFlat.c.Equipment, resultsFlat.c.Event, resultsFlat.c.Dots)
+Index('results_flat_meet_ix', resultsFlat.c.MeetName, resultsFlat.c.Date)
+class ResultFlat(FlatBase):
+    __table__ = resultsFlat
+    __tablename__ = __table__.name
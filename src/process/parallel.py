@@ -0,0 +1,34 @@
+#!/usr/bin/env python3
+
+from   collections        import deque
+from   concurrent.futures import ProcessPoolExecutor
+
+PARALLEL_BLOCK_BYTES : int = 32 * 1024 * 1024
+
+def lineBlocks(stream, blockBytes : int = PARALLEL_BLOCK_BYTES):
+    """
+        Splits a csv stream into (header, block) pairs of roughly blockBytes, each ending on a line boundary
+        Assumes no quoted field spans a line, as dask's blocksize does
+    """
+    header = stream.readline()
+    while True:
+        block = stream.read(blockBytes)
+        if not block:
+            break
+        block += stream.readline()
+        yield (header, block)
+
+def orderedMap(fn, items, workers : int, window : int = None, initializer = None, initargs : tuple = ()):
+    """
+        fn over items in a process pool, results are yielded in the order of items
+        At most window items are in flight at once, so a fast reader can't run ahead of a slow consumer
+    """
+    window   = window or 2 * workers
+    inFlight = deque()
+    with ProcessPoolExecutor(max_workers = workers, initializer = initializer, initargs = initargs) as pool:
+        for item in items:
+            inFlight.append(pool.submit(fn, *item))
+            if len(inFlight) >= window:
+                yield inFlight.popleft().result()
+        while inFlight:
+            yield inFlight.popleft().result()
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+
+# On-disk cache of the parsed & typed csv, as parquet, so a re-run for the same commit skips the csv parse
+# Needs pyarrow, without it the cache is simply not used
+
+import os
+from   pathlib        import Path
+
+try:
+    import pyarrow                     as pa
+    import pyarrow.parquet             as pq
+except ImportError:
+    pa = None
+
+CACHE_SUFFIX : str = '.parquet'
+
+def available():
+    return pa is not None
+
+def arrowSchema(dtypes : dict, parse_dates : list, floatCols : list, intCols : list):
+    """
+        The parquet schema of the typed frame, from the csvReadArgs
+        Fixed up front so that a chunk with an all-empty column doesn't change it
+    """
+    fields = []
+    for col in dtypes.keys():
+        if col in floatCols or col in intCols:
+            fields.append(pa.field(col, pa.float64()))
+        elif col in parse_dates:
+            fields.append(pa.field(col, pa.timestamp('ns')))
+        else:
+            fields.append(pa.field(col, pa.string()))
+    return pa.schema(fields)
+
+def cachePath(cacheDir : Path, key : str):
+    return cacheDir.joinpath(f'{key}{CACHE_SUFFIX}')
+
+def readCached(path : Path, chunkRows : int):
+    """
+        Yields the cached frame in pd.DataFrame chunks of chunkRows
+    """
+    # touch it, eviction is least recently used first
+    os.utime(path)
+    parquetFile = pq.ParquetFile(path)
+    for batch in parquetFile.iter_batches(batch_size = chunkRows):
+        yield batch.to_pandas()
+
+def writeThrough(chunks, path : Path, schema):
+    """
+        Passes the chunks on, writing them to the cache as they go by
+        The cache entry only appears once every chunk has been written, a partly read generator leaves nothing behind
+    """
+    path.parent.mkdir(parents = True, exist_ok = True)
+    tmpPath  = path.with_name(f'{path.name}.tmp')
+    complete = False
+    writer   = pq.ParquetWriter(tmpPath, schema, compression = 'snappy')
+    try:
+        for chunk in chunks:
+            writer.write_table(pa.Table.from_pandas(chunk, schema = schema, preserve_index = False))
+            yield chunk
+        complete = True
+    finally:
+        writer.close()
+        if complete:
+            os.replace(tmpPath, path)
+        else:
+            tmpPath.unlink(missing_ok = True)
+
+def evict(cacheDir : Path, maxBytes : int, keep : Path = None):
+    """
+        Removes the least recently used entries until the cache is no bigger than maxBytes
+        Returns the paths removed
+    """
+    if not cacheDir.is_dir():
+        return []
+    entries = sorted([p for p in cacheDir.iterdir() if p.name.endswith(CACHE_SUFFIX)], key = lambda p: p.stat().st_mtime)
+    total   = sum([p.stat().st_size for p in entries])
+    removed = []
+    for p in entries:
+        if total <= maxBytes:
+            break
+        if keep and p == keep:
+            continue
+        total -= p.stat().st_size
+        p.unlink()
+        removed.append(p)
+    return removed
@@ -0,0 +1,380 @@
+#!/usr/bin/env python3
+
+# A local read service over the loaded database, for the services which would otherwise each open it and run the same
+# lifter history / ranking queries over and over : a pool of read only connections, the common lookups as parameterized
+# queries, an LRU cache of their results which is emptied when a different dataCommit is loaded, and a small json over
+# http endpoint. /stats has the cache hit rate and the latency percentiles
+
+from pprint import pprint as print
+import argparse
+import inspect
+import json
+import sqlite3
+import threading
+import time
+from   collections    import OrderedDict, deque
+from   contextlib     import contextmanager
+from   datetime       import datetime
+from   http.server    import BaseHTTPRequestHandler, ThreadingHTTPServer
+from   pathlib        import Path
+from   urllib.parse   import urlparse, parse_qsl
+from   orm            import dataCommit, Lifter, PersonalBest, CategoryRank, SexWeight, Equipment, Event, Federation
+import search
+from   check          import dataDBfilepath
+
+POOL_SIZE      : int   = 4
+# the cache's size limit, in result rows across all its entries
+CACHE_ROWS     : int   = 100000
+# how often (at most) the database file is looked at for a new load
+COMMIT_CHECK   : float = 1.0
+# latencies kept per query, for the percentiles
+LATENCY_SAMPLES: int   = 10000
+PERCENTILES    : list  = [50, 90, 99]
+RANK_BY        : list  = ['dots', 'total']
+RANK_LIMIT     : int   = 10
+HTTP_PORT      : int   = 8765
+
+def servedCommit(conn):
+    """
+        The commitGUID of the database's load, None if there isn't one
+    """
+    row = conn.execute (f'SELECT commitGUID FROM "{dataCommit.__tablename__}" WHERE loaded IS NOT NULL ORDER BY loaded DESC LIMIT 1').fetchone()
+    return row[0] if row else None
+
+def personalBests(conn, name : str):
+    """
+        A lifter's best squat / bench / deadlift / total / dots per equipment
+    """
+    return [dict(row) for row in conn.execute (f"""SELECT e.name AS equipment, p.lift, p.value, p.date
+                                                      FROM {Lifter.__tablename__} l
+                                                      JOIN {PersonalBest.__tablename__} p ON p.lifter_id = l.id
+                                                      JOIN {Equipment.__tablename__} e ON e.id = p.equipment_id
+                                                     WHERE l.name = :name
+                                                     ORDER BY e.name, p.lift"""
+                                              ,{'name' : name}
+                                              )]
+
+def categoryRanking(conn, sex : str, equipment : str, event : str, federation : str, weightClass : str = None, by : str = 'dots', limit : int = RANK_LIMIT):
+    """
+        The top limit lifters of a category (sex & weight class, equipment, event, federation) by their best dots or total
+        No weightClass is the lifters without one
+    """
+    if not by in RANK_BY:
+        raise ValueError (f"by is one of {', '.join(RANK_BY)}")
+    return [dict(row) for row in conn.execute (f"""SELECT r.rank_{by} AS rank, l.name, r.best_{by} AS best
+                                                      FROM {SexWeight.__tablename__} w, {Equipment.__tablename__} e, {Event.__tablename__} v, {Federation.__tablename__} f
+                                                      JOIN {CategoryRank.__tablename__} r ON r.weightclass_id = w.id AND r.equipment_id = e.id AND r.event_id = v.id AND r.federation_id = f.id
+                                                      JOIN {Lifter.__tablename__} l ON l.id = r.lifter_id
+                                                     WHERE w.sex = :sex AND w.weight_class IS :weightClass AND e.name = :equipment AND v.name = :event AND f.name = :federation
+                                                       AND r.rank_{by} <= :limit
+                                                     ORDER BY r.rank_{by}, l.name"""
+                                              ,{'sex' : sex, 'weightClass' : weightClass, 'equipment' : equipment, 'event' : event, 'federation' : federation, 'limit' : int(limit)}
+                                              )]
+
+# the lookups the service answers : name -> (function of a connection and the parameters, the required parameters)
+QUERIES        : dict  = {'lifter'         : (lambda conn, name : search.lifterResults(conn, name)                     , ['name'])
+                         ,'bests'          : (lambda conn, name : personalBests(conn, name)                            , ['name'])
+                         ,'rankings'       : (categoryRanking                                                          , ['sex', 'equipment', 'event', 'federation'])
+                         ,'meet'           : (lambda conn, id : search.meetResults(conn, {'id' : int(id)})             , ['id'])
+                         ,'search/lifters' : (lambda conn, q, limit = search.SEARCH_LIMIT : search.searchLifters(conn, q, int(limit)), ['q'])
+                         ,'search/meets'   : (lambda conn, q, limit = search.SEARCH_LIMIT : search.searchMeets(conn, q, int(limit))  , ['q'])
+                         }
+
+class ConnectionPool ():
+    """
+        Read only connections to the database, opened as needed up to size and handed out one per request
+        reset() is for a new load : the open connections still see the file that was swapped out, so they are closed
+        (those in use once they are given back)
+    """
+    def __init__ (self, dbPath : Path = dataDBfilepath, size : int = POOL_SIZE):
+        self.dbPath     = dbPath
+        self.size       = size
+        self.idle       = []
+        self.opened     = 0
+        self.generation = 0
+        self.available  = threading.Condition()
+
+    def open (self):
+        conn = sqlite3.connect(f'file:{self.dbPath}?mode=ro', uri = True, check_same_thread = False)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    @contextmanager
+    def connection (self):
+        with self.available:
+            while not self.idle and self.opened >= self.size:
+                self.available.wait()
+            generation = self.generation
+            conn       = self.idle.pop() if self.idle else None
+            if conn is None:
+                self.opened += 1
+        if conn is None:
+            try:
+                conn = self.open()
+            except:
+                with self.available:
+                    self.opened -= 1
+                    self.available.notify()
+                raise
+        try:
+            yield conn
+        finally:
+            with self.available:
+                if generation == self.generation:
+                    self.idle.append(conn)
+                    conn = None
+                else:
+                    self.opened -= 1
+                self.available.notify()
+            if conn:
+                conn.close()
+
+    def reset (self):
+        with self.available:
+            self.generation += 1
+            for conn in self.idle:
+                conn.close()
+            self.opened -= len(self.idle)
+            self.idle    = []
+            self.available.notify_all()
+
+    def close (self):
+        self.reset()
+
+class ResultCache ():
+    """
+        Query results by (query, parameters), least recently used first out once there are more than maxRows rows in it
+        Results of more than maxRows rows aren't kept
+        generation counts the invalidations, a result looked up before one isn't put after it
+    """
+    def __init__ (self, maxRows : int = CACHE_ROWS):
+        self.maxRows       = maxRows
+        self.entries       = OrderedDict()
+        self.rows          = 0
+        self.hits          = 0
+        self.misses        = 0
+        self.invalidations = 0
+        self.commitGUID    = None
+        self.generation    = 0
+        self.lock          = threading.Lock()
+
+    def get (self, key):
+        with self.lock:
+            found = self.entries.get(key)
+            if found is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return found
+
+    def put (self, key, value : list, generation : int = None):
+        """
+            generation : self.generation when value was looked up, it isn't kept if the cache has been invalidated since
+        """
+        if not self.maxRows or len(value) > self.maxRows:
+            return
+        with self.lock:
+            if generation is not None and generation != self.generation:
+                return
+            if key in self.entries:
+                self.rows -= len(self.entries.pop(key))
+            self.entries[key] = value
+            self.rows += len(value)
+            while self.rows > self.maxRows:
+                key, evicted = self.entries.popitem(last = False)
+                self.rows -= len(evicted)
+
+    def invalidate (self, commitGUID):
+        """
+            Empties the cache if commitGUID isn't the commit its results are of
+        """
+        with self.lock:
+            if commitGUID == self.commitGUID:
+                return False
+            if self.entries:
+                self.invalidations += 1
+            self.entries.clear()
+            self.rows       = 0
+            self.commitGUID = commitGUID
+            self.generation += 1
+            return True
+
+    def stats (self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {'entries'       : len(self.entries)
+                   ,'rows'          : self.rows
+                   ,'maxRows'       : self.maxRows
+                   ,'hits'          : self.hits
+                   ,'misses'        : self.misses
+                   ,'hitRate'       : round(self.hits / lookups, 4) if lookups else None
+                   ,'invalidations' : self.invalidations
+                   }
+
+def percentiles(samples : list, points : list = PERCENTILES):
+    """
+        Nearest rank percentiles of samples
+    """
+    ordered = sorted(samples)
+    if not ordered:
+        return {f'p{p}' : None for p in points}
+    return {f'p{p}' : ordered[min(len(ordered) - 1, max(0, -(-p * len(ordered) // 100) - 1))] for p in points}
+
+class ReadService ():
+    """
+        The QUERIES, answered from the cache or a pooled connection, with their latencies
+    """
+    def __init__ (self, dbPath : Path = dataDBfilepath, poolSize : int = POOL_SIZE, cacheRows : int = CACHE_ROWS, commitCheck : float = COMMIT_CHECK):
+        self.dbPath      = dbPath
+        self.pool        = ConnectionPool(dbPath, poolSize)
+        self.cache       = ResultCache(cacheRows)
+        self.commitCheck = commitCheck
+        self.checked     = 0.0
+        self.fileId      = None
+        self.latencies   = {}
+        self.lock        = threading.Lock()
+        self.checkCommit(force = True)
+
+    def checkCommit (self, force : bool = False):
+        """
+            Every commitCheck seconds, whether the database file has been replaced (each load swaps in a new one),
+            if it has the pool is reset, and if its dataCommit differs the cache is emptied
+        """
+        now = time.monotonic()
+        if not force and now - self.checked < self.commitCheck:
+            return
+        with self.lock:
+            if not force and now - self.checked < self.commitCheck:
+                return
+            self.checked = now
+            stat   = self.dbPath.stat()
+            fileId = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+            if fileId == self.fileId:
+                return
+            self.fileId = fileId
+            self.pool.reset()
+            with self.pool.connection() as conn:
+                commitGUID = servedCommit(conn)
+            if self.cache.invalidate(commitGUID):
+                print (f"{datetime.now()} : serving {commitGUID} from {self.dbPath}")
+
+    def query (self, queryName : str, /, **params):
+        """
+            Returns (rows, whether they came from the cache)
+            The cached rows are shared, they aren't to be changed
+        """
+        function, required = QUERIES[queryName]
+        missing = [p for p in required if params.get(p) is None]
+        if missing:
+            raise ValueError (f"{queryName} needs {', '.join(missing)}")
+        unknown = [p for p in params if not p in list(inspect.signature(function).parameters)[1:]]
+        if unknown:
+            raise ValueError (f"{queryName} doesn't take {', '.join(unknown)}")
+        started = time.perf_counter()
+        self.checkCommit()
+        # another thread may swap the commit in while this one queries the old file
+        generation = self.cache.generation
+        key  = (queryName, tuple(sorted(params.items())))
+        rows = self.cache.get(key)
+        cached = rows is not None
+        if not cached:
+            with self.pool.connection() as conn:
+                rows = function(conn, **params)
+            self.cache.put(key, rows, generation)
+        self.record(queryName, (time.perf_counter() - started) * 1000)
+        return (rows, cached)
+
+    def record (self, name : str, ms : float):
+        with self.lock:
+            self.latencies.setdefault(name, deque(maxlen = LATENCY_SAMPLES)).append(ms)
+
+    def stats (self):
+        """
+            The commit being served, the cache's hit rate and each query's latency percentiles (ms)
+        """
+        with self.lock:
+            latencies = {name : list(samples) for name, samples in self.latencies.items()}
+        everything = [ms for samples in latencies.values() for ms in samples]
+        return {'commitGUID' : self.cache.commitGUID
+               ,'cache'      : self.cache.stats()
+               ,'latencyMs'  : {name : {'count' : len(samples), **{p : round(ms, 3) for p, ms in percentiles(samples).items()}}
+                                for name, samples in {**latencies, 'all' : everything}.items()
+                               }
+               }
+
+    def close (self):
+        self.pool.close()
+
+class ReadHandler (BaseHTTPRequestHandler):
+    """
+        GET /<query>?<parameters>, e.g. /lifter?name=..., /rankings?sex=M&weightClass=93&equipment=Raw&event=SBD&federation=USAPL,
+        answered as json : the commit, whether it was cached, the ms and the rows. GET /stats for ReadService.stats()
+    """
+    service : ReadService = None
+
+    def do_GET (self):
+        url  = urlparse(self.path)
+        name = url.path.strip('/')
+        try:
+            if name == 'stats':
+                self.reply(200, self.service.stats())
+            elif name in QUERIES:
+                started      = time.perf_counter()
+                rows, cached = self.service.query(name, **dict(parse_qsl(url.query)))
+                self.reply(200, {'commitGUID' : self.service.cache.commitGUID
+                                ,'cached'     : cached
+                                ,'ms'         : round((time.perf_counter() - started) * 1000, 3)
+                                ,'rows'       : rows
+                                })
+            else:
+                self.reply(404, {'error' : f"unknown query {name}, one of {', '.join(['stats'] + list(QUERIES))}"})
+        except (ValueError, TypeError) as e:
+            self.reply(400, {'error' : str(e)})
+        except sqlite3.Error as e:
+            self.reply(500, {'error' : str(e)})
+
+    def reply (self, status : int, body : dict):
+        content = json.dumps(body, default = str).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message (self, format, *args):
+        # the latencies are in /stats
+        ...
+
+def serve(service : ReadService, host : str = '127.0.0.1', port : int = HTTP_PORT):
+    """
+        The http server for service, not yet started (serve_forever), port 0 for any free one
+    """
+    handler = type('BoundReadHandler', (ReadHandler,), {'service' : service})
+    return ThreadingHTTPServer((host, port), handler)
+
+def parseArgs(args = None):
+    parser = argparse.ArgumentParser(description = "Serves the common lookups of the loaded database as json over http, with a result cache")
+    parser.add_argument('--db', type = Path, default = dataDBfilepath, help = 'the database to read')
+    parser.add_argument('--host', default = '127.0.0.1', help = 'the address to listen on')
+    parser.add_argument('--port', type = int, default = HTTP_PORT, help = 'the port to listen on')
+    parser.add_argument('--pool', type = int, default = POOL_SIZE, help = 'at most this many open connections')
+    parser.add_argument('--cache-rows', type = int, default = CACHE_ROWS, metavar = 'ROWS', help = 'the size limit of the result cache, in rows (0 for no cache)')
+    return parser.parse_args(args)
+
+def main(args = None):
+    args    = parseArgs(args)
+    service = ReadService(args.db, args.pool, args.cache_rows)
+    server  = serve(service, args.host, args.port)
+    print (f"{datetime.now()} : listening on http://{args.host}:{server.server_address[1]}/ ({', '.join(['stats'] + list(QUERIES))})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        ...
+    finally:
+        server.server_close()
+        service.close()
+        print (service.stats())
+
+if __name__ == "__main__":
+    main()
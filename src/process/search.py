@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+
+# FTS5 (trigram) search over the distinct lifter names and meets, so a partial name is an index lookup
+# rather than a LIKE '%...%' over every result row. Built by app.py at the end of each load
+
+from pprint import pprint as print
+import argparse
+import sqlite3
+import time
+from   pathlib        import Path
+from   sqlalchemy     import bindparam
+from   sqlalchemy.dialects import sqlite as sqliteDialect
+from   orm            import Result, Meet, MeetLocation, Federation, Lifter, ResultView, resultsView
+from   check          import dataDBfilepath
+
+LIFTER_SEARCH  : str  = 'lifter_search'
+MEET_SEARCH    : str  = 'meet_search'
+# trigram matches need at least this many characters, shorter searches fall back to LIKE
+TRIGRAM_MIN    : int  = 3
+SEARCH_LIMIT   : int  = 20
+# v_results' select for one meet, on result.meet_id (and so its index) rather than through the view
+MEET_RESULTS   : str  = str(resultsView.where(Result.meet_id == bindparam('id')).compile(dialect = sqliteDialect.dialect()))
+
+def createSearchTables(conn):
+    """
+        (Re)builds the search tables from result & meet, conn being a DBAPI connection to the new database
+    """
+    result = Result.__tablename__
+    conn.execute (f'DROP TABLE IF EXISTS {LIFTER_SEARCH}')
+    conn.execute (f'DROP TABLE IF EXISTS {MEET_SEARCH}')
+    conn.execute (f"CREATE VIRTUAL TABLE {LIFTER_SEARCH} USING fts5(name, tokenize = 'trigram')")
+    conn.execute (f"""CREATE VIRTUAL TABLE {MEET_SEARCH} USING fts5(meet_name, town, tokenize = 'trigram')""")
+    conn.execute (f'INSERT INTO {LIFTER_SEARCH} (name) SELECT DISTINCT name FROM {result}')
+    # rowid is the meet's id
+    conn.execute (f"""INSERT INTO {MEET_SEARCH} (rowid, meet_name, town)
+                      SELECT m.id, m.name, l.town
+                        FROM {Meet.__tablename__} m
+                        JOIN {MeetLocation.__tablename__} l ON l.id = m.location_id
+                       WHERE m.resultCnt > 0""")
+    conn.execute (f"INSERT INTO {LIFTER_SEARCH} ({LIFTER_SEARCH}) VALUES ('optimize')")
+    conn.execute (f"INSERT INTO {MEET_SEARCH} ({MEET_SEARCH}) VALUES ('optimize')")
+    return conn.execute (f'SELECT COUNT(*) FROM {LIFTER_SEARCH}').fetchone()[0]
+
+def matchPhrase(text : str):
+    """
+        The search text as a single fts5 phrase, so quotes and operators in it are just characters
+    """
+    return '"' + text.replace('"', '""') + '"'
+
+def likePattern(text : str):
+    return '%' + text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+
+def connect(dbPath : Path = dataDBfilepath):
+    """
+        A read only connection, rows as sqlite3.Row
+    """
+    conn = sqlite3.connect(f'file:{dbPath}?mode=ro', uri = True)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+def searchLifters(conn, text : str, limit : int = SEARCH_LIMIT):
+    """
+        Lifter names containing text (case insensitive), best matches first, with their number of results
+        (from the lifter rollup, None if the load had --no-rollups)
+    """
+    if len(text) >= TRIGRAM_MIN:
+        where, param = (f'{LIFTER_SEARCH} MATCH ?', matchPhrase(text))
+    else:
+        where, param = (f"name LIKE ? ESCAPE '\\'", likePattern(text))
+    return [dict(row) for row in conn.execute (f"""SELECT s.name, l.resultCnt
+                                                      FROM (SELECT name, rank FROM {LIFTER_SEARCH} WHERE {where} ORDER BY rank LIMIT ?) s
+                                                      LEFT JOIN {Lifter.__tablename__} l ON l.name = s.name
+                                                     ORDER BY s.rank"""
+                                              ,(param, limit)
+                                              )]
+
+def searchMeets(conn, text : str, limit : int = SEARCH_LIMIT):
+    """
+        Meets whose name or town contains text, best matches first
+        id is what meetResults looks the results up by
+    """
+    if len(text) >= TRIGRAM_MIN:
+        where, params = (f'{MEET_SEARCH} MATCH ?', (matchPhrase(text),))
+    else:
+        where, params = (f"(meet_name LIKE ? ESCAPE '\\' OR town LIKE ? ESCAPE '\\')", (likePattern(text), likePattern(text)))
+    return [dict(row) for row in conn.execute (f"""SELECT s.meet_name, s.town, f.name AS federation, m.date, m.id
+                                                      FROM (SELECT rowid, *, rank FROM {MEET_SEARCH} WHERE {where} ORDER BY rank LIMIT ?) s
+                                                      JOIN {Meet.__tablename__} m ON m.id = s.rowid
+                                                      JOIN {Federation.__tablename__} f ON f.id = m.federation_id
+                                                     ORDER BY s.rank"""
+                                              ,(*params, limit)
+                                              )]
+
+def lifterResults(conn, name : str):
+    """
+        A lifter's results, in v_results' shape, oldest first
+    """
+    return [dict(row) for row in conn.execute (f'SELECT * FROM {ResultView.__tablename__} WHERE Name = ? ORDER BY Date', (name,))]
+
+def meetResults(conn, meet : dict):
+    """
+        The results of one of the searchMeets meets, in v_results' shape
+    """
+    return [dict(row) for row in conn.execute (MEET_RESULTS, (meet['id'],))]
+
+def parseArgs(args = None):
+    parser = argparse.ArgumentParser(description = "Searches the lifters or meets of the loaded database")
+    parser.add_argument('kind', choices = ['lifter', 'meet'], help = 'what to search')
+    parser.add_argument('text', help = 'part of the name (or, for a meet, town)')
+    parser.add_argument('--limit', type = int, default = SEARCH_LIMIT, help = 'at most this many matches')
+    parser.add_argument('--db', type = Path, default = dataDBfilepath, help = 'the database to search')
+    return parser.parse_args(args)
+
+def main(args = None):
+    args = parseArgs(args)
+    with connect(args.db) as conn:
+        started = time.perf_counter()
+        found   = (searchLifters if args.kind == 'lifter' else searchMeets)(conn, args.text, args.limit)
+        elapsed = time.perf_counter() - started
+    for row in found:
+        print (row)
+    print (f"{len(found)} matches in {elapsed * 1000:.1f}ms")
+
+if __name__ == "__main__":
+    main()
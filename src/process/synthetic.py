@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+
+# Writes a zip shaped like the openpowerlifting bulk csv (csv_dtype.json's columns) with made up rows,
+# so the load can be measured without the real archive
+# Cardinalities and missing / invalid value rates are roughly those of the real data
+
+from pprint import pprint as print
+import argparse
+import json
+import numpy                           as np
+import pandas                          as pd
+from   datetime       import datetime
+from   pathlib        import Path
+from   zipfile        import ZipFile, ZIP_DEFLATED
+
+THIS_FOLDER      : Path  = Path(__file__).parent
+csvDTypePath     : Path  = THIS_FOLDER.joinpath('csv_dtype.json')
+CSV_MEMBER_NAME  : str   = 'openpowerlifting-synthetic/openpowerlifting-synthetic.csv'
+GENERATE_CHUNK_ROWS : int = 100000
+
+# results per meet, and distinct lifters per result
+ROWS_PER_MEET    : int   = 60
+LIFTERS_PER_ROW  : float = 0.25
+# federations, a third of which belong to one of the parents
+FEDERATIONS      : int   = 450
+PARENT_FEDERATIONS : list = ['IPF', 'WP', 'IPL', 'WRPF', 'GPC', 'WPC', 'WPF', 'IPA', 'WUAP', 'AAU']
+DIVISIONS        : int   = 3000
+MEET_COUNTRIES   : int   = 120
+MEET_STATES      : int   = 250
+TOWNS_PER_MEET   : float = 0.3
+EXTRA_WEIGHT_CLASSES : int = 110
+WEIGHT_CLASSES   : list  = ['44', '48', '52', '56', '57', '60', '63', '67.5', '69', '72', '75', '76', '82.5', '84', '84+'
+                           ,'59', '66', '74', '83', '93', '105', '120', '120+', '90', '100', '110', '125', '140', '140+', '90+'
+                           ]
+DIVISION_NAMES   : list  = ['Open', 'Juniors', 'Sub-Juniors', 'Masters 1', 'Masters 2', 'Masters 3', 'Masters 4', 'Teen', 'Novice']
+PLACE_INVALID    : dict  = {'DQ' : 0.05, 'G' : 0.01, 'NS' : 0.005, 'DD' : 0.001}
+
+# how often a value is missing, by column
+NAN_RATES        : dict  = {'Age'            : 0.45
+                           ,'AgeClass'       : 0.40
+                           ,'BirthYearClass' : 0.50
+                           ,'Division'       : 0.001
+                           ,'BodyweightKg'   : 0.02
+                           ,'WeightClassKg'  : 0.02
+                           ,'Attempts'       : 0.60    # only the best lift recorded
+                           ,'FourthAttempt'  : 0.997
+                           ,'Tested'         : 0.45
+                           ,'Country'        : 0.40
+                           ,'State'          : 0.85
+                           ,'MeetState'      : 0.35
+                           ,'MeetTown'       : 0.20
+                           }
+FAILED_ATTEMPT_RATE  : float = 0.15   # negative attempts, the loader takes abs()
+INVALID_NUMBER_RATE  : float = 0.0005 # garbage in a numeric column, the loader makes it NaN
+
+def zipfChoice(rng, n : int, size : int, a : float = 1.1):
+    """
+        size picks from range(n), the first few far more often than the rest
+    """
+    p = 1.0 / np.arange(1, n + 1) ** a
+    return rng.choice(n, size = size, p = p / p.sum())
+
+def withNaN(rng, values, rate : float):
+    values = np.asarray(values, dtype = object)
+    values[rng.random(len(values)) < rate] = None
+    return values
+
+def withInvalid(rng, values, rate : float = INVALID_NUMBER_RATE):
+    values = np.asarray(values, dtype = object)
+    invalid = rng.random(len(values)) < rate
+    values[invalid] = rng.choice(['x', '1.2.3', '-', 'n/a'], size = invalid.sum())
+    return values
+
+def rounded(values, places : int = 1):
+    """
+        Floats as the csv writes them, NaN as an empty field
+    """
+    values = np.round(values, places).astype(object)
+    values[pd.isna(values)] = None
+    return values
+
+class Universe ():
+    """
+        The federations, meets etc. every chunk of rows is drawn from
+    """
+    def __init__ (self, rows : int, rng):
+        self.rows = rows
+        parents   = PARENT_FEDERATIONS
+        self.federations      = np.array(parents + [f'FED{i:03d}' for i in range(FEDERATIONS - len(parents))], dtype = object)
+        self.parentFederation = np.array([None] * len(parents) + [parents[i] if rng.random() < 1 / 3 else None for i in rng.integers(0, len(parents), FEDERATIONS - len(parents))], dtype = object)
+        self.divisions        = np.array(DIVISION_NAMES + [f'Div {i:04d}' for i in range(DIVISIONS - len(DIVISION_NAMES))], dtype = object)
+        self.weightClasses    = np.array(WEIGHT_CLASSES + [f'{w:g}' for w in rng.choice(np.arange(30, 250, 0.5), size = EXTRA_WEIGHT_CLASSES, replace = False)], dtype = object)
+
+        meets = max(1, rows // ROWS_PER_MEET)
+        towns = max(1, int(meets * TOWNS_PER_MEET))
+        self.meetFederation = zipfChoice(rng, FEDERATIONS, meets, a = 0.9)
+        self.meetDate       = (np.datetime64('1964-01-01') + rng.integers(0, 60 * 365, meets)).astype(str)
+        self.meetCountry    = np.array([f'Country {i}' for i in zipfChoice(rng, MEET_COUNTRIES, meets)], dtype = object)
+        self.meetState      = withNaN(rng, [f'ST{i}' for i in zipfChoice(rng, MEET_STATES, meets, a = 0.8)], NAN_RATES['MeetState'])
+        self.meetTown       = withNaN(rng, [f'Town {i}' for i in zipfChoice(rng, towns, meets, a = 0.7)], NAN_RATES['MeetTown'])
+        self.meetName       = np.array([f'Meet {i}' for i in range(meets)], dtype = object)
+        self.meets          = meets
+        self.lifters        = max(1, int(rows * LIFTERS_PER_ROW))
+
+def attempts(rng, best, rows : int, events, lift : str):
+    """
+        The four attempts and the best of three of one lift, NaN unless the event includes it
+    """
+    hasLift = np.char.find(events.astype(str), lift) >= 0
+    best    = np.where(hasLift, best, np.nan)
+    cols    = {}
+    recorded = rng.random(rows) >= NAN_RATES['Attempts']
+    for i, factor in enumerate([0.9, 0.95, 1.0], start = 1):
+        value  = best * factor
+        failed = rng.random(rows) < FAILED_ATTEMPT_RATE
+        value  = np.where(failed, -value, value)
+        cols[i] = withInvalid(rng, rounded(np.where(recorded, value, np.nan)))
+    cols[4] = rounded(np.where(rng.random(rows) >= NAN_RATES['FourthAttempt'], best * 1.02, np.nan))
+    cols['best'] = withInvalid(rng, rounded(best))
+    return (cols, best)
+
+def chunkFrame(universe : Universe, rows : int, meetIndex, rng):
+    """
+        rows csv rows, of the meets in meetIndex
+    """
+    sex     = rng.choice(['M', 'F', 'Mx'], size = rows, p = [0.70, 0.29, 0.01])
+    event   = rng.choice(['SBD', 'B', 'D', 'BD', 'S', 'SD', 'SB'], size = rows, p = [0.62, 0.28, 0.06, 0.02, 0.01, 0.005, 0.005])
+    bw      = rng.normal(85, 20, rows).clip(35, 220)
+    strength = bw * rng.lognormal(0, 0.25, rows)
+    age     = rng.integers(28, 161, rows) / 2
+
+    squats, squat     = attempts(rng, strength * 2.0, rows, event, 'S')
+    benches, bench    = attempts(rng, strength * 1.3, rows, event, 'B')
+    deadlifts, dead   = attempts(rng, strength * 2.4, rows, event, 'D')
+    total   = np.nansum(np.vstack([squat, bench, dead]), axis = 0)
+    place   = rng.integers(1, 15, rows).astype(object)
+    for invalid, rate in PLACE_INVALID.items():
+        place[rng.random(rows) < rate] = invalid
+    total   = np.where(np.isin(place, list(PLACE_INVALID.keys())), np.nan, total)
+    points  = total / bw
+
+    federation = universe.meetFederation[meetIndex]
+    return pd.DataFrame({'Name'            : [f'Lifter {i}' for i in zipfChoice(rng, universe.lifters, rows, a = 0.5)]
+                        ,'Sex'             : sex
+                        ,'Event'           : event
+                        ,'Equipment'       : rng.choice(['Raw', 'Single-ply', 'Wraps', 'Multi-ply', 'Unlimited', 'Straps'], size = rows, p = [0.50, 0.25, 0.15, 0.08, 0.01, 0.01])
+                        ,'Age'             : withInvalid(rng, withNaN(rng, age, NAN_RATES['Age']))
+                        ,'AgeClass'        : withNaN(rng, rng.choice(['13-15', '16-17', '18-19', '20-23', '24-34', '35-39', '40-44', '45-49', '50-54', '55-59', '60-64', '65-69', '70-74'], size = rows), NAN_RATES['AgeClass'])
+                        ,'BirthYearClass'  : withNaN(rng, rng.choice(['14-18', '19-23', '24-39', '40-49', '50-59', '60-69', '70-999'], size = rows), NAN_RATES['BirthYearClass'])
+                        ,'Division'        : withNaN(rng, universe.divisions[zipfChoice(rng, DIVISIONS, rows, a = 1.3)], NAN_RATES['Division'])
+                        ,'BodyweightKg'    : withInvalid(rng, withNaN(rng, rounded(bw, 2), NAN_RATES['BodyweightKg']))
+                        ,'WeightClassKg'   : withNaN(rng, universe.weightClasses[zipfChoice(rng, len(universe.weightClasses), rows, a = 0.9)], NAN_RATES['WeightClassKg'])
+                        ,'Squat1Kg'        : squats[1]
+                        ,'Squat2Kg'        : squats[2]
+                        ,'Squat3Kg'        : squats[3]
+                        ,'Squat4Kg'        : squats[4]
+                        ,'Best3SquatKg'    : squats['best']
+                        ,'Bench1Kg'        : benches[1]
+                        ,'Bench2Kg'        : benches[2]
+                        ,'Bench3Kg'        : benches[3]
+                        ,'Bench4Kg'        : benches[4]
+                        ,'Best3BenchKg'    : benches['best']
+                        ,'Deadlift1Kg'     : deadlifts[1]
+                        ,'Deadlift2Kg'     : deadlifts[2]
+                        ,'Deadlift3Kg'     : deadlifts[3]
+                        ,'Deadlift4Kg'     : deadlifts[4]
+                        ,'Best3DeadliftKg' : deadlifts['best']
+                        ,'TotalKg'         : rounded(total)
+                        ,'Place'           : place
+                        ,'Dots'            : rounded(points * 65, 2)
+                        ,'Wilks'           : rounded(points * 64, 2)
+                        ,'Glossbrenner'    : rounded(points * 57, 2)
+                        ,'Goodlift'        : rounded(points * 13.5, 2)
+                        ,'Tested'          : withNaN(rng, np.full(rows, 'Yes', dtype = object), NAN_RATES['Tested'])
+                        ,'Country'         : withNaN(rng, [f'Country {i}' for i in zipfChoice(rng, MEET_COUNTRIES, rows)], NAN_RATES['Country'])
+                        ,'State'           : withNaN(rng, [f'ST{i}' for i in zipfChoice(rng, MEET_STATES, rows, a = 0.8)], NAN_RATES['State'])
+                        ,'Federation'      : universe.federations[federation]
+                        ,'ParentFederation': universe.parentFederation[federation]
+                        ,'Date'            : universe.meetDate[meetIndex]
+                        ,'MeetCountry'     : universe.meetCountry[meetIndex]
+                        ,'MeetState'       : universe.meetState[meetIndex]
+                        ,'MeetTown'        : universe.meetTown[meetIndex]
+                        ,'MeetName'        : universe.meetName[meetIndex]
+                        })
+
+def generate(rows : int, zipPath : Path, seed : int = 0, chunkRows : int = GENERATE_CHUNK_ROWS):
+    """
+        Writes a zip of rows synthetic csv rows, the same for the same rows & seed
+        Rows come out grouped by meet, as the real file's are
+        Returns zipPath
+    """
+    rng      = np.random.default_rng(seed)
+    columns  = list(json.loads(csvDTypePath.read_text()).keys())
+    universe = Universe(rows, rng)
+    meetOf   = np.sort(rng.integers(0, universe.meets, rows))
+
+    zipPath.parent.mkdir(parents = True, exist_ok = True)
+    with (ZipFile(zipPath, mode = 'w', compression = ZIP_DEFLATED) as archive
+         ,archive.open(CSV_MEMBER_NAME, mode = 'w', force_zip64 = True) as stream
+         ):
+        for start in range(0, rows, chunkRows):
+            chunk = chunkFrame(universe, min(chunkRows, rows - start), meetOf[start:start + chunkRows], rng)
+            stream.write(chunk[columns].to_csv(index = False, header = start == 0).encode('utf-8'))
+            print (f"{datetime.now()} : Generated {min(start + chunkRows, rows)} of {rows} rows")
+    return zipPath
+
+def parseArgs(args = None):
+    parser = argparse.ArgumentParser(description = "Writes a synthetic openpowerlifting shaped zip")
+    parser.add_argument('rows', type = int, help = 'number of csv rows')
+    parser.add_argument('zip', type = Path, help = 'the zip to write')
+    parser.add_argument('--seed', type = int, default = 0, help = 'the same seed & rows always give the same file')
+    return parser.parse_args(args)
+
+def main(args = None):
+    args = parseArgs(args)
+    generate(args.rows, args.zip, args.seed)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,27 @@
+# Fixtures shared by the tests
+
+from   datetime       import datetime
+import pytest
+from   sqlalchemy     import create_engine
+from   sqlalchemy.orm import Session
+from   orm            import CommitBase, dataCommit
+
+@pytest.fixture
+def scratchDB():
+    """
+        Makes a database with app.py's dataCommit table, holding a row for commit if there is one :
+        scratchDB(path, commitGUID = ..., loaded = ..., rowCount = ...) returns path
+    """
+    def scratchDB(path, **commit):
+        engine = create_engine(f'sqlite:///{path}', future = True)
+        CommitBase.metadata.create_all(engine)
+        if commit:
+            with Session(engine) as session:
+                row = dataCommit(commit.pop('commitGUID'), 'https://example.com/commits/', datetime.now())
+                for k, v in commit.items():
+                    setattr(row, k, v)
+                session.add(row)
+                session.commit()
+        engine.dispose()
+        return path
+    return scratchDB
@@ -0,0 +1,76 @@
+# PipelinedWriter : what is written, and that a failing connection surfaces as an error from close() rather than a hang
+
+import sqlite3
+import threading
+import pytest
+from   sqlalchemy     import create_engine, text
+from   bulkload       import PipelinedWriter
+
+SQL : str = 'INSERT INTO t (a) VALUES (?)'
+
+class FailingCommit ():
+    """
+        A DBAPI connection whose commit fails, as it does when the disk fills up
+    """
+    def __init__ (self, conn):
+        self.conn = conn
+
+    def __getattr__ (self, name):
+        return getattr(self.conn, name)
+
+    def commit (self):
+        raise sqlite3.OperationalError ('database or disk is full')
+
+class StubEngine ():
+    def __init__ (self, connect):
+        self.connect = connect
+
+    def raw_connection (self):
+        return self.connect()
+
+def closed(writer, timeout : float = 10):
+    """
+        writer.close() on a thread of its own, so a hang fails the test rather than stopping it
+        Returns what close() raised, None if nothing
+    """
+    outcome = {}
+    def run():
+        try:
+            writer.close()
+        except BaseException as e:
+            outcome['error'] = e
+    thread = threading.Thread(target = run, daemon = True)
+    thread.start()
+    thread.join(timeout)
+    assert not thread.is_alive(), 'close() hung'
+    return outcome.get('error')
+
+def test_writes_everything(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path.joinpath('t.sqlite')}", future = True)
+    with engine.begin() as conn:
+        conn.execute(text('CREATE TABLE t (a INTEGER)'))
+    writer = PipelinedWriter(engine, queueBatches = 1)
+    for i in range(10):
+        writer.put(SQL, [(i,), (i,)])
+    assert closed(writer) is None
+    with engine.connect() as conn:
+        assert conn.execute(text('SELECT COUNT(*), SUM(a) FROM t')).fetchone() == (20, 90)
+
+def test_failed_commit_raises(tmp_path):
+    path = tmp_path.joinpath('t.sqlite')
+    sqlite3.connect(path).execute('CREATE TABLE t (a INTEGER)')
+    writer = PipelinedWriter(StubEngine(lambda : FailingCommit(sqlite3.connect(path, check_same_thread = False))))
+    writer.put(SQL, [(1,)])
+    error = closed(writer)
+    assert isinstance(error, sqlite3.OperationalError) and 'disk is full' in str(error)
+
+def test_failed_connect_raises():
+    def connect():
+        raise sqlite3.OperationalError ('unable to open database file')
+    writer = PipelinedWriter(StubEngine(connect), queueBatches = 1)
+    writer.thread.join(10)
+    # the batches put after the failure don't block, the next put or close() raises it
+    with pytest.raises(sqlite3.OperationalError):
+        for i in range(5):
+            writer.put(SQL, [(i,)])
+    assert isinstance(closed(writer), sqlite3.OperationalError)
@@ -0,0 +1,52 @@
+# check.loadedCommit against scratch databases, and check.py's exit status
+
+import sqlite3
+import subprocess
+import sys
+from   datetime       import datetime
+import pytest
+import check
+
+GUID : str = 'c0ffee'
+
+@pytest.mark.parametrize('commit, loaded'
+                        ,[({'commitGUID' : GUID, 'loaded' : datetime.now(), 'rowCount' : 10}, True)
+                         ,({'commitGUID' : GUID, 'loaded' : datetime.now(), 'rowCount' : 0} , True)
+                         ,({'commitGUID' : GUID, 'downloaded' : datetime.now()}              , False) # the load didn't finish
+                         ,({'commitGUID' : GUID, 'loaded' : datetime.now()}                  , False)
+                         ,({'commitGUID' : 'other', 'loaded' : datetime.now(), 'rowCount' : 10}, False)
+                         ,({}                                                                , False)
+                         ])
+def test_loaded_commit(tmp_path, scratchDB, commit, loaded):
+    assert check.loadedCommit(GUID, scratchDB(tmp_path.joinpath('db.sqlite'), **commit)) == loaded
+
+def test_no_database(tmp_path):
+    assert not check.loadedCommit(GUID, tmp_path.joinpath('missing.sqlite'))
+    junk = tmp_path.joinpath('junk.sqlite')
+    junk.write_bytes(b'not a database')
+    assert not check.loadedCommit(GUID, junk)
+    empty = tmp_path.joinpath('empty.sqlite')
+    empty.touch()
+    assert not check.loadedCommit(GUID, empty)
+
+def test_closes_its_connection(tmp_path, scratchDB, monkeypatch):
+    opened  = []
+    connect = sqlite3.connect
+    monkeypatch.setattr(check.sqlite3, 'connect', lambda *args, **kwargs : opened.append(connect(*args, **kwargs)) or opened[-1])
+    check.loadedCommit(GUID, scratchDB(tmp_path.joinpath('db.sqlite'), commitGUID = GUID, loaded = datetime.now(), rowCount = 1))
+    assert len(opened) == 1
+    with pytest.raises(sqlite3.ProgrammingError, match = 'closed'):
+        opened[0].execute('SELECT 1')
+
+def test_exit_status(tmp_path, scratchDB, monkeypatch):
+    monkeypatch.setattr(check, 'getLatestCommit', lambda : f'https://example.com/commits/{GUID}')
+    dbPath = scratchDB(tmp_path.joinpath('db.sqlite'))
+    assert check.main(['--db', str(dbPath)]) == check.NEW_COMMIT
+    dbPath = scratchDB(tmp_path.joinpath('loaded.sqlite'), commitGUID = GUID, loaded = datetime.now(), rowCount = 1)
+    assert check.main(['--db', str(dbPath)]) == check.UP_TO_DATE
+
+def test_doesnt_import_the_load():
+    imported = subprocess.run([sys.executable, '-c', 'import sys, check; print(sorted({"app", "pandas", "sqlalchemy"} & set(sys.modules)))']
+                             ,cwd = check.THIS_FOLDER, capture_output = True, text = True, check = True
+                             ).stdout.strip()
+    assert imported == '[]'
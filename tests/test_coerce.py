@@ -0,0 +1,57 @@
+# coerceNumeric against the per cell converters it replaced (app.py before the vectorized parsing), kept here as the reference
+
+import numpy                           as np
+import pandas                          as pd
+import pytest
+import app
+
+def convertInt(x):
+    try:
+        return abs(int(x))
+    except ValueError:
+        return np.nan
+
+def convertFloat(x):
+    try:
+        return abs(float(x))
+    except ValueError:
+        return float(np.nan)
+
+VALID     : list = ['0', '1', '007', '+5', '12.5', '.5', '5.', ' 7 ', '123456789']
+NEGATIVE  : list = ['-0', '-1', '-12.5', '-inf']
+BLANK     : list = ['', ' ']
+JUNK      : list = ['abc', '1,5', '0x10', '1 2', 'nan', 'inf', 'kg']
+EXPONENT  : list = ['1e3', '-1e3', '1.5e-2', '2E2']
+SAMPLE    : list = VALID + NEGATIVE + BLANK + JUNK + EXPONENT
+
+# where the two knowingly differ : (value, what the converter gives, what coerceNumeric gives) for float & int columns
+# float() & int() take python literal forms the csv never has, and overflow to inf rather than NaN
+KNOWN_FLOAT : list = [('1_000', 1000.0, np.nan), ('٣', 3.0, np.nan), ('1e400', np.inf, np.nan)]
+KNOWN_INT   : list = [('1_000', 1000.0, np.nan), ('٣', 3.0, np.nan)]
+
+def same(a, b):
+    return (pd.isna(a) and pd.isna(b)) or a == b
+
+def coerced(values : list, kind : str):
+    df = pd.DataFrame({'c' : pd.Series(values, dtype = object)})
+    df = app.coerceNumeric(df, floatCols = ['c'] if kind == 'float' else [], intCols = ['c'] if kind == 'int' else [])
+    assert df['c'].dtype == np.float64
+    return list(df['c'])
+
+@pytest.mark.parametrize('kind, converter', [('float', convertFloat), ('int', convertInt)])
+def test_matches_the_converters(kind, converter):
+    for value, got in zip(SAMPLE, coerced(SAMPLE, kind)):
+        assert same(got, converter(value)), value
+
+@pytest.mark.parametrize('kind', ['float', 'int'])
+def test_missing_is_a_blank_cell(kind):
+    # read_csv hands the converters '' for an empty cell, the str typed read gives NaN
+    assert pd.isna(coerced([np.nan], kind)[0])
+    assert pd.isna(convertFloat(''))
+
+@pytest.mark.parametrize('kind, converter, known', [('float', convertFloat, KNOWN_FLOAT), ('int', convertInt, KNOWN_INT)])
+def test_known_differences(kind, converter, known):
+    values = [value for value, expectedConverter, expectedCoerced in known]
+    for (value, expectedConverter, expectedCoerced), got in zip(known, coerced(values, kind)):
+        assert same(converter(value), expectedConverter), value
+        assert same(got, expectedCoerced), value
@@ -0,0 +1,129 @@
+# download_file against a local stand-in for the data host : conditional requests, Range resumes & their failure modes
+
+import hashlib
+import json
+import threading
+import pytest
+import app
+from   http.server    import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+LAST_MODIFIED : str = 'Sat, 01 Oct 2022 00:00:00 GMT'
+
+class StandIn ():
+    """
+        What the server serves, and the (status, request headers) of each request it answered
+    """
+    def __init__ (self, data : bytes):
+        self.serve(data)
+        self.log       = []
+        # answer a Range request with the whole file as a 206, as a misbehaving proxy might
+        self.wholeFile = False
+
+    def serve (self, data : bytes):
+        self.data = data
+        self.etag = '"' + hashlib.md5(data).hexdigest() + '"'
+
+class StandInHandler (BaseHTTPRequestHandler):
+    standIn : StandIn = None
+
+    def do_GET (self):
+        standIn = self.standIn
+        if self.headers.get('If-None-Match') == standIn.etag:
+            return self.reply(304, b'')
+        body, status, extra = (standIn.data, 200, {})
+        ranged = self.headers.get('Range')
+        if ranged and self.headers.get('If-Range') == standIn.etag:
+            start = 0 if standIn.wholeFile else int(ranged.split('=')[1].rstrip('-'))
+            if start >= len(standIn.data):
+                return self.reply(416, b'', {'Content-Range' : f'bytes */{len(standIn.data)}'})
+            body, status, extra = (standIn.data[start:], 206, {'Content-Range' : f'bytes {start}-{len(standIn.data) - 1}/{len(standIn.data)}'})
+        self.reply(status, body, extra)
+
+    def reply (self, status : int, body : bytes, extra : dict = {}):
+        self.standIn.log.append((status, dict(self.headers)))
+        self.send_response(status)
+        self.send_header('ETag', self.standIn.etag)
+        self.send_header('Last-Modified', LAST_MODIFIED)
+        for k, v in extra.items():
+            self.send_header(k, v)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message (self, format, *args):
+        ...
+
+@pytest.fixture
+def server():
+    standIn = StandIn(bytes(range(256)) * 4096)
+    httpd   = ThreadingHTTPServer(('127.0.0.1', 0), type('BoundHandler', (StandInHandler,), {'standIn' : standIn}))
+    threading.Thread(target = httpd.serve_forever, daemon = True).start()
+    standIn.url = f'http://127.0.0.1:{httpd.server_address[1]}/latest.zip'
+    yield standIn
+    httpd.shutdown()
+    httpd.server_close()
+
+def partFiles(target):
+    return (target.with_name(f'{target.name}.part'), target.with_name(f'{target.name}.part.json'))
+
+def writePart(target, data : bytes, etag : str):
+    part, validators = partFiles(target)
+    part.write_bytes(data)
+    validators.write_text(json.dumps({'etag' : etag, 'lastModified' : LAST_MODIFIED}))
+
+def assertDownloaded(got, target, data : bytes):
+    assert got['downloaded']
+    assert target.read_bytes() == data
+    assert got['size'] == len(data)
+    assert got['sha256'] == hashlib.sha256(data).hexdigest()
+    assert not any([p.exists() for p in partFiles(target)])
+
+def test_fresh(server, tmp_path):
+    target = tmp_path.joinpath('latest.zip')
+    got    = app.download_file(server.url, target, chunkSize = 4096)
+    assertDownloaded(got, target, server.data)
+    assert got['etag'] == server.etag and got['lastModified'] == LAST_MODIFIED
+    assert [status for status, headers in server.log] == [200]
+
+def test_not_modified(server, tmp_path):
+    target = tmp_path.joinpath('latest.zip')
+    target.write_bytes(server.data)
+    got    = app.download_file(server.url, target, server.etag, LAST_MODIFIED)
+    assert not got['downloaded']
+    assert got['sha256'] == hashlib.sha256(server.data).hexdigest()
+    assert [status for status, headers in server.log] == [304]
+
+def test_resumed(server, tmp_path):
+    target = tmp_path.joinpath('latest.zip')
+    half   = len(server.data) // 2
+    writePart(target, server.data[:half], server.etag)
+    got    = app.download_file(server.url, target, chunkSize = 4096)
+    assertDownloaded(got, target, server.data)
+    status, headers = server.log[0]
+    assert status == 206 and headers['Range'] == f'bytes={half}-'
+
+def test_changed_since_the_part(server, tmp_path):
+    target = tmp_path.joinpath('latest.zip')
+    writePart(target, server.data[:1000], server.etag)
+    server.serve(server.data[::-1])
+    got    = app.download_file(server.url, target, chunkSize = 4096)
+    assertDownloaded(got, target, server.data)
+    assert [status for status, headers in server.log] == [200]
+
+def test_complete_part_is_discarded(server, tmp_path):
+    # as if the process died between the last write and the rename
+    target = tmp_path.joinpath('latest.zip')
+    writePart(target, server.data, server.etag)
+    got    = app.download_file(server.url, target, chunkSize = 4096)
+    assertDownloaded(got, target, server.data)
+    assert [status for status, headers in server.log] == [416, 200]
+    # and the next run is a plain conditional request
+    assert not app.download_file(server.url, target, got['etag'], got['lastModified'])['downloaded']
+
+def test_content_range_not_following_on(server, tmp_path):
+    target = tmp_path.joinpath('latest.zip')
+    writePart(target, server.data[:1000], server.etag)
+    server.wholeFile = True
+    got    = app.download_file(server.url, target, chunkSize = 4096)
+    assertDownloaded(got, target, server.data)
+    assert [status for status, headers in server.log] == [206, 200]
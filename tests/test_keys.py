@@ -0,0 +1,32 @@
+# Dimension key resolution : every row resolves to its own value's id, a value the dimension hasn't got is an error
+
+import numpy                           as np
+import pandas                          as pd
+import pytest
+import app
+
+@pytest.fixture
+def dimension():
+    return pd.DataFrame({'a'  : ['A', 'A', np.nan, 'B']
+                        ,'b'  : ['Q', np.nan, 'x', 'Q']
+                        ,'id' : [1, 2, 3, 4]
+                        })
+
+def test_missing_values_resolve(dimension):
+    df = pd.DataFrame({'a' : ['B', np.nan, 'A', 'A'], 'b' : ['Q', 'x', np.nan, 'Q']})
+    assert list(app.lookupIds(dimension, df, ['a', 'b'])) == [4, 3, 2, 1]
+
+def test_categoricals_resolve(dimension):
+    df = pd.DataFrame({'a' : pd.Categorical(['A', np.nan]), 'b' : pd.Categorical([np.nan, 'x'])})
+    assert list(app.lookupIds(dimension, df, ['a', 'b'])) == [2, 3]
+
+@pytest.mark.parametrize('a, b', [('A', 'Z'), ('C', np.nan), (np.nan, 'y')])
+def test_unknown_value_raises(dimension, a, b):
+    # ('C', NaN) isn't ('A', NaN), nor is (NaN, 'y') (NaN, 'x')
+    with pytest.raises(Exception, match = 'not in the dimension'):
+        app.lookupIds(dimension, pd.DataFrame({'a' : [a], 'b' : [b]}), ['a', 'b'])
+
+def test_unknown_value_raises_single_column():
+    dimension = pd.DataFrame({'w' : ['93', np.nan], 'id' : [1, 2]})
+    with pytest.raises(Exception, match = 'not in the dimension'):
+        app.lookupIds(dimension, pd.DataFrame({'w' : ['105']}), ['w'])
@@ -0,0 +1,315 @@
+# whole loads of small synthetic zips, each in a process of its own with OPL_DATA_PATH pointing app at a scratch folder
+# (app's paths are fixed when it is imported), as benchmark.py --rows does
+
+import os
+import shutil
+import sqlite3
+import subprocess
+import sys
+import json
+import pandas                          as pd
+import pytest
+import app
+import parallel
+import search
+import synthetic
+from   contextlib     import closing
+from   pathlib        import Path
+from   zipfile        import ZipFile, ZIP_DEFLATED
+
+ROWS : int = 5000
+# small enough that a ROWS zip is read in several chunks (--memory-limit 1) and blocks (--workers)
+TEST_CHUNK_ROWS  : int = 1000
+TEST_BLOCK_BYTES : int = 256 * 1024
+
+def loadChild(commitGUID : str, loadArgs : list):
+    """
+        In the child : app.main as if commitGUID were the latest commit, and the zip already in the data folder had
+        just been downloaded for it
+    """
+    app.getLatestCommit   = lambda : f'{app.OPL_BASE_URL}/commits/{commitGUID}'
+    app.download_file     = lambda url, filename, *args : {'downloaded'   : True
+                                                           ,'size'         : filename.stat().st_size
+                                                           ,'sha256'       : app.fileChecksum(filename)
+                                                           ,'etag'         : None
+                                                           ,'lastModified' : None
+                                                           }
+    app.MIN_CHUNK_ROWS    = TEST_CHUNK_ROWS
+    app.SAMPLE_CHUNK_ROWS = TEST_CHUNK_ROWS
+    app.lineBlocks        = lambda stream : parallel.lineBlocks(stream, TEST_BLOCK_BYTES)
+    app.main(loadArgs)
+
+def load(dataPath : Path, commitGUID : str, *loadArgs):
+    """
+        Loads dataPath's latest.zip into dataPath's database, as commitGUID
+        Returns the database's path
+    """
+    subprocess.run ([sys.executable, __file__, commitGUID, *loadArgs]
+                   ,env   = {**os.environ, 'OPL_DATA_PATH' : str(dataPath), 'PYTHONPATH' : str(app.THIS_FOLDER)}
+                   ,check = True
+                   )
+    return dataPath.joinpath(app.dataDBfilepath.name)
+
+def rowSet(df):
+    """
+        The frame's rows as sorted tuples of strings, to compare a frame and a table whatever their order & types
+    """
+    df = df.astype(object).where(pd.notna(df), None)
+    return sorted([tuple([str(v) for v in row]) for row in df.itertuples(index = False)])
+
+def tableContents(dbPath : Path):
+    """
+        Every table the load fills, in rowid order : the orm's, the rollups, the search tables (not their fts5 shadow
+        tables), ... but not dataCommit, which records when and how it was loaded
+    """
+    with closing(sqlite3.connect(dbPath)) as conn:
+        tables = [row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite%' ORDER BY name")]
+        fts    = [row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE sql LIKE 'CREATE VIRTUAL TABLE%fts5%'")]
+        tables = [t for t in tables if not t == app.dataCommit.__tablename__ and not any([t.startswith(f'{v}_') for v in fts])]
+        return {t : pd.read_sql_query(f'SELECT rowid, * FROM "{t}" ORDER BY rowid', conn) for t in tables}
+
+def assertSameTables(dbPathA : Path, dbPathB : Path):
+    a, b = (tableContents(dbPathA), tableContents(dbPathB))
+    assert list(a) == list(b)
+    for t in a:
+        pd.testing.assert_frame_equal(a[t], b[t], obj = t)
+
+@pytest.fixture(scope = 'module')
+def loads(tmp_path_factory):
+    """
+        loads(*loadArgs) : the database of a load of the same synthetic zip with these arguments, each done once
+        loads.zipPath is the zip
+    """
+    zipPath = synthetic.generate(ROWS, tmp_path_factory.mktemp('zip').joinpath(app.dataFilePath.name))
+    done    = {}
+    def loaded(*loadArgs):
+        if not loadArgs in done:
+            dataPath = tmp_path_factory.mktemp('load')
+            shutil.copyfile(zipPath, dataPath.joinpath(zipPath.name))
+            done[loadArgs] = load(dataPath, 'one', *loadArgs)
+        return done[loadArgs]
+    loaded.zipPath = zipPath
+    return loaded
+
+@pytest.fixture(scope = 'module')
+def loaded(loads):
+    """
+        A full load of the synthetic zip : (its csv, as prepared for the load, and the database)
+    """
+    df = app.prepareFrame(pd.concat(app.readZipChunks(zipPath = loads.zipPath), ignore_index = True))
+    return (df, loads())
+
+def test_results_round_trip(loaded):
+    df, dbPath = loaded
+    with sqlite3.connect(dbPath) as conn:
+        results = pd.read_sql_query(f'SELECT * FROM {app.ResultView.__tablename__}', conn)
+    expected = df[list(results.columns)].copy()
+    expected['Date'] = expected['Date'].dt.strftime('%Y-%m-%d')
+    assert len(results) == ROWS
+    assert rowSet(results) == rowSet(expected)
+
+def test_meets(loaded):
+    df, dbPath = loaded
+    meetColumns = ['Federation', 'ParentFederation', 'Date', 'MeetName', 'MeetCountry', 'MeetState', 'MeetTown']
+    with sqlite3.connect(dbPath) as conn:
+        meets   = conn.execute(f'SELECT COUNT(*), SUM(resultCnt) FROM {app.Meet.__tablename__}').fetchone()
+        counted = conn.execute(f"""SELECT COUNT(*) FROM {app.Meet.__tablename__} m
+                                    WHERE resultCnt <> (SELECT COUNT(*) FROM {app.Result.__tablename__} r WHERE r.meet_id = m.id)""").fetchone()
+        copies  = conn.execute(f"""SELECT COUNT(*) FROM {app.Result.__tablename__} r JOIN {app.Meet.__tablename__} m ON m.id = r.meet_id
+                                    WHERE r.date IS NOT m.date OR r.federation_id <> m.federation_id""").fetchone()
+    # one row per meet, each result in one of them
+    assert meets == (len(df[meetColumns].drop_duplicates()), ROWS)
+    assert counted == (0,)
+    # result's copies of the meet's date & federation
+    assert copies == (0,)
+
+def test_rollups(loaded):
+    df, dbPath = loaded
+    category = ['Sex', 'WeightClass', 'Equipment', 'Federation', 'ParentFederation', 'Event']
+    lifts    = {'squat' : 'Best3Squat', 'bench' : 'Best3Bench', 'deadlift' : 'Best3Deadlift', 'total' : 'Total', 'dots' : 'Dots'}
+    with sqlite3.connect(dbPath) as conn:
+        lifters = pd.read_sql_query(f'SELECT name AS Name, first_date, last_date, resultCnt FROM {app.Lifter.__tablename__} ORDER BY name', conn)
+        bests   = pd.read_sql_query(f"""SELECT l.name AS Name, e.name AS Equipment, b.lift, b.value
+                                          FROM {app.PersonalBest.__tablename__} b
+                                          JOIN {app.Lifter.__tablename__} l ON l.id = b.lifter_id
+                                          JOIN {app.Equipment.__tablename__} e ON e.id = b.equipment_id""", conn)
+        ranks   = pd.read_sql_query(f"""SELECT w.sex AS Sex, w.weight_class AS WeightClass, e.name AS Equipment, f.name AS Federation
+                                              ,p.name AS ParentFederation, v.name AS Event, l.name AS Name
+                                              ,c.best_total, c.best_dots, c.rank_total, c.rank_dots
+                                          FROM {app.CategoryRank.__tablename__} c
+                                          JOIN {app.SexWeight.__tablename__} w ON w.id = c.weightclass_id
+                                          JOIN {app.Equipment.__tablename__} e ON e.id = c.equipment_id
+                                          JOIN {app.Federation.__tablename__} f ON f.id = c.federation_id
+                                          LEFT JOIN {app.Federation.__tablename__} p ON p.id = f.parent_id
+                                          JOIN {app.Event.__tablename__} v ON v.id = c.event_id
+                                          JOIN {app.Lifter.__tablename__} l ON l.id = c.lifter_id""", conn)
+    # lifter : a row per name, with their first & last dates and number of results
+    expected = df.groupby('Name').agg(first_date = ('Date', 'min'), last_date = ('Date', 'max'), resultCnt = ('Date', 'size')).reset_index()
+    for column in ['first_date', 'last_date']:
+        expected[column] = expected[column].dt.strftime('%Y-%m-%d')
+    pd.testing.assert_frame_equal(lifters, expected, check_dtype = False)
+    # personal_best : the best of each lift, per lifter & equipment
+    expected = (df.melt(id_vars = ['Name', 'Equipment'], value_vars = list(lifts.values()), var_name = 'lift', value_name = 'value')
+                  .dropna(subset = ['value'])
+                  .replace({'lift' : {column : lift for lift, column in lifts.items()}})
+                  .groupby(['Name', 'Equipment', 'lift'], as_index = False)['value'].max()
+               )
+    assert rowSet(bests) == rowSet(expected)
+    # category_rank : each lifter's best total & dots in each category, and its RANK() there
+    expected = df.groupby(category + ['Name'], dropna = False).agg(best_total = ('Total', 'max'), best_dots = ('Dots', 'max')).reset_index()
+    for best, rank in [('best_total', 'rank_total'), ('best_dots', 'rank_dots')]:
+        expected[rank] = expected.groupby(category, dropna = False)[best].rank(method = 'min', ascending = False)
+    key      = category + ['Name']
+    pd.testing.assert_frame_equal(ranks.sort_values(key, ignore_index = True)
+                                 ,expected[list(ranks.columns)].sort_values(key, ignore_index = True)
+                                 ,check_dtype = False
+                                 )
+
+def test_rollups_rank_ties(loaded, tmp_path):
+    df, dbPath = loaded
+    dbPath   = Path(shutil.copyfile(dbPath, tmp_path.joinpath(dbPath.name)))
+    category = ', '.join(app.RANK_CATEGORY)
+    # a category's 3rd best total raised to its 2nd : RANK() gives both 2nd, and whoever was 4th stays 4th
+    with closing(sqlite3.connect(dbPath)) as conn:
+        ranked = conn.execute(f"""SELECT {category}, lifter_id, best_total, rank_total FROM {app.CategoryRank.__tablename__}
+                                   WHERE ({category}) IN (SELECT {category} FROM {app.CategoryRank.__tablename__}
+                                                           WHERE best_total IS NOT NULL GROUP BY {category} HAVING COUNT(*) >= 4 LIMIT 1)
+                                     AND best_total IS NOT NULL
+                                   ORDER BY rank_total""").fetchall()
+        assert [row[-1] for row in ranked[:4]] == [1, 2, 3, 4]
+        *key, lifterID, best, rank = ranked[2]
+        conn.execute(f"""UPDATE {app.Result.__tablename__} SET total = ?
+                          WHERE ({category}) = ({', '.join('?' * len(key))}) AND total = ?
+                            AND name = (SELECT name FROM {app.Lifter.__tablename__} WHERE id = ?)"""
+                    ,[ranked[1][-2], *key, best, lifterID]
+                    )
+        conn.commit()
+    db = app.DB(f'sqlite:///{dbPath}')
+    app.buildRollups(db)
+    db.dispose()
+    with closing(sqlite3.connect(dbPath)) as conn:
+        ranks = conn.execute(f"""SELECT rank_total FROM {app.CategoryRank.__tablename__}
+                                  WHERE ({category}) = ({', '.join('?' * len(key))}) AND best_total IS NOT NULL
+                                  ORDER BY rank_total LIMIT 4""", key).fetchall()
+    assert ranks == [(1,), (2,), (2,), (4,)]
+
+def nextCommit(zipPath : Path):
+    """
+        Rewrites the zip as the next commit might : a meet gone, a result of another corrected and a new meet, of a
+        new federation, with new lifters
+        Returns the rows of the previous commit's meets which changed or went
+    """
+    with ZipFile(zipPath) as archive:
+        df = pd.read_csv(archive.open(app.csvMemberName(archive)), dtype = str, keep_default_na = False)
+    meets   = list(df.groupby(['Federation', 'Date', 'MeetName'], sort = False).groups.values())
+    gone, corrected, copied = (meets[0], meets[1], meets[2])
+    df.loc[corrected[0], 'TotalKg'] = '1234.5'
+    added = df.loc[copied].assign(Federation = 'NEWFED', ParentFederation = '', MeetName = 'A New Meet', Name = lambda d : d['Name'] + ' Jr')
+    df = pd.concat([df.drop(gone), added], ignore_index = True)
+    with (ZipFile(zipPath, mode = 'w', compression = ZIP_DEFLATED) as archive
+         ,archive.open(synthetic.CSV_MEMBER_NAME, mode = 'w') as stream
+         ):
+        stream.write(df.to_csv(index = False).encode())
+    return len(gone) + len(corrected)
+
+def loadReport(dbPath : Path, commitGUID : str):
+    with sqlite3.connect(dbPath) as conn:
+        return json.loads(conn.execute('SELECT loadReport FROM dataCommit WHERE commitGUID = ?', [commitGUID]).fetchone()[0])
+
+@pytest.mark.parametrize('mode', [[], ['--memory-limit', '1']], ids = ['in memory', 'chunked'])
+def test_incremental_matches_full(tmp_path, mode):
+    incrementalPath = tmp_path.joinpath('incremental')
+    zipPath  = synthetic.generate(ROWS, incrementalPath.joinpath(app.dataFilePath.name), seed = 1)
+    load(incrementalPath, 'one')
+    changed  = nextCommit(zipPath)
+    # --check-incremental fails the load if it doesn't match a full load of its own
+    incremental = load(incrementalPath, 'two', '--incremental', '--check-incremental', *mode)
+
+    fullPath = tmp_path.joinpath('full')
+    fullPath.mkdir()
+    fullPath.joinpath(app.dataFilePath.name).write_bytes(zipPath.read_bytes())
+    full     = load(fullPath, 'two')
+
+    assert app.snapshotDifferences(incremental, full) == []
+    report = loadReport(incremental, 'two')
+    assert report['mode'] == 'incremental'
+    # a key resolution per chunk and pass when chunked, one of the whole csv otherwise
+    assert (report['stages']['key resolution']['calls'] > 1) == bool(mode)
+    # only the meets which changed or went are redone
+    assert report['stages']['delete']['rows'] == changed
+    with sqlite3.connect(incremental) as conn:
+        assert conn.execute(f"SELECT resultCnt FROM {app.Federation.__tablename__} WHERE name = 'NEWFED'").fetchone()[0] > 0
+
+@pytest.mark.parametrize('mode', [[], ['--memory-limit', '1'], ['--workers', '2']], ids = ['in memory', 'chunked', 'parallel'])
+def test_compact_loads_the_same(loads, mode):
+    # each of the three compacts its own frames
+    assertSameTables(loads(*mode), loads(*mode, '--compact'))
+
+@pytest.mark.parametrize('workers', ['2', '3'])
+def test_workers_load_the_same(loads, workers):
+    # the dimension ids included, whatever the number of workers
+    assertSameTables(loads(), loads('--workers', workers))
+
+def test_duckdb_backend(loads):
+    duckdb = pytest.importorskip('duckdb')
+    tables = [table.__table__.name for table, colMappings, idName in app.DIMENSION_TABLES.values()] + [app.Result.__tablename__]
+    with (closing(sqlite3.connect(loads())) as conn
+         ,closing(duckdb.connect(str(loads('--backend', 'duckdb').with_name(app.duckDBfilepath.name)), read_only = True)) as duck
+         ):
+        for t in tables:
+            assert duck.execute(f'SELECT COUNT(*) FROM "{t}"').fetchone() == conn.execute(f'SELECT COUNT(*) FROM "{t}"').fetchone(), t
+        # the lifters with the most results, and so most meets, dimension values, ...
+        sample  = f'SELECT * FROM {app.ResultView.__tablename__} WHERE Name IN (SELECT name FROM {app.Result.__tablename__} GROUP BY name ORDER BY COUNT(*) DESC, name LIMIT 50)'
+        results = pd.read_sql_query(sample, conn)
+        assert len(results) > 50
+        # fetchall, as .df() has the dates as timestamps
+        assert rowSet(pd.DataFrame(duck.execute(sample).fetchall())) == rowSet(results)
+
+def test_search(loaded):
+    df, dbPath = loaded
+    with closing(search.connect(dbPath)) as conn:
+        found = search.searchLifters(conn, df['Name'].iloc[0][1:-1], limit = 5)
+        assert found and all([row['resultCnt'] == (df['Name'] == row['name']).sum() for row in found])
+        for meet in search.searchMeets(conn, df['MeetName'].iloc[-1], limit = 5):
+            results = pd.DataFrame(search.meetResults(conn, meet))
+            assert len(results) == conn.execute(f'SELECT resultCnt FROM {app.Meet.__tablename__} WHERE id = ?', [meet['id']]).fetchone()[0]
+            assert set(results['MeetName']) == {meet['meet_name']} and set(results['Date']) == {meet['date']}
+
+def test_extract_uses_the_parsed_cache(loads):
+    pytest.importorskip('dask')
+    pytest.importorskip('pyarrow')
+    dbPath = loads('--extract')
+    assertSameTables(loads(), dbPath)
+    assert len(list(dbPath.parent.joinpath(app.CACHE_PATH.name).glob('*.parquet'))) == 1
+    stages = loadReport(load(dbPath.parent, 'one', '--extract', '--force'), 'one')['stages']
+    assert 'cache read' in stages and not 'unzip' in stages
+
+def loadedAt(dbPath : Path, commitGUID : str = 'one'):
+    """
+        When dataCommit says commitGUID was loaded, and the database file it is in
+    """
+    with closing(sqlite3.connect(dbPath)) as conn:
+        loaded = conn.execute('SELECT loaded FROM dataCommit WHERE commitGUID = ?', [commitGUID]).fetchone()[0]
+    return (loaded, dbPath.stat().st_ino)
+
+@pytest.fixture
+def loadedOnce(loads, tmp_path):
+    shutil.copyfile(loads.zipPath, tmp_path.joinpath(loads.zipPath.name))
+    return load(tmp_path, 'one')
+
+def test_loaded_commit_is_skipped(loadedOnce):
+    before = loadedAt(loadedOnce)
+    assert before[0] is not None
+    load(loadedOnce.parent, 'one')
+    assert loadedAt(loadedOnce) == before
+
+def test_force_reloads(loads, loadedOnce):
+    before = loadedAt(loadedOnce)
+    load(loadedOnce.parent, 'one', '--force')
+    after  = loadedAt(loadedOnce)
+    # a new load, swapped in as a new file
+    assert after[0] > before[0] and not after[1] == before[1]
+    assertSameTables(loads(), loadedOnce)
+
+if __name__ == "__main__":
+    loadChild(sys.argv[1], sys.argv[2:])
@@ -0,0 +1,65 @@
+# readapi's ResultCache : eviction by rows, invalidation on a new commit, and no stale results put back after one
+
+import os
+from   datetime       import datetime
+import pytest
+import readapi
+from   readapi        import ResultCache, ReadService, percentiles
+
+def test_evicts_least_recently_used():
+    cache = ResultCache(maxRows = 5)
+    cache.put('a', [1, 2])
+    cache.put('b', [1, 2])
+    cache.get('a')
+    cache.put('c', [1, 2])
+    assert cache.get('b') is None
+    assert cache.get('a') == [1, 2] and cache.get('c') == [1, 2]
+    assert cache.rows == 4
+
+def test_too_big_or_no_cache():
+    cache = ResultCache(maxRows = 2)
+    cache.put('a', [1, 2, 3])
+    assert cache.get('a') is None and cache.rows == 0
+    cache = ResultCache(maxRows = 0)
+    cache.put('a', [1])
+    assert cache.get('a') is None
+
+def test_invalidate():
+    cache = ResultCache()
+    assert cache.invalidate('one')
+    cache.put('a', [1])
+    assert not cache.invalidate('one')
+    assert cache.get('a') == [1]
+    assert cache.invalidate('two')
+    assert cache.get('a') is None
+    assert cache.stats()['invalidations'] == 1 and cache.rows == 0
+
+def test_stale_put_is_dropped():
+    cache = ResultCache()
+    cache.invalidate('one')
+    generation = cache.generation
+    cache.invalidate('two')
+    cache.put('a', [1], generation)
+    assert cache.get('a') is None
+    cache.put('a', [2], cache.generation)
+    assert cache.get('a') == [2]
+
+def test_query_across_a_new_load(tmp_path, scratchDB, monkeypatch):
+    dbPath = tmp_path.joinpath('openpowerlifting.sqlite')
+    scratchDB(dbPath, commitGUID = 'one', loaded = datetime.now())
+    service = ReadService(dbPath, commitCheck = 0)
+    def swapInALoad(conn, name):
+        # the next load goes live while this query is reading the old file
+        scratchDB(tmp_path.joinpath('building'), commitGUID = 'two', loaded = datetime.now())
+        os.replace(tmp_path.joinpath('building'), dbPath)
+        service.checkCommit(force = True)
+        return [name]
+    monkeypatch.setitem(readapi.QUERIES, 'bests', (swapInALoad, ['name']))
+    assert service.query('bests', name = 'x') == (['x'], False)
+    assert service.cache.commitGUID == 'two'
+    assert service.cache.stats()['entries'] == 0
+    service.close()
+
+def test_percentiles():
+    assert percentiles(list(range(1, 101))) == {'p50' : 50, 'p90' : 90, 'p99' : 99}
+    assert percentiles([]) == {'p50' : None, 'p90' : None, 'p99' : None}